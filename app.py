@@ -1,68 +1,101 @@
-from flask import Flask, jsonify, request, session
-from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import ExitStack
+from datetime import datetime
+from itertools import islice
+
+from flask import Flask, Response, jsonify, request, session
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from models import (connect_to_db)
+from models import (db_connection, get_inventory_cache, get_user_cache, pool_stats)
+from auth import current_user, login_required, remember_user
+from stock_movements import apply_movements, parse_ndjson
+from stock_group_commit import QueueFull, get_writer
+from inventory_listing import ListingError, build_listing_query, encode_cursor
+from catalog_import import CatalogImportError, import_catalog
+from exports import ExportError, build_copy_sql, export_filters, stream_copy
+from inventory_snapshots import stock_as_of
+from movement_rollups import ReportError, build_movement_report
+from password_hashing import HashingBusy, hash_password, verify_password
+from product_search import (DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, SearchError, build_search_query, check_limit,
+                            search_statement)
 from config import Config
+from slow_queries import slow_query_log
+from instrumentation import CONTENT_TYPE, configure_logging, instrument_app, render_metrics, sampled_logger
+from json_provider import provider_class
+from migrations import migrate
 from dotenv import load_dotenv
 
 load_dotenv('capstone.env')
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = provider_class(Config.JSON_PROVIDER)(app)
 app.app_context()
+configure_logging()
+instrument_app(app)
+log = sampled_logger(__name__)
 
+if Config.MIGRATE_ON_STARTUP:
+    migrate()
 
-@app.route("/register-user", methods=['POST'])
-def register_user():
-    conn = connect_to_db()
-    if not conn:
-        return jsonify({"Error": "Unable to connect to database"}), 404
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
 
-        data = request.get_json()
+def hashing_busy_response():
+    response = jsonify({"message": "Too many sign-ins in progress, try again shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
-        required_fields = ['username', 'account_name', 'password', 'role', 'email']
-        missing_fields = [field for field in required_fields if field not in data]
 
-        if missing_fields:
-            return jsonify({"error": f"missing the following required fields: {', '.join(missing_fields)}"}), 400
-
-        username = data['username']
-        account_name = data['account_name']
-        password = generate_password_hash(data['password'])
-        role = data['role']
-        email = data['email']
-
-        if not all([isinstance(username, str), isinstance(account_name, str), isinstance(password, str), isinstance(role, str),
-                    isinstance(email, str)]):
-            return jsonify({"message": "Check input data types and format"})
-
-            # Check if the user already exists
-        cursor.execute("""
-           SELECT user_name, account_name FROM users 
-           WHERE user_name = %s AND account_name = %s
-           """, (username, account_name))
+@app.route("/register-user", methods=['POST'])
+def register_user():
+    # a body that is not a JSON object is reported as missing every field
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
 
-        user = cursor.fetchone()
+    required_fields = ['username', 'account_name', 'password', 'role', 'email']
+    missing_fields = [field for field in required_fields if field not in data]
 
-        if user:
-            return jsonify({"message": "This user already exists. Log in to your account"}), 409
+    if missing_fields:
+        return jsonify({"error": f"missing the following required fields: {', '.join(missing_fields)}"}), 400
 
-        # Insert the new user into the database
-        cursor.execute("""
-           INSERT INTO users(user_name, account_name, password, role, email) 
-           VALUES(%s, %s, %s, %s, %s)
-           """, (username, account_name, password, role, email))
+    username = data['username']
+    account_name = data['account_name']
+    role = data['role']
+    email = data['email']
 
-        conn.commit()
+    if not all([isinstance(username, str), isinstance(account_name, str), isinstance(data['password'], str),
+                isinstance(role, str), isinstance(email, str)]):
+        return jsonify({"message": "Check input data types and format"})
 
-    except Exception as e:
-        return jsonify({"message": f"Unable to register user due to: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    # hashed in the password worker pool before a database connection is taken
+    try:
+        password = hash_password(data['password'])
+    except HashingBusy:
+        return hashing_busy_response()
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"Error": "Unable to connect to database"}), 404
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            # Insert the new user unless one with this user and account name exists (uq_users_name_account)
+            cursor.execute("""
+               INSERT INTO users(user_name, account_name, password, role, email)
+               VALUES(%s, %s, %s, %s, %s)
+               ON CONFLICT (user_name, account_name) DO NOTHING
+               RETURNING user_id
+               """, (username, account_name, password, role, email))
+
+            user = cursor.fetchone()
+            conn.commit()
+
+            if not user:
+                return jsonify({"message": "This user already exists. Log in to your account"}), 409
+
+        except Exception as e:
+            return jsonify({"message": f"Unable to register user due to: {str(e)}"}), 500
+        finally:
+            cursor.close()
 
     return jsonify({"message": f"{username} successfully registered"}), 201
 
@@ -71,35 +104,61 @@ def register_user():
 @app.route("/log-in", methods=['POST'])
 def log_in():
 
-    conn = connect_to_db()
-    if not conn:
-        return jsonify({"message": "Unable to connect to database"})
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-
-        # retrieving data from request
-        data = request.get_json()
-
-        user_name = data['user_name']
-        password = data['password']
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"message": "Unable to connect to database"})
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
 
-        cursor.execute("SELECT user_name, password from users where user_name = %s", (user_name,))
+            # retrieving data from request
+            data = request.get_json()
 
-        db_results = cursor.fetchone()
-        print(db_results)
+            user_name = data['user_name']
+            password = data['password']
 
-        cursor.close()
+            # taken before the read, so a role changed while the password is checked is not cached
+            generation = get_user_cache().generation
+            cursor.execute("SELECT user_id, user_name, role, password from users where user_name = %s", (user_name,))
 
-        conn.close()
+            db_results = cursor.fetchone()
+        except Exception as e:
+            return jsonify({"message": f"an error occurred str{str(e)}"})
+        finally:
+            cursor.close()
 
-        if db_results and check_password_hash(db_results['password'], password):
-            session['username'] = user_name
-            session.permanent = True
-            return jsonify({"message": f"{user_name} Logged in successfully"}), 200
-        else:
+    # the connection is back in the pool while the password worker checks the hash
+    try:
+        if not db_results:
             return jsonify({"message": "Log in unsuccessful. Check username or password"}), 400
+        matches, new_hash = verify_password(db_results['password'], password)
+    except HashingBusy:
+        return hashing_busy_response()
     except Exception as e:
         return jsonify({"message": f"an error occurred str{str(e)}"})  # calling the log in function to enable user log in.
+    if not matches:
+        return jsonify({"message": "Log in unsuccessful. Check username or password"}), 400
+
+    if new_hash:
+        # stored with an older method or cost; replaced unless the password changed meanwhile
+        with db_connection() as conn:
+            if conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("UPDATE users SET password = %s WHERE user_id = %s AND password = %s",
+                                   (new_hash, db_results['user_id'], db_results['password']))
+                    conn.commit()
+                except psycopg2.Error as e:
+                    log.warning("Unable to upgrade password hash of user %s: %s", db_results['user_id'], e)
+                finally:
+                    cursor.close()
+
+    session['username'] = user_name
+    session['user_id'] = db_results['user_id']
+    session.permanent = True
+    if not new_hash:
+        # the row is as just read, so the next write needs no lookup; a rehash evicts it anyway
+        remember_user({column: db_results[column] for column in ('user_id', 'user_name', 'role')}, generation)
+    return jsonify({"message": f"{user_name} Logged in successfully"}), 200
 
 
 @app.route("/logout", methods=['POST'])
@@ -109,201 +168,521 @@ def log_out():
 
 
 @app.route("/create-product", methods=['POST'])
+@login_required(Config.PRODUCT_ADMIN_ROLES)
 def add_product_to_product_list():
 
-    conn = connect_to_db()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        data = request.get_json()
-        product_name = data['product_name']
-        packaging = data['packaging']
-        supplier = data['supplier']
-
-        required_field = ['product_name', 'packaging', 'supplier']
-        missing_fields = [field for field in required_field if field not in data]
-        if missing_fields:
-            return jsonify({"error": f"missing the following required fields: {', '.join(missing_fields)}"}), 400
-
-        if not all([isinstance(product_name, str), isinstance(packaging, str), isinstance(supplier, str)]):
-            return jsonify({"message": "Check input data types and format"})
-
-        #  Check if the product exists
-        cursor.execute("""
-           SELECT product_name, packaging, supplier FROM products WHERE product_name = %s AND packaging = %s AND supplier = %s""",
-                       (product_name, packaging, supplier))
-
-        product = cursor.fetchone()
-
-        if product:
-            return jsonify({"message": f"Product with name {product_name}, packaging {packaging}, and supplier {supplier} already exists."}), 400
-
-        # Insert the product if it doesn't exist
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"message": "Unable to connect to database"}), 500
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            data = request.get_json()
+            product_name = data['product_name']
+            packaging = data['packaging']
+            supplier = data['supplier']
+
+            required_field = ['product_name', 'packaging', 'supplier']
+            missing_fields = [field for field in required_field if field not in data]
+            if missing_fields:
+                return jsonify({"error": f"missing the following required fields: {', '.join(missing_fields)}"}), 400
+
+            if not all([isinstance(product_name, str), isinstance(packaging, str), isinstance(supplier, str)]):
+                return jsonify({"message": "Check input data types and format"})
+
+            # Insert the product if it doesn't exist (uq_products_name_packaging_supplier)
+            cursor.execute("""
+            INSERT INTO products(product_name, packaging, supplier) VALUES(%s,%s,%s)
+            ON CONFLICT (product_name, packaging, supplier) DO NOTHING
+            RETURNING product_id
+            """, (product_name, packaging, supplier))
+
+            product = cursor.fetchone()
+            conn.commit()
+
+            if not product:
+                return jsonify({"message": f"Product with name {product_name}, packaging {packaging}, and supplier {supplier} already exists."}), 400
 
-        cursor.execute("""
-        INSERT INTO products(product_name, packaging, supplier) VALUES(%s,%s,%s)
-        """, (product_name, packaging, supplier))
-
-        conn.commit()
-
-        if cursor.rowcount > 0:
             return jsonify({"message": f"{product_name} added successfully"}), 201
-        else:
-            return jsonify({"message": "Unable to add product"}), 400
-    except Exception as e:
-        return jsonify({"message": f"Unable to complete request due to :{str(e)}"}), 500
+        except Exception as e:
+            return jsonify({"message": f"Unable to complete request due to :{str(e)}"}), 500
 
-    finally:
-        cursor.close()
-        conn.close()  # log product to product list before it can be added to the inventory
+        finally:
+            cursor.close()  # log product to product list before it can be added to the inventory
 
 
 @app.route("/add-product", methods=['POST'])
+@login_required(Config.PRODUCT_ADMIN_ROLES)
 def add_product_to_inventory():
-    conn = connect_to_db()
-
-    if not conn:
-        return jsonify({"message": "could connect to database."}), 500
-
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    # retrieving data from body
-    req_fields = ['product_name', 'packaging', 'category', 'unit_price', 'quantity', 'supplier']
-    data = request.get_json()
-
-    missing_fields = [field for field in req_fields if field not in data]
-
-    if missing_fields:
-        return jsonify({"error": f"missing the following required fields {', '.join(missing_fields)}"})
-
-    product_name = data['product_name']
-    packaging = data['packaging']
-    category = data['category']
-    unit_price = data['unit_price']
-    quantity = data['quantity']
-    minimum_balance = data['minimum_balance']
-    supplier = data['supplier']
-
-    if not all([isinstance(product_name, str), isinstance(packaging, str), isinstance(category, str), isinstance(unit_price, float, ),
-                isinstance(quantity, int), isinstance(minimum_balance, int), isinstance(supplier, str)]):
-        return jsonify({"message": "Check input data types and format"})
-
-    try:
-        # Look up product_id based on product_name
+    with db_connection() as conn:
 
-        cursor.execute("SELECT product_id, packaging FROM products WHERE product_name = %s and packaging = %s", (product_name, packaging))
-        product = cursor.fetchone()
+        if not conn:
+            return jsonify({"message": "could connect to database."}), 500
 
-        if not product:
-            return jsonify({"message": f"Product with name {product_name} does not exist."}), 404
-
-        product_id = product['product_id']
-        packaging = product['packaging']
-        # executing the insert statement
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        # retrieving data from body
+        req_fields = ['product_name', 'packaging', 'category', 'unit_price', 'quantity', 'supplier']
+        data = request.get_json()
 
-        cursor.execute("INSERT INTO Inventory(product_id, product_name, packaging, category, unit_price, quantity_available,minimum_balance,"
-                       "supplier)VALUES(%s,"
-                       "%s,"
-                       "%s,%s,%s,%s,%s,%s)",
-                       (product_id, product_name, packaging, category, unit_price, quantity, minimum_balance, supplier))
+        missing_fields = [field for field in req_fields if field not in data]
 
-        if cursor.rowcount == 0:
-            return jsonify({"message": f"unable to add {product_name}"})
+        if missing_fields:
+            cursor.close()
+            return jsonify({"error": f"missing the following required fields {', '.join(missing_fields)}"})
 
-        conn.commit()
+        product_name = data['product_name']
+        packaging = data['packaging']
+        category = data['category']
+        unit_price = data['unit_price']
+        quantity = data['quantity']
+        minimum_balance = data['minimum_balance']
+        supplier = data['supplier']
 
-        return jsonify({"message": "product added successfully"}), 201
+        if not all([isinstance(product_name, str), isinstance(packaging, str), isinstance(category, str), isinstance(unit_price, float, ),
+                    isinstance(quantity, int), isinstance(minimum_balance, int), isinstance(supplier, str)]):
+            cursor.close()
+            return jsonify({"message": "Check input data types and format"})
 
-    except Exception as e:
-        return jsonify({"message": f"error: {str(e)}"})
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            # Look up product_id based on product_name and packaging (preferring the same supplier) and
+            # insert it into the inventory in one statement. No row back means the product does not
+            # exist, inserted false that it is already in the inventory.
+            cursor.execute("""
+            WITH product AS (
+                SELECT product_id, packaging FROM products
+                WHERE product_name = %(product_name)s AND packaging = %(packaging)s
+                ORDER BY supplier = %(supplier)s DESC, product_id
+                LIMIT 1
+            ), inserted AS (
+                INSERT INTO inventory(product_id, product_name, packaging, category, unit_price, quantity_available,
+                                      minimum_balance, supplier)
+                SELECT product_id, %(product_name)s, packaging, %(category)s, %(unit_price)s, %(quantity)s,
+                       %(minimum_balance)s, %(supplier)s
+                FROM product
+                ON CONFLICT (product_id) DO NOTHING
+                RETURNING product_id
+            )
+            SELECT product.product_id, inserted.product_id IS NOT NULL AS inserted
+            FROM product LEFT JOIN inserted USING (product_id)
+            """, {'product_name': product_name, 'packaging': packaging, 'category': category, 'unit_price': unit_price,
+                  'quantity': quantity, 'minimum_balance': minimum_balance, 'supplier': supplier})
+            product = cursor.fetchone()
+
+            if not product:
+                return jsonify({"message": f"Product with name {product_name} does not exist."}), 404
+
+            if not product['inserted']:
+                return jsonify({"message": f"{product_name} is already in the inventory"}), 409
+
+            conn.commit()
+
+            return jsonify({"message": "product added successfully"}), 201
+
+        except Exception as e:
+            return jsonify({"message": f"error: {str(e)}"})
+        finally:
+            cursor.close()
+
+
+INVENTORY_COLUMNS = ['product_id', 'product_name', 'packaging', 'category', 'unit_price', 'quantity_available',
+                     'minimum_balance', 'supplier', 'updated_at']
+
+
+def stream_inventory(stack, conn, output_format):
+    # Reads inventory through a server-side cursor, so only one itersize batch of rows is held
+    # in memory, and sends each batch as one chunk of a JSON array or NDJSON body.
+    with stack:
+        cursor = conn.cursor(name='get_all_records')
+        cursor.itersize = app.config['RECORDS_STREAM_ITERSIZE']
+        try:
+            cursor.execute(f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory")
+            separator = ',' if output_format == 'json' else '\n'
+            if output_format == 'json':
+                yield '['
+            first = True
+            while True:
+                rows = cursor.fetchmany(cursor.itersize)
+                if not rows:
+                    break
+                if output_format == 'json':
+                    chunk = app.json.encode_array(INVENTORY_COLUMNS, rows)[1:-1]
+                else:
+                    chunk = separator.join(app.json.encode_rows(INVENTORY_COLUMNS, rows))
+                yield ('' if first else separator) + chunk
+                first = False
+            if output_format == 'json':
+                yield ']'
+            elif not first:
+                yield '\n'
+        except Exception as e:
+            # the status line has already been sent, so the body is cut short
+            log.error("Error while streaming records: %s", e)
+        finally:
+            cursor.close()
 
 
 @app.route("/get-all-records", methods=['GET'])
 def get_all_records():
-    conn = connect_to_db()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    # ?stream=json or ?stream=ndjson streams the records instead of building the whole list
+    output_format = request.args.get('stream')
+    if output_format:
+        if output_format not in ('json', 'ndjson'):
+            return jsonify({"error": "stream must be 'json' or 'ndjson'"}), 400
+        stack = ExitStack()
+        conn = stack.enter_context(db_connection())
+        if not conn:
+            stack.close()
+            return jsonify({"error": "Unable to connect to database"}), 500
+        mimetype = 'application/json' if output_format == 'json' else 'application/x-ndjson'
+        response = Response(stream_inventory(stack, conn, output_format), mimetype=mimetype)
+        # returns the connection even if the body is never iterated
+        response.call_on_close(stack.close)
+        return response
+
+    cache = get_inventory_cache()
+    if cache:
+        records = cache.all_rows()
+        if records is not None:
+            if not records:
+                return jsonify({"message": "No data available"}), 204
+            return jsonify(records), 200
+        generation = cache.generation
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory")
+
+            data = cursor.fetchall()
+            if not data:
+                return jsonify({"message": "No data available"}), 204
+
+            if cache:
+                cache.put([dict(zip(INVENTORY_COLUMNS, row)) for row in data], generation, complete=True)
+            # encoded straight from the row tuples, see json_provider.py
+            body = app.json.encode_array(INVENTORY_COLUMNS, data) + '\n'
+            return Response(body, mimetype=app.json.mimetype), 200
+
+        except Exception as e:
+            log.error("Unable to read inventory records: %s", e)
+            return jsonify({"error": str(e)}), 500
+
+        finally:
+            cursor.close()  # calling the get_all_records
+
+
+@app.route("/import/catalog", methods=['POST'])
+@login_required(Config.PRODUCT_ADMIN_ROLES)
+def import_product_catalog():
+    # Body is the raw file (Content-Type text/csv or application/x-ndjson) or a multipart upload in
+    # the field "file". CSV needs a header row naming its columns.
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        is_ndjson = upload.filename.endswith(('.ndjson', '.jsonl')) or upload.mimetype == 'application/x-ndjson'
+    else:
+        stream = request.stream
+        is_ndjson = request.mimetype == 'application/x-ndjson'
+    file_format = request.args.get('format', 'ndjson' if is_ndjson else 'csv')
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        try:
+            report = import_catalog(conn, stream, file_format)
+        except CatalogImportError as e:
+            return jsonify({"error": str(e)}), 400
+        except psycopg2.Error as e:
+            return jsonify({"error": f"Unable to import catalog due to {str(e)}"}), 400
+
+    return jsonify(report), 200
+
+
+@app.route("/export/<table>", methods=['GET'])
+def export_table(table):
+    # /export/inventory and /export/transactions stream CSV straight from COPY ... TO STDOUT.
+    # Filters: product_id=1,2,3, start/end (transaction_date, transactions only), category (inventory
+    # only). compress=gzip returns a .csv.gz file.
+    compress = request.args.get('compress') == 'gzip'
+    stack = ExitStack()
+    conn = stack.enter_context(db_connection())
+    if not conn:
+        stack.close()
+        return jsonify({"error": "Unable to connect to database"}), 500
     try:
-        cursor.execute("SELECT * FROM inventory")
-
-        data = cursor.fetchall()
-        print(data)
-        if not data:
-            return jsonify({"message": "No data available"}), 204
-
-        records = []
-
-        for row in data:
-            record = {
-                "product_id": row['product_id'],
-                "product_name": row['product_name'],
-                "packaging": row['packaging'],
-                "category": row['category'],
-                "unit_price": row['unit_price'],
-                "quantity_available": row['quantity_available'],
-                "minimum_balance": row['minimum_balance'],
-                "supplier": row['supplier'],
-                "updated_at": row['updated_at']
-            }
-            records.append(record)
-            print(records)
-
-        return jsonify(records), 200
-
-    except Exception as e:
-        print(f"Error:{e}")
-        return jsonify({"error": str(e)}), 500
-
-    finally:
-        cursor.close()
-        conn.close()  # calling the get_all_records
+        with conn.cursor() as cursor:
+            copy_sql = build_copy_sql(cursor, table, **export_filters(request.args))
+    except ExportError as e:
+        stack.close()
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        with stack:
+            yield from stream_copy(conn, copy_sql, compress=compress)
+
+    filename = f"{table}.csv.gz" if compress else f"{table}.csv"
+    response = Response(generate(), mimetype='application/gzip' if compress else 'text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # returns the connection even if the body is never iterated
+    response.call_on_close(stack.close)
+    return response
+
+
+@app.route("/inventory", methods=['GET'])
+def list_inventory():
+    # One page of inventory. Filters: category, supplier, packaging, min_quantity, max_quantity,
+    # low_stock. Sorting: sort=product_id|updated_at, order=asc|desc. Pass next_cursor from the
+    # previous response as ?cursor= to get the following page.
+    try:
+        sql, params, sort, order, limit = build_listing_query(request.args)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, order, rows[-1])
+
+    return jsonify({"items": rows, "next_cursor": next_cursor}), 200
+
+
+def cached_inventory_lookup(cache, product_id=None, name=None):
+    # Point lookup by product_id or exact name through the inventory cache. Returns the rows, or None
+    # if the database could not be reached. Misses read the full rows so they can be cached.
+    rows = cache.get(product_id) if product_id is not None else cache.find_by_name(name)
+    if rows is not None:
+        return [rows] if product_id is not None else rows
+
+    generation = cache.generation
+    with db_connection() as conn:
+        if not conn:
+            return None
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            if product_id is not None:
+                cursor.execute(f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory WHERE product_id = %s",
+                               (product_id,))
+            else:
+                cursor.execute(*search_statement(name, mode='exact', limit=MAX_SEARCH_LIMIT,
+                                                 columns=', '.join(INVENTORY_COLUMNS)))
+            rows = [dict(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    # a name with MAX_SEARCH_LIMIT rows may have more than were read, so it is not marked complete
+    cache.put(rows, generation, name=name if len(rows) < MAX_SEARCH_LIMIT else None)
+    return rows
+
+
+@app.route("/low-stock", methods=['GET'])
+def get_low_stock():
+    # items at or below their minimum_balance, read through the partial index idx_inventory_low_stock
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(f"""
+            SELECT {', '.join(INVENTORY_COLUMNS)}, minimum_balance - quantity_available AS shortfall
+            FROM inventory
+            WHERE quantity_available <= minimum_balance
+            ORDER BY product_id
+            """)
+            data = cursor.fetchall()
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+
+    return jsonify(data), 200
+
+
+@app.route("/inventory/as-of", methods=['GET'])
+def get_inventory_as_of():
+    # Stock levels at ?ts= (ISO timestamp), for one product with ?product_id= or the whole catalog.
+    # Computed from the nearest checkpoint, so only the transactions in between are read.
+    try:
+        as_of = datetime.fromisoformat(request.args.get('ts', ''))
+    except ValueError:
+        return jsonify({"error": "ts must be an ISO date or timestamp"}), 400
+    if as_of.tzinfo is not None:
+        as_of = as_of.astimezone().replace(tzinfo=None)
+    product_id = request.args.get('product_id')
+    if product_id is not None:
+        if not product_id.isdigit():
+            return jsonify({"error": "product_id must be an integer"}), 400
+        product_id = int(product_id)
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        cursor = conn.cursor()
+        try:
+            snapshot_at, rows = stock_as_of(cursor, as_of, product_id)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+
+    if product_id is not None and not rows:
+        return jsonify({"error": "Product not found in inventory at that time"}), 404
+    items = [{"product_id": product_id, "product_name": product_name, "quantity_available": quantity}
+             for product_id, product_name, quantity in rows]
+    return jsonify({"as_of": as_of.isoformat(), "snapshot_at": snapshot_at.isoformat() if snapshot_at else None,
+                    "items": items}), 200
+
+
+@app.route("/reports/movement", methods=['GET'])
+def get_movement_report():
+    # Stock in and stock out counts and quantities per product and day or week, read from the daily
+    # rollups. Parameters: start, end (ISO dates, end exclusive), granularity=day|week, product_id=1,2,3.
+    try:
+        sql, params = build_movement_report(request.args)
+    except ReportError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+
+    return jsonify(rows), 200
+
+
+@app.route("/forecast", methods=['GET'])
+def get_forecast():
+    # Latest forecasts from python -m forecasting run, fewest days of cover first. product_id=1,2,3
+    # selects items, below_reorder_point=true only those whose stock is at or under the suggested
+    # reorder point, limit=1..1000 (default 100).
+    conditions = []
+    params = []
+    if request.args.get('product_id'):
+        try:
+            product_ids = [int(product_id) for product_id in request.args['product_id'].split(',')
+                           if product_id.strip()]
+        except ValueError:
+            return jsonify({"error": "product_id must be a comma separated list of integers"}), 400
+        conditions.append("f.product_id = ANY(%s)")
+        params.append(product_ids)
+    if request.args.get('below_reorder_point', '').lower() in ('1', 'true', 'yes'):
+        conditions.append("i.quantity_available <= f.reorder_point")
+    limit = request.args.get('limit', '100')
+    if not limit.isdigit() or not 1 <= int(limit) <= 1000:
+        return jsonify({"error": "limit must be between 1 and 1000"}), 400
+    params.append(int(limit))
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(f"""
+            SELECT f.product_id, i.product_name, i.quantity_available, i.minimum_balance, f.method, f.daily_demand,
+                   f.demand_stddev, f.days_of_cover, f.reorder_point, f.computed_at
+            FROM inventory_forecasts f
+            JOIN inventory i ON i.product_id = f.product_id
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY f.days_of_cover NULLS LAST, f.product_id
+            LIMIT %s
+            """, params)
+            data = cursor.fetchall()
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+
+    return jsonify(data), 200
 
 
 @app.route("/get-item", methods=['GET'])
 def get_item():
-
-    conn = connect_to_db()
-    cursor = conn.cursor()
-
+    # Numeric search items look up a product_id. Anything else is a ranked name search:
+    # mode=fuzzy (default, tolerates typos), mode=prefix or mode=exact, limit=1..100,
+    # source=inventory|products. Id and exact lookups on inventory go through the inventory cache
+    # when it is enabled.
     search_item = request.args.get('search_item')
-    try:
+    if not search_item:
+        return jsonify({"message": "No search item provided"}), 400
 
-        if not search_item:
-            return jsonify({"message": "No search item provided"}), 400
+    mode = request.args.get('mode', 'fuzzy')
+    limit = request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+    source = request.args.get('source', 'inventory')
+    # checked before the cache is consulted, so that both paths reject the same limits
+    try:
+        check_limit(limit)
+    except SearchError as e:
+        return jsonify({"message": str(e)}), 400
+
+    cache = get_inventory_cache()
+    if cache and (search_item.isdigit() or (mode == 'exact' and source == 'inventory')):
+        try:
+            if search_item.isdigit():
+                rows = cached_inventory_lookup(cache, product_id=int(search_item))
+            else:
+                rows = cached_inventory_lookup(cache, name=search_item)
+        except Exception as e:
+            return jsonify({"message": f"Could not complete request due to:{str(e)}"}), 404
+        if rows is None:
+            return jsonify({"message": "Unable to connect to database"}), 500
+        if not rows:
+            return jsonify({"message": "Item not found"}), 404
+        return jsonify([[row['product_id'], row['product_name']] for row in rows[:limit]]), 200
 
-        # Check if the search item is numeric (for product_id) or not (for product_name)
-        if search_item.isdigit():
-            # Search by product_id if it's a number
-            cursor.execute("SELECT product_id, product_name FROM inventory WHERE product_id = %s", (search_item,))
-        else:
-            # Search by product_name if it's a string
-            cursor.execute("SELECT product_id, product_name FROM inventory WHERE product_name ILIKE %s", (f'%{search_item}%',))
+    if search_item.isdigit():
+        sql, params = "SELECT product_id, product_name FROM inventory WHERE product_id = %s", (search_item,)
+    else:
+        try:
+            sql, params = build_search_query(search_item, mode=mode, limit=limit, source=source,
+                                             threshold=app.config['SEARCH_SIMILARITY_THRESHOLD'])
+        except SearchError as e:
+            return jsonify({"message": str(e)}), 400
 
-        data = cursor.fetchall()
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"message": "Unable to connect to database"}), 500
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            data = cursor.fetchall()
 
-        if not data:
-            return jsonify({"message": "Item not found"}), 404
+            if not data:
+                return jsonify({"message": "Item not found"}), 404
 
-        return jsonify(data), 200
+            return jsonify(data), 200
 
-    except Exception as e:
-        return jsonify({"message": f"Could not complete request due to:{str(e)}"}), 404
-    finally:
-        cursor.close()
-        conn.close()
+        except Exception as e:
+            return jsonify({"message": f"Could not complete request due to:{str(e)}"}), 404
+        finally:
+            cursor.close()
 
 
 @app.route("/update-stock", methods=['POST'])
+@login_required(Config.STOCK_WRITE_ROLES)
 def update_stock():
-    conn = connect_to_db()
-
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     try:
         data = request.get_json()
         # validating all fields
 
-        required_fields = ['product_id', 'product_name', 'quantity', 'transaction_party', 'user_id', 'transaction_type']
+        required_fields = ['product_id', 'product_name', 'quantity', 'transaction_party', 'transaction_type']
         missing_fields = [field for field in required_fields if field not in data]
         if missing_fields:
             return jsonify({"error": f"missing the following required fields {', '.join(missing_fields)}"}), 400
@@ -314,61 +693,175 @@ def update_stock():
         product_name = data['product_name']
         quantity = data['quantity']
         transaction_party = data['transaction_party']
-        user_id = data['user_id']
+        # recorded as entered by the signed-in user, whatever the body says
+        user_id = current_user()['user_id']
         transaction_type = data['transaction_type']
 
         if not all([isinstance(product_id, int), isinstance(product_name, str),
-                    isinstance(quantity, int), isinstance(transaction_party, str), isinstance(user_id, int),
+                    isinstance(quantity, int), isinstance(transaction_party, str),
                     isinstance(transaction_type, str)]):
 
             return f"Error. Check input format and data type"
 
-        cursor.execute("""
-        INSERT INTO transactions(product_id, product_name, quantity, transaction_party, entered_by, transaction_type)
-        VALUES(%s,%s,%s,%s,%s,%s)
-        """, (product_id, product_name, quantity, transaction_party, user_id, transaction_type))
-
-        if cursor.rowcount == 0:
-            return jsonify({"error": "Unable to log transaction"}), 400
-        conn.commit()
-
     except Exception as e:
         return jsonify({"error": f"Unable to complete request due to {str(e)}"}), 500
 
-    finally:
-        cursor.close()
-        conn.close()
+    if Config.GROUP_COMMIT_ENABLED:
+        # written and committed together with the other movements waiting, see stock_group_commit.py
+        try:
+            future = get_writer().submit({
+                'product_id': product_id, 'product_name': product_name, 'quantity': quantity,
+                'transaction_party': transaction_party, 'user_id': user_id, 'transaction_type': transaction_type
+            })
+        except QueueFull:
+            response = jsonify({"error": "Too many stock movements waiting, try again shortly"})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        try:
+            result = future.result(timeout=Config.GROUP_COMMIT_RESULT_TIMEOUT)
+        except FutureTimeout:
+            return jsonify({"error": "Timed out waiting for the transaction to be committed, its outcome is unknown"}), 504
+        if result['status'] != 'ok':
+            return jsonify({"error": f"Unable to complete request due to {result['error']}"}), 500
         return f"Transaction logged successfully", 201
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+        try:
+            cursor.execute("""
+            INSERT INTO transactions(product_id, product_name, quantity, transaction_party, entered_by, transaction_type)
+            VALUES(%s,%s,%s,%s,%s,%s)
+            """, (product_id, product_name, quantity, transaction_party, user_id, transaction_type))
+
+            if cursor.rowcount == 0:
+                return jsonify({"error": "Unable to log transaction"}), 400
+            conn.commit()
+
+        except Exception as e:
+            return jsonify({"error": f"Unable to complete request due to {str(e)}"}), 500
+
+        finally:
+            cursor.close()
+
+    return f"Transaction logged successfully", 201
 # calls the update stock function. Sets the trigger that looks up product and if exists, inserts into the
 # transactions table and triggers the update_inventory trigger
 
 
+@app.route("/update-stock/batch", methods=['POST'])
+@login_required(Config.STOCK_WRITE_ROLES)
+def update_stock_batch():
+    # Accepts a JSON array of movements, {"mode": ..., "movements": [...]}, or an NDJSON body
+    # (Content-Type: application/x-ndjson). mode is "atomic" (default, all or nothing) or
+    # "per-item" (valid movements are committed and failures reported).
+    mode = request.args.get('mode', 'atomic')
+    if request.mimetype == 'application/x-ndjson':
+        # one line past the limit is enough to reject the batch, the rest of the body is not read
+        items = list(islice(parse_ndjson(request.stream), app.config['STOCK_BATCH_MAX_ITEMS'] + 1))
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            mode = data.get('mode', mode)
+            data = data.get('movements')
+        if not isinstance(data, list):
+            return jsonify({"error": "Expected a list of movements"}), 400
+        items = data
+
+    if mode not in ('atomic', 'per-item'):
+        return jsonify({"error": "mode must be 'atomic' or 'per-item'"}), 400
+    if not items:
+        return jsonify({"error": "No movements provided"}), 400
+    if len(items) > app.config['STOCK_BATCH_MAX_ITEMS']:
+        return jsonify({"error": f"A batch may hold at most {app.config['STOCK_BATCH_MAX_ITEMS']} movements"}), 413
+
+    # every movement is entered by the signed-in user
+    user_id = current_user()['user_id']
+    items = [dict(item, user_id=user_id) if isinstance(item, dict) else item for item in items]
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Unable to connect to database"}), 500
+        try:
+            results, written = apply_movements(conn, items, atomic=mode == 'atomic')
+        except Exception as e:
+            return jsonify({"error": f"Unable to complete request due to {str(e)}"}), 500
+
+    failed = sum(1 for result in results if result['status'] == 'error')
+    response = {
+        "mode": mode,
+        "inserted": sum(1 for result in results if result['status'] == 'ok'),
+        "failed": failed,
+        "results": results
+    }
+    if not failed:
+        return jsonify(response), 201
+    if written:
+        return jsonify(response), 207
+    return jsonify(response), 422
+
+
 @app.route("/delete-product", methods=['DELETE'])
+@login_required(Config.PRODUCT_ADMIN_ROLES)
 def delete_item():
 
-    conn = connect_to_db()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        product_name = request.args.get('product_name')
-        packaging = request.args.get('packaging')
-        cursor.execute("""
-        SELECT EXISTS(SELECT product_name, package from products where product_name = %s and packaging = %s)
-        """, (product_name, packaging))
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"message": "Unable to connect to database"}), 500
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            product_name = request.args.get('product_name')
+            packaging = request.args.get('packaging')
+            cursor.execute("""
+            SELECT EXISTS(SELECT product_name, package from products where product_name = %s and packaging = %s)
+            """, (product_name, packaging))
 
-        data = cursor.fetchone()['data']
+            data = cursor.fetchone()['data']
 
-        if not data:
-            return jsonify({"message": f"No item found for {product_name} with packaging {packaging}"}), 204
-        cursor.execute("""
-        DELETE FROM products WHERE product_name = %s and packaging = %s""", (product_name, packaging))
+            if not data:
+                return jsonify({"message": f"No item found for {product_name} with packaging {packaging}"}), 204
+            cursor.execute("""
+            DELETE FROM products WHERE product_name = %s and packaging = %s""", (product_name, packaging))
 
-        conn.commit()
-        return jsonify({"message": f"Product '{product_name}' with packaging '{packaging}' deleted successfully"}), 200
-    except Exception as e:
-        return jsonify({"message": f"Unable to complete request due to: {str(e)}"}), 400
-    finally:
-        cursor.close()
-        conn.close()
+            conn.commit()
+            return jsonify({"message": f"Product '{product_name}' with packaging '{packaging}' deleted successfully"}), 200
+        except Exception as e:
+            return jsonify({"message": f"Unable to complete request due to: {str(e)}"}), 400
+        finally:
+            cursor.close()
+
+
+@app.route("/db-pool-stats", methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool_stats()), 200
+
+
+@app.route("/inventory-cache-stats", methods=['GET'])
+def get_inventory_cache_stats():
+    cache = get_inventory_cache()
+    if not cache:
+        return jsonify({"message": "Inventory cache is disabled"}), 404
+    return jsonify(cache.stats()), 200
+
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    return Response(render_metrics(), content_type=CONTENT_TYPE), 200
+
+
+@app.route("/admin/slow-queries", methods=['GET'])
+@login_required(Config.ADMIN_ROLES)
+def get_slow_queries():
+    limit = request.args.get('limit', type=int)
+    return jsonify({"threshold_ms": Config.SLOW_QUERY_MS, "entries": slow_query_log.entries(limit)}), 200
+
+
+@app.route("/user-cache-stats", methods=['GET'])
+def get_user_cache_stats():
+    return jsonify(get_user_cache().stats()), 200
 
 
 if __name__ == '__main__':
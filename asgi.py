@@ -0,0 +1,412 @@
+# ASGI entry point. /get-item, /get-all-records and /update-stock are served by async handlers on
+# an asyncio connection pool (async_db.py), so one worker can have as many of them waiting on Postgres
+# as its pool has connections instead of one per thread. They answer exactly like the Flask views.
+# Every other route is passed to the Flask app when asgiref is installed.
+#
+#   pip install -r requirements-optional.txt
+#   uvicorn asgi:app --workers 4
+import asyncio
+import json
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from psycopg2.extras import RealDictCursor
+from werkzeug.datastructures import MultiDict
+
+from app import INVENTORY_COLUMNS, app as flask_app
+from auth import USER_QUERY, role_allowed
+from async_db import AsyncConnectionPool, connect_to_db_async
+from config import Config
+from instrumentation import record_request, sampled_logger
+from models import get_inventory_cache, get_user_cache
+from product_search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, SearchError, check_limit, search_statement
+from stock_group_commit import QueueFull, get_writer
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+wsgi_app = WsgiToAsgi(flask_app) if WsgiToAsgi else None
+log = sampled_logger(__name__)
+
+_pool = None
+
+
+async def _configure(conn):
+    # the sync views SET LOCAL this per query; asynchronous connections run in autocommit mode, so it
+    # is set once per session instead
+    await conn.execute("SET pg_trgm.word_similarity_threshold = %s", (Config.SEARCH_SIMILARITY_THRESHOLD,))
+
+
+def get_async_pool():
+    # one pool per event loop, created on first use or at lifespan startup
+    global _pool
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool[1] is not loop:
+        pool = AsyncConnectionPool(
+            lambda: connect_to_db_async(_configure),
+            min_size=Config.DB_PARAMETERS['pool_min_size'],
+            max_size=Config.DB_PARAMETERS['pool_max_size'],
+            timeout=Config.DB_PARAMETERS['pool_timeout'],
+            max_idle=Config.DB_PARAMETERS['pool_max_idle']
+        )
+        _pool = (pool, loop)
+    return _pool[0]
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.body = body
+
+    def get_json(self):
+        if self.headers.get('content-type', '').split(';')[0].strip() != 'application/json':
+            raise ValueError("Did not attempt to load JSON data because the request Content-Type was not "
+                             "'application/json'.")
+        return json.loads(self.body)
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _start(send, status, content_type, length=None):
+    headers = [(b'content-type', content_type.encode())]
+    if length is not None:
+        headers.append((b'content-length', str(length).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+
+async def respond(send, data, status=200):
+    # data as jsonify() would send it; strings are sent as HTML like a string returned from a view
+    if isinstance(data, str):
+        content_type, body = 'text/html; charset=utf-8', data.encode()
+    else:
+        response = flask_app.json.response(data)
+        content_type, body = response.content_type, response.get_data()
+    if status == 204:
+        body = b''
+    await _start(send, status, content_type, len(body))
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def session_user_id(request):
+    # the user_id /log-in stored in Flask's signed session cookie, or None
+    cookie = SimpleCookie(request.headers.get('cookie', '')).get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if cookie is None or serializer is None:
+        return None
+    try:
+        data = serializer.loads(cookie.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return None
+    user_id = data.get('user_id')
+    return user_id if isinstance(user_id, int) else None
+
+
+async def authorize(request, send, pool, roles):
+    # async version of auth.login_required(); returns the user, or None once the error is sent
+    user_id = session_user_id(request)
+    if user_id is None:
+        return await respond(send, {"error": "Log in required"}, 401)
+    cache = get_user_cache()
+    user = cache.get(user_id)
+    if user is None:
+        generation = cache.generation
+        async with pool.connection() as conn:
+            if not conn:
+                return await respond(send, {"error": "Unable to connect to database"}, 500)
+            try:
+                cursor = await conn.execute(USER_QUERY, (user_id,), cursor_factory=RealDictCursor)
+                user = cursor.fetchone()
+                cursor.close()
+            except Exception as e:
+                return await respond(send, {"error": f"Unable to complete request due to {str(e)}"}, 500)
+        if user is None:
+            return await respond(send, {"error": "Log in required"}, 401)
+        user = dict(user)
+        cache.put(user, generation)
+    if not role_allowed(user, roles):
+        return await respond(send, {"error": f"Role '{user['role']}' may not perform this action"}, 403)
+    return user
+
+
+async def cached_inventory_lookup(cache, pool, product_id=None, name=None):
+    # async version of app.cached_inventory_lookup()
+    rows = cache.get(product_id) if product_id is not None else cache.find_by_name(name)
+    if rows is not None:
+        return [rows] if product_id is not None else rows
+
+    generation = cache.generation
+    async with pool.connection() as conn:
+        if not conn:
+            return None
+        if product_id is not None:
+            cursor = await conn.execute(f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory WHERE product_id = %s",
+                                        (product_id,), cursor_factory=RealDictCursor)
+        else:
+            cursor = await conn.execute(*search_statement(name, mode='exact', limit=MAX_SEARCH_LIMIT,
+                                                          columns=', '.join(INVENTORY_COLUMNS)),
+                                        cursor_factory=RealDictCursor)
+        rows = [dict(row) for row in cursor.fetchall()]
+        cursor.close()
+    # a name with MAX_SEARCH_LIMIT rows may have more than were read, so it is not marked complete
+    cache.put(rows, generation, name=name if len(rows) < MAX_SEARCH_LIMIT else None)
+    return rows
+
+
+async def get_item(request, send):
+    search_item = request.args.get('search_item')
+    if not search_item:
+        return await respond(send, {"message": "No search item provided"}, 400)
+
+    mode = request.args.get('mode', 'fuzzy')
+    limit = request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+    source = request.args.get('source', 'inventory')
+    try:
+        check_limit(limit)
+    except SearchError as e:
+        return await respond(send, {"message": str(e)}, 400)
+    pool = get_async_pool()
+
+    cache = get_inventory_cache()
+    if cache and (search_item.isdigit() or (mode == 'exact' and source == 'inventory')):
+        try:
+            if search_item.isdigit():
+                rows = await cached_inventory_lookup(cache, pool, product_id=int(search_item))
+            else:
+                rows = await cached_inventory_lookup(cache, pool, name=search_item)
+        except Exception as e:
+            return await respond(send, {"message": f"Could not complete request due to:{str(e)}"}, 404)
+        if rows is None:
+            return await respond(send, {"message": "Unable to connect to database"}, 500)
+        if not rows:
+            return await respond(send, {"message": "Item not found"}, 404)
+        return await respond(send, [[row['product_id'], row['product_name']] for row in rows[:limit]], 200)
+
+    if search_item.isdigit():
+        sql, params = "SELECT product_id, product_name FROM inventory WHERE product_id = %s", (search_item,)
+    else:
+        try:
+            sql, params = search_statement(search_item, mode=mode, limit=limit, source=source)
+        except SearchError as e:
+            return await respond(send, {"message": str(e)}, 400)
+
+    async with pool.connection() as conn:
+        if not conn:
+            return await respond(send, {"message": "Unable to connect to database"}, 500)
+        try:
+            cursor = await conn.execute(sql, params)
+            data = cursor.fetchall()
+            cursor.close()
+        except Exception as e:
+            return await respond(send, {"message": f"Could not complete request due to:{str(e)}"}, 404)
+
+    if not data:
+        return await respond(send, {"message": "Item not found"}, 404)
+    return await respond(send, data, 200)
+
+
+async def stream_inventory(conn, output_format, send):
+    # Same body as app.stream_inventory(). Async connections have no named cursors, so the rows are
+    # read with DECLARE/FETCH inside a transaction, one RECORDS_STREAM_ITERSIZE batch at a time.
+    itersize = Config.RECORDS_STREAM_ITERSIZE
+    separator = ',' if output_format == 'json' else '\n'
+    first = True
+
+    async def write(text):
+        await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+    try:
+        async with conn.transaction():
+            await conn.execute(f"DECLARE get_all_records NO SCROLL CURSOR FOR "
+                               f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory")
+            if output_format == 'json':
+                await write('[')
+            while True:
+                cursor = await conn.execute("FETCH %s FROM get_all_records", (itersize,))
+                rows = cursor.fetchall()
+                cursor.close()
+                if not rows:
+                    break
+                if output_format == 'json':
+                    chunk = flask_app.json.encode_array(INVENTORY_COLUMNS, rows)[1:-1]
+                else:
+                    chunk = separator.join(flask_app.json.encode_rows(INVENTORY_COLUMNS, rows))
+                await write(('' if first else separator) + chunk)
+                first = False
+            if output_format == 'json':
+                await write(']')
+            elif not first:
+                await write('\n')
+    except Exception as e:
+        # the status line has already been sent, so the body is cut short
+        log.error("Error while streaming records: %s", e)
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def get_all_records(request, send):
+    pool = get_async_pool()
+    output_format = request.args.get('stream')
+    if output_format:
+        if output_format not in ('json', 'ndjson'):
+            return await respond(send, {"error": "stream must be 'json' or 'ndjson'"}, 400)
+        async with pool.connection() as conn:
+            if not conn:
+                return await respond(send, {"error": "Unable to connect to database"}, 500)
+            await _start(send, 200, 'application/json' if output_format == 'json' else 'application/x-ndjson')
+            await stream_inventory(conn, output_format, send)
+        return
+
+    cache = get_inventory_cache()
+    if cache:
+        records = cache.all_rows()
+        if records is not None:
+            if not records:
+                return await respond(send, {"message": "No data available"}, 204)
+            return await respond(send, records, 200)
+        generation = cache.generation
+
+    async with pool.connection() as conn:
+        if not conn:
+            return await respond(send, {"error": "Unable to connect to database"}, 500)
+        try:
+            cursor = await conn.execute(f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory")
+            data = cursor.fetchall()
+            cursor.close()
+        except Exception as e:
+            log.error("Unable to read inventory records: %s", e)
+            return await respond(send, {"error": str(e)}, 500)
+
+    if not data:
+        return await respond(send, {"message": "No data available"}, 204)
+    if cache:
+        cache.put([dict(zip(INVENTORY_COLUMNS, row)) for row in data], generation, complete=True)
+    body = (flask_app.json.encode_array(INVENTORY_COLUMNS, data) + '\n').encode()
+    await _start(send, 200, flask_app.json.mimetype, len(body))
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def update_stock(request, send):
+    pool = get_async_pool()
+    user = await authorize(request, send, pool, Config.STOCK_WRITE_ROLES)
+    if user is None:
+        return
+    try:
+        data = request.get_json()
+
+        required_fields = ['product_id', 'product_name', 'quantity', 'transaction_party', 'transaction_type']
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return await respond(send, {"error": f"missing the following required fields {', '.join(missing_fields)}"}, 400)
+
+        product_id = data['product_id']
+        product_name = data['product_name']
+        quantity = data['quantity']
+        transaction_party = data['transaction_party']
+        user_id = user['user_id']
+        transaction_type = data['transaction_type']
+
+        if not all([isinstance(product_id, int), isinstance(product_name, str),
+                    isinstance(quantity, int), isinstance(transaction_party, str),
+                    isinstance(transaction_type, str)]):
+            return await respond(send, "Error. Check input format and data type")
+    except Exception as e:
+        return await respond(send, {"error": f"Unable to complete request due to {str(e)}"}, 500)
+
+    if Config.GROUP_COMMIT_ENABLED:
+        # the same writer thread as the Flask view, awaited instead of blocking the event loop
+        try:
+            future = get_writer().submit({
+                'product_id': product_id, 'product_name': product_name, 'quantity': quantity,
+                'transaction_party': transaction_party, 'user_id': user_id, 'transaction_type': transaction_type
+            })
+        except QueueFull:
+            return await respond(send, {"error": "Too many stock movements waiting, try again shortly"}, 503)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                            Config.GROUP_COMMIT_RESULT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return await respond(send, {"error": "Timed out waiting for the transaction to be committed, its outcome is unknown"}, 504)
+        if result['status'] != 'ok':
+            return await respond(send, {"error": f"Unable to complete request due to {result['error']}"}, 500)
+        return await respond(send, "Transaction logged successfully", 201)
+
+    async with pool.connection() as conn:
+        if not conn:
+            return await respond(send, {"error": "Unable to connect to database"}, 500)
+        try:
+            async with conn.transaction():
+                cursor = await conn.execute("""
+                INSERT INTO transactions(product_id, product_name, quantity, transaction_party, entered_by, transaction_type)
+                VALUES(%s,%s,%s,%s,%s,%s)
+                """, (product_id, product_name, quantity, transaction_party, user_id, transaction_type))
+                inserted = cursor.rowcount
+                cursor.close()
+        except Exception as e:
+            return await respond(send, {"error": f"Unable to complete request due to {str(e)}"}, 500)
+
+    if inserted == 0:
+        return await respond(send, {"error": "Unable to log transaction"}, 400)
+    return await respond(send, "Transaction logged successfully", 201)
+
+
+ROUTES = {
+    ('GET', '/get-item'): get_item,
+    ('GET', '/get-all-records'): get_all_records,
+    ('POST', '/update-stock'): update_stock,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await get_async_pool().prefill()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await get_async_pool().closeall()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        if wsgi_app is None:
+            return await respond(send, {"error": "Not found. Install asgiref to serve the other routes over ASGI"},
+                                 404)
+        return await wsgi_app(scope, receive, send)
+    # timed like the Flask views, see instrumentation.instrument_app()
+    status = []
+
+    async def send_and_record(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+            record_request(scope['method'], scope['path'], message['status'], time.perf_counter() - started)
+        await send(message)
+
+    started = time.perf_counter()
+    try:
+        await handler(Request(scope, await _read_body(receive)), send_and_record)
+    except Exception:
+        if not status:
+            record_request(scope['method'], scope['path'], 500, time.perf_counter() - started)
+        raise
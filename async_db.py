@@ -0,0 +1,309 @@
+# asyncio counterpart of db_pool.py for the ASGI entry point in asgi.py. It uses psycopg2's
+# asynchronous connections, whose sockets are watched by the event loop, so a single worker thread
+# can wait on as many queries as the pool has connections.
+#
+# Asynchronous connections are always in autocommit mode: use `async with conn.transaction():` for
+# statements that must commit together.
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from config import Config
+from db_pool import PoolError, PoolTimeout
+from instrumentation import POOL_ACQUIRE_DURATION, POOL_ACQUIRE_ERRORS, record_query, sampled_logger
+
+log = sampled_logger(__name__)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def wait(raw):
+    # drives a connection until its pending connect or query has finished
+    loop = asyncio.get_running_loop()
+    while True:
+        state = raw.poll()
+        if state == extensions.POLL_OK:
+            return
+        future = loop.create_future()
+        if state == extensions.POLL_READ:
+            loop.add_reader(raw.fileno(), _wake, future)
+            try:
+                await future
+            finally:
+                loop.remove_reader(raw.fileno())
+        elif state == extensions.POLL_WRITE:
+            loop.add_writer(raw.fileno(), _wake, future)
+            try:
+                await future
+            finally:
+                loop.remove_writer(raw.fileno())
+        else:
+            raise psycopg2.OperationalError(f"unexpected connection poll state {state}")
+
+
+class AsyncConnection:
+    def __init__(self, raw):
+        self.raw = raw
+        # set when a query was interrupted and the connection's state is unknown
+        self.broken = False
+
+    @property
+    def closed(self):
+        return bool(self.raw.closed)
+
+    async def execute(self, query, params=None, cursor_factory=None):
+        # runs one statement and returns its cursor, ready for fetchone()/fetchall()
+        cursor = self.raw.cursor(cursor_factory=cursor_factory)
+        started = time.perf_counter()
+        try:
+            cursor.execute(query, params)
+            await wait(self.raw)
+        except (asyncio.CancelledError, psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            record_query(query, time.perf_counter() - started, e)
+            self.broken = True
+            cursor.close()
+            raise
+        except Exception as e:
+            record_query(query, time.perf_counter() - started, e)
+            cursor.close()
+            raise
+        record_query(query, time.perf_counter() - started)
+        return cursor
+
+    @asynccontextmanager
+    async def transaction(self):
+        await self.execute("BEGIN")
+        try:
+            yield self
+        except BaseException:
+            if not self.broken:
+                await self.execute("ROLLBACK")
+            raise
+        await self.execute("COMMIT")
+
+    def close(self):
+        try:
+            self.raw.close()
+        except psycopg2.Error:
+            pass
+
+
+async def connect_to_db_async(configure=None):
+    # Same parameters as models.connect_to_db(). configure(conn) may run session setup statements.
+    # Returns None when the database cannot be reached, like connect_to_db().
+    try:
+        raw = psycopg2.connect(
+            host=Config.DB_PARAMETERS['host'],
+            database=Config.DB_PARAMETERS['database'],
+            user=Config.DB_PARAMETERS['user'],
+            password=Config.DB_PARAMETERS['password'],
+            port=Config.DB_PARAMETERS['port'],
+            async_=True
+        )
+        await wait(raw)
+    except psycopg2.OperationalError as e:
+        log.error("Unable to connect to database: %s", e)
+        return None
+    conn = AsyncConnection(raw)
+    if configure is not None:
+        try:
+            await configure(conn)
+        except psycopg2.Error as e:
+            conn.close()
+            log.error("Unable to configure database connection: %s", e)
+            return None
+    return conn
+
+
+class AsyncConnectionPool:
+    # Bounded pool of AsyncConnections for the tasks of one event loop. Mirrors ConnectionPool:
+    # connections idle for a second or more are checked before being handed out, broken ones are
+    # discarded, and stats() reports the same counters.
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, max_idle=300.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"invalid pool size min={min_size} max={max_size}")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._available = asyncio.Condition()
+        self._idle = []  # (connection, time it was returned)
+        self._in_use = set()
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            'acquired': 0,
+            'acquire_failures': 0,
+            'timeouts': 0,
+            'discarded': 0,
+            'opened': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    @property
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    async def prefill(self):
+        for _ in range(self.min_size - self._size):
+            conn = await self._connect()
+            if conn is None:
+                break
+            self._stats['opened'] += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        self._stats['discarded'] += 1
+        conn.close()
+
+    async def _is_healthy(self, conn, idle_for):
+        if conn.closed or conn.broken:
+            return False
+        if conn.raw.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if idle_for < 1.0:
+            return True
+        try:
+            (await conn.execute("SELECT 1")).close()
+            return True
+        except psycopg2.Error:
+            return False
+
+    async def getconn(self, timeout=None):
+        # Pool state is only touched between awaits, so it needs no lock; the condition is only
+        # used to wait for a connection to be returned.
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            if self._closed:
+                raise PoolError("connection pool is closed")
+            now = time.monotonic()
+            while self._idle:
+                conn, returned_at = self._idle.pop()
+                idle_for = now - returned_at
+                if self.max_idle and idle_for > self.max_idle and self._size >= self.min_size:
+                    self._discard(conn)
+                    continue
+                self._in_use.add(conn)
+                try:
+                    healthy = await self._is_healthy(conn, idle_for)
+                except BaseException:
+                    self._in_use.discard(conn)
+                    self._discard(conn)
+                    raise
+                if healthy:
+                    self._record_acquire(started)
+                    return conn
+                self._in_use.discard(conn)
+                self._discard(conn)
+                now = time.monotonic()
+
+            if self._size < self.max_size:
+                self._opening += 1
+                try:
+                    conn = await self._connect()
+                finally:
+                    self._opening -= 1
+                if conn is None:
+                    self._stats['acquire_failures'] += 1
+                    await self._notify()
+                    raise PoolError("unable to open a database connection")
+                self._stats['opened'] += 1
+                self._in_use.add(conn)
+                self._record_acquire(started)
+                return conn
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._stats['acquire_failures'] += 1
+                self._stats['timeouts'] += 1
+                raise PoolTimeout(f"no database connection available after {timeout}s")
+            self._waiting += 1
+            try:
+                async with self._available:
+                    await asyncio.wait_for(self._available.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiting -= 1
+
+    async def _notify(self):
+        async with self._available:
+            self._available.notify()
+
+    def _record_acquire(self, started):
+        waited = time.monotonic() - started
+        self._stats['acquired'] += 1
+        self._stats['wait_time_total'] += waited
+        if waited > self._stats['wait_time_max']:
+            self._stats['wait_time_max'] = waited
+
+    async def putconn(self, conn, discard=False):
+        if conn not in self._in_use:
+            return
+        if not discard and not conn.closed and not conn.broken:
+            try:
+                if conn.raw.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    (await conn.execute("ROLLBACK")).close()
+            except psycopg2.Error:
+                discard = True
+        self._in_use.discard(conn)
+        if discard or conn.closed or conn.broken or self._closed:
+            self._discard(conn)
+        else:
+            self._idle.append((conn, time.monotonic()))
+        await self._notify()
+
+    @asynccontextmanager
+    async def connection(self):
+        # Borrow a connection for the duration of a request. Yields None when no connection could be
+        # acquired, like models.db_connection().
+        started = time.perf_counter()
+        try:
+            conn = await self.getconn()
+        except PoolError as e:
+            POOL_ACQUIRE_ERRORS.inc('async', type(e).__name__)
+            log.warning("Unable to acquire database connection: %s", e)
+            yield None
+            return
+        POOL_ACQUIRE_DURATION.observe(time.perf_counter() - started, 'async')
+        try:
+            yield conn
+        except psycopg2.InterfaceError:
+            conn.broken = True
+            raise
+        finally:
+            # shielded so a cancelled request still returns its connection
+            await asyncio.shield(self.putconn(conn))
+
+    async def closeall(self):
+        self._closed = True
+        for conn, _ in self._idle:
+            self._discard(conn)
+        self._idle = []
+        async with self._available:
+            self._available.notify_all()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update({
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'in_use': len(self._in_use),
+            'idle': len(self._idle),
+            'waiting': self._waiting,
+        })
+        acquired = stats['acquired']
+        stats['wait_time_avg'] = stats['wait_time_total'] / acquired if acquired else 0.0
+        return stats
@@ -0,0 +1,81 @@
+# Who is making the request, for the write endpoints. /log-in stores the user's id in the signed session
+# cookie; the user's name and role are then read from this process's user cache (models.get_user_cache())
+# and only fetched from users when they are not cached, so an authorized write normally costs no extra
+# query. A trigger on users evicts changed or deleted users from every process's cache.
+from functools import wraps
+
+from flask import g, jsonify, session
+from psycopg2.extras import RealDictCursor
+
+from models import db_connection, get_user_cache
+
+USER_QUERY = "SELECT user_id, user_name, role FROM users WHERE user_id = %s"
+
+# stands for "no database connection" in g.current_user, as None means signed out
+UNAVAILABLE = object()
+
+
+def role_allowed(user, roles):
+    # roles as in Config.STOCK_WRITE_ROLES; empty allows every user
+    return not roles or (user['role'] or '').strip().lower() in roles
+
+
+def remember_user(user, generation):
+    # stores a users row read after log-in or a cache miss; generation is the cache's from before the
+    # read, so a row that changed meanwhile is not stored
+    get_user_cache().put(dict(user), generation)
+
+
+def load_user(user_id):
+    # the signed-in user's row, None if it was deleted, UNAVAILABLE without a database connection
+    cache = get_user_cache()
+    user = cache.get(user_id)
+    if user is not None:
+        return user
+
+    generation = cache.generation
+    with db_connection() as conn:
+        if not conn:
+            return UNAVAILABLE
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(USER_QUERY, (user_id,))
+            user = cursor.fetchone()
+        finally:
+            cursor.close()
+    if user is None:
+        return None
+    user = dict(user)
+    cache.put(user, generation)
+    return user
+
+
+def current_user():
+    # resolved once per request
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = load_user(user_id) if isinstance(user_id, int) else None
+        if g.current_user is None:
+            session.pop('user_id', None)
+            session.pop('username', None)
+    return g.current_user
+
+
+def login_required(roles=None):
+    # 401 unless signed in, 403 unless the user's role is in roles
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                user = current_user()
+            except Exception as e:
+                return jsonify({"error": f"Unable to complete request due to {str(e)}"}), 500
+            if user is UNAVAILABLE:
+                return jsonify({"error": "Unable to connect to database"}), 500
+            if user is None:
+                return jsonify({"error": "Log in required"}), 401
+            if not role_allowed(user, roles):
+                return jsonify({"error": f"Role '{user['role']}' may not perform this action"}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,150 @@
+# Compares how many concurrent clients one worker can serve through the Flask views and through the
+# async handlers of asgi.py, with a mix of /get-item lookups and /update-stock writes. The sync worker
+# gets --threads request threads like a threaded WSGI worker; the async one runs on a single event
+# loop. Needs the database from capstone.env; all work happens in a scratch schema.
+#
+#   python -m benchmarks.async_concurrency --concurrency 1 8 32 128 --requests 2000
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import asgi
+import models
+from app import app
+from benchmarks.common import create_schema, latency_summary, scratch_schema, write_results
+from benchmarks.trigger_modes import seed
+
+
+def make_requests(catalog, count, write_ratio, rng):
+    requests = []
+    for _ in range(count):
+        product_id, product_name = rng.choice(catalog)
+        if rng.random() < write_ratio:
+            body = {'product_id': product_id, 'product_name': product_name, 'quantity': 1,
+                    'transaction_party': 'bench', 'transaction_type': 'stock in'}
+            requests.append(('POST', '/update-stock', '', json.dumps(body).encode()))
+        else:
+            requests.append(('GET', '/get-item', f'search_item={product_id}', b''))
+    return requests
+
+
+def session_cookie(user_id):
+    # what /log-in would set for the seeded user
+    value = app.session_interface.get_signing_serializer(app).dumps({'user_id': user_id})
+    return f"{app.config['SESSION_COOKIE_NAME']}={value}"
+
+
+def run_sync(requests, cookie, concurrency, threads):
+    # concurrency clients share `threads` worker threads; waiting for a free thread counts as latency
+    worker_threads = threading.Semaphore(threads)
+    pending = iter(requests)
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def client():
+        test_client = app.test_client()
+        test_client.set_cookie(*cookie.split('=', 1))
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            method, path, query, body = request
+            started = time.perf_counter()
+            with worker_threads:
+                response = test_client.open(path, method=method, query_string=query, data=body,
+                                            content_type='application/json')
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors[0] += 1
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latency_summary(latencies, errors[0], time.perf_counter() - started)
+
+
+async def call_asgi(method, path, query, body, cookie):
+    status = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'headers': [(b'content-type', b'application/json'), (b'cookie', cookie.encode())]}
+    await asgi.app(scope, receive, send)
+    return status[0]
+
+
+async def run_async(requests, cookie, concurrency):
+    pending = iter(requests)
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        for method, path, query, body in pending:
+            started = time.perf_counter()
+            status = await call_asgi(method, path, query, body, cookie)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    results = latency_summary(latencies, errors, time.perf_counter() - started)
+    pool = asgi.get_async_pool()
+    results['pool'] = pool.stats()
+    await pool.closeall()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrency per worker of the sync and async request paths')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per run')
+    parser.add_argument('--threads', type=int, default=8, help='request threads of the sync worker')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of /update-stock requests')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    runs = []
+    with scratch_schema('bench_async'):
+        create_schema()
+        conn = models.connect_to_db()
+        try:
+            catalog, user_id = seed(conn, args.products)
+        finally:
+            conn.close()
+        cookie = session_cookie(user_id)
+        for concurrency in args.concurrency:
+            requests = make_requests(catalog, args.requests, args.write_ratio, rng)
+            runs.append({
+                'concurrency': concurrency,
+                'sync': run_sync(requests, cookie, concurrency, args.threads),
+                'async': asyncio.run(run_async(requests, cookie, concurrency))
+            })
+        models.get_pool().closeall()
+
+    write_results({'benchmark': 'async_concurrency', 'parameters': vars(args), 'runs': runs}, args.output)
+
+
+if __name__ == '__main__':
+    main()
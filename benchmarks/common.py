@@ -0,0 +1,90 @@
+import json
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import models
+
+
+@contextmanager
+def scratch_schema(name):
+    # Runs the block against an empty schema so benchmarks never touch real data. Every connection
+    # opened inside, including the ones models.py opens, gets the schema as its search_path.
+    conn = models.connect_to_db()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {name}")
+    previous = os.environ.get('PGOPTIONS')
+    # public stays on the path for extensions installed there, e.g. pg_trgm
+    os.environ['PGOPTIONS'] = f"-c search_path={name},public"
+    try:
+        yield name
+    finally:
+        if previous is None:
+            os.environ.pop('PGOPTIONS', None)
+        else:
+            os.environ['PGOPTIONS'] = previous
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE")
+        conn.close()
+
+
+def create_schema(trigger_mode='row'):
+    # only the tables and the inventory trigger, without the notification and rollup triggers
+    conn = models.connect_to_db()
+    try:
+        with conn.cursor() as cursor:
+            models.create_products_table(cursor)
+            models.create_user_table(cursor)
+            models.create_transactions_table(cursor)
+            models.create_inventory_table(cursor)
+            models.update_inventory_trigger(cursor, trigger_mode)
+            models.create_hot_product_credits(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def timer(results, key):
+    started = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - started
+
+
+def latency_summary(latencies, errors, seconds):
+    # throughput and latency percentiles in milliseconds of one run
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else None
+
+    return {
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / seconds if seconds else None,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'errors': errors
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, path=None):
+    # results are stamped with the commit they were measured on, for benchmarks.compare
+    results = {'commit': git_commit(), 'recorded_at': datetime.now(timezone.utc).isoformat(), **results}
+    text = json.dumps(results, indent=2, default=str)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    print(text)
@@ -0,0 +1,70 @@
+# Compares two benchmark results, two files or two benchmarks.suite directories, metric by metric.
+# Runs are matched by what identifies them (mode, catalog size, concurrency, ...), not by position.
+#
+#   python -m benchmarks.compare benchmark-results/1c41fd3 benchmark-results/795b14a
+import argparse
+import json
+import os
+
+# keys that name a run rather than measure it
+IDENTITY_KEYS = ('mode', 'products', 'catalog_size', 'concurrency', 'term')
+SKIPPED_KEYS = ('parameters', 'commit', 'recorded_at', 'statuses', 'pool')
+
+
+def flatten(value, path=()):
+    # (path, number) of every metric
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key not in SKIPPED_KEYS and key not in IDENTITY_KEYS:
+                yield from flatten(item, path + (key,))
+    elif isinstance(value, list):
+        for position, item in enumerate(value):
+            if isinstance(item, dict) and any(key in item for key in IDENTITY_KEYS):
+                label = ','.join(f"{key}={item[key]}" for key in IDENTITY_KEYS if key in item)
+            else:
+                label = str(position)
+            yield from flatten(item, path + (label,))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield path, value
+
+
+def load(path):
+    if os.path.isdir(path):
+        results = {}
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.json'):
+                with open(os.path.join(path, name)) as f:
+                    results[name[:-len('.json')]] = json.load(f)
+        return results
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(before, after):
+    before = dict(flatten(before))
+    rows = []
+    for path, value in flatten(after):
+        if path in before:
+            old = before[path]
+            change = (value - old) / old * 100 if old else None
+            rows.append(('/'.join(path), old, value, change))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark results')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0,
+                        help='only show metrics that changed by at least this many percent')
+    args = parser.parse_args()
+
+    for metric, old, new, change in compare(load(args.before), load(args.after)):
+        if change is not None and abs(change) < args.threshold:
+            continue
+        change = f"{change:+.1f}%" if change is not None else 'n/a'
+        print(f"{metric:<80} {old:>12.3f} {new:>12.3f} {change:>9}")
+
+
+if __name__ == '__main__':
+    main()
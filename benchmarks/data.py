@@ -0,0 +1,99 @@
+# Synthetic store data for the benchmarks: products, users and a transaction history. Demand is
+# Zipf-skewed like a real catalog, where a few products take most of the movements, and spread over the
+# last `days` days. The same seed always produces the same data.
+import io
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from werkzeug.security import generate_password_hash
+
+from config import Config
+
+WORDS = ['paracetamol', 'ibuprofen', 'amoxicillin', 'syrup', 'tablet', 'capsule', 'vitamin', 'ointment',
+         'insulin', 'bandage', 'gauze', 'saline', 'cough', 'antacid', 'zinc', 'iron', 'folic', 'calcium']
+PACKAGING = ['box', 'bottle', 'pack', 'carton', 'sachet']
+SUPPLIERS = [f"supplier {i}" for i in range(20)]
+
+# every generated user signs in with this password
+PASSWORD = 'bench-password'
+
+# share of movements that are sales; the rest are restocks
+STOCK_OUT_RATIO = 0.8
+
+
+class Dataset:
+    def __init__(self, catalog, cumulative_weights, user_ids, user_names, seed):
+        self.catalog = catalog  # [(product_id, product_name)]
+        self.cumulative_weights = cumulative_weights
+        self.user_ids = user_ids
+        self.user_names = user_names
+        self.rng = random.Random(seed)
+
+    def product(self, rng=None):
+        # a product drawn with the catalog's demand skew
+        return (rng or self.rng).choices(self.catalog, cum_weights=self.cumulative_weights)[0]
+
+
+def _copy(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join('\\N' if value is None else str(value) for value in row) + '\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table}({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def generate(conn, products, users, transactions, days=90, skew=1.1, seed=1):
+    # Loads the data into the current schema, which must be empty, and returns a Dataset to draw
+    # requests from. Inventory starts high enough that no generated sale runs out of stock.
+    rng = random.Random(seed)
+    names = [f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}" for i in range(products)]
+    # rank 1 is the best seller; ranks are shuffled so popularity does not follow product_id
+    ranks = list(range(1, products + 1))
+    rng.shuffle(ranks)
+    cumulative_weights = list(accumulate(1 / rank ** skew for rank in ranks))
+
+    with conn.cursor() as cursor:
+        _copy(cursor, 'products', ('product_name', 'packaging', 'supplier'),
+              ((name, rng.choice(PACKAGING), rng.choice(SUPPLIERS)) for name in names))
+        cursor.execute("SELECT product_id, product_name FROM products ORDER BY product_id")
+        catalog = cursor.fetchall()
+
+        movements = []
+        sold = [0] * products
+        start = datetime.now() - timedelta(days=days)
+        for position in rng.choices(range(products), cum_weights=cumulative_weights, k=transactions):
+            if rng.random() < STOCK_OUT_RATIO:
+                movement = ('stock out', rng.randint(1, 5))
+                sold[position] += movement[1]
+            else:
+                movement = ('stock in', rng.randint(10, 100))
+            movements.append((position, movement, start + timedelta(seconds=rng.uniform(0, days * 86400))))
+
+        _copy(cursor, 'inventory',
+              ('product_id', 'product_name', 'packaging', 'category', 'unit_price', 'quantity_available',
+               'minimum_balance', 'supplier'),
+              ((product_id, product_name, 'box', rng.choice(WORDS), f"{rng.uniform(0.5, 200):.2f}",
+                sold[position] + rng.randint(0, 500), rng.randint(0, 50), 'bench')
+               for position, (product_id, product_name) in enumerate(catalog)))
+
+        # one hash for all users, hashing thousands of passwords would dominate the setup
+        password_hash = generate_password_hash(PASSWORD, Config.PASSWORD_HASH_METHOD)
+        user_names = [f"user{i}" for i in range(users)]
+        _copy(cursor, 'users', ('user_name', 'account_name', 'password', 'role'),
+              ((name, 'bench', password_hash, 'admin') for name in user_names))
+        cursor.execute("SELECT user_id FROM users ORDER BY user_id")
+        user_ids = [row[0] for row in cursor.fetchall()]
+
+        # in time order like a real ledger; through the triggers, so rollups and inventory match
+        movements.sort(key=lambda movement: movement[2])
+        _copy(cursor, 'transactions',
+              ('product_id', 'product_name', 'quantity', 'transaction_party', 'entered_by', 'transaction_type',
+               'transaction_date'),
+              ((catalog[position][0], catalog[position][1], quantity, 'bench', rng.choice(user_ids),
+                transaction_type, transaction_date)
+               for position, (transaction_type, quantity), transaction_date in movements))
+        cursor.execute("ANALYZE")
+    conn.commit()
+    return Dataset(catalog, cumulative_weights, user_ids, user_names, seed)
+
@@ -0,0 +1,146 @@
+# Throughput and p50/p95/p99 latency of /get-item, /get-all-records, /update-stock and /log-in as the data
+# grows. For every catalog size it migrates a scratch schema, loads a Zipf-skewed synthetic store
+# (benchmarks/data.py) and drives each endpoint through the Flask app from --concurrency client threads.
+# Needs the database from capstone.env.
+#
+#   python -m benchmarks.endpoints --products 1000 100000 --concurrency 1 8 32 --output endpoints.json
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+import models
+from app import app
+from benchmarks.common import latency_summary, scratch_schema, timer, write_results
+from benchmarks.data import PASSWORD, WORDS, generate
+from config import Config
+from migrations import migrate
+
+ENDPOINTS = ('get-item', 'get-all-records', 'update-stock', 'log-in')
+
+
+def build_requests(endpoint, dataset, count, rng, search_ratio):
+    # (method, path, query, body) tuples; products are drawn with the data's demand skew
+    requests = []
+    for _ in range(count):
+        if endpoint == 'get-item':
+            product_id, product_name = dataset.product(rng)
+            if rng.random() < search_ratio:
+                term = rng.choice([word for word in product_name.split() if word in WORDS])
+                requests.append(('GET', '/get-item', f'search_item={term}', b''))
+            else:
+                requests.append(('GET', '/get-item', f'search_item={product_id}', b''))
+        elif endpoint == 'get-all-records':
+            requests.append(('GET', '/get-all-records', '', b''))
+        elif endpoint == 'update-stock':
+            product_id, product_name = dataset.product(rng)
+            body = {'product_id': product_id, 'product_name': product_name, 'quantity': 1,
+                    'transaction_party': 'bench', 'transaction_type': rng.choice(('stock in', 'stock out'))}
+            requests.append(('POST', '/update-stock', '', json.dumps(body).encode()))
+        else:
+            body = {'user_name': rng.choice(dataset.user_names), 'password': PASSWORD}
+            requests.append(('POST', '/log-in', '', json.dumps(body).encode()))
+    return requests
+
+
+def session_cookie(user_id):
+    # what /log-in would set for the user
+    return app.session_interface.get_signing_serializer(app).dumps({'user_id': user_id})
+
+
+def drive(requests, concurrency, cookies):
+    # every client thread is signed in as one of the users and sends requests until none are left
+    pending = iter(requests)
+    lock = threading.Lock()
+    latencies = []
+    statuses = Counter()
+
+    def client(cookie):
+        test_client = app.test_client()
+        test_client.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            method, path, query, body = request
+            started = time.perf_counter()
+            response = test_client.open(path, method=method, query_string=query, data=body,
+                                        content_type='application/json')
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] += 1
+
+    clients = [threading.Thread(target=client, args=(cookies[i % len(cookies)],)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    results = latency_summary(latencies, sum(count for status, count in statuses.items() if status >= 400),
+                              time.perf_counter() - started)
+    results['statuses'] = {str(status): count for status, count in sorted(statuses.items())}
+    return results
+
+
+def run(products, args):
+    rng = random.Random(args.seed)
+    transactions = products * args.transactions_per_product
+    results = {'products': products, 'users': args.users, 'transactions': transactions}
+    with scratch_schema('bench_endpoints'):
+        migrate()
+        conn = models.connect_to_db()
+        try:
+            with timer(results, 'setup_seconds'):
+                dataset = generate(conn, products, args.users, transactions, args.days, args.skew, args.seed)
+        finally:
+            conn.close()
+
+        cookies = [session_cookie(user_id) for user_id in dataset.user_ids]
+        results['endpoints'] = {}
+        for endpoint in args.endpoints:
+            count = args.all_records_requests if endpoint == 'get-all-records' else args.requests
+            drive(build_requests(endpoint, dataset, args.warmup, rng, args.search_ratio), 1, cookies)
+            results['endpoints'][endpoint] = [
+                {'concurrency': concurrency,
+                 **drive(build_requests(endpoint, dataset, count, rng, args.search_ratio), concurrency, cookies)}
+                for concurrency in args.concurrency
+            ]
+        # the next size starts with new connections to the new schema
+        models.close_pool()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Endpoint throughput and latency by data size')
+    parser.add_argument('--products', type=int, nargs='+', default=[1000, 100000], help='catalog sizes to run')
+    parser.add_argument('--transactions-per-product', type=int, default=20)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of product demand')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=1000, help='requests per endpoint and concurrency')
+    parser.add_argument('--all-records-requests', type=int, default=50,
+                        help='requests per concurrency for /get-all-records, which reads the whole inventory')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests before each endpoint')
+    parser.add_argument('--search-ratio', type=float, default=0.5,
+                        help='share of /get-item requests that search by name instead of id')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--group-commit', action='store_true',
+                        help='write /update-stock movements through the group commit writer')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.group_commit:
+        Config.GROUP_COMMIT_ENABLED = True
+    runs = [run(products, args) for products in args.products]
+    write_results({'benchmark': 'endpoints', 'parameters': vars(args), 'runs': runs}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# Concurrent stock movements on a single product. The oversell run has --concurrency clients race to
+# take one unit each of a product with --stock units until twice as many have been attempted; exactly
+# --stock may succeed and the balance must end at zero. The throughput run has the clients send a mix
+# of stock ins and outs of that product for --seconds, with the product normal and then hot (its stock
+# ins spread over --shards credit shards, folded every --fold-interval seconds), and checks that
+# the balance plus the unfolded credits match the movements that were committed. Every run goes
+# through both inventory trigger modes. Needs the database from capstone.env.
+#
+#   python -m benchmarks.hot_sku --concurrency 1 8 32 --seconds 10 --output hot_sku.json
+import argparse
+import random
+import threading
+import time
+
+import psycopg2
+
+import models
+from benchmarks.common import create_schema, latency_summary, scratch_schema, write_results
+from benchmarks.trigger_modes import seed
+from hot_products import add_hot_product, fold_credits
+
+INSERT_MOVEMENT = """
+    INSERT INTO transactions(product_id, product_name, quantity, transaction_party, entered_by, transaction_type)
+    VALUES (%s, %s, %s, 'bench', %s, %s)
+"""
+
+
+def set_stock(conn, product_id, quantity):
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM inventory_credit_shards WHERE product_id = %s", (product_id,))
+        cursor.execute("UPDATE inventory SET quantity_available = %s WHERE product_id = %s", (quantity, product_id))
+    conn.commit()
+
+
+def stock(conn, product_id):
+    # (inventory balance, unfolded credits)
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT quantity_available,
+                   COALESCE((SELECT SUM(quantity) FROM inventory_credit_shards WHERE product_id = %s), 0)
+            FROM inventory WHERE product_id = %s
+        """, (product_id, product_id))
+        balance, credits = cursor.fetchone()
+    conn.commit()
+    return balance, int(credits)
+
+
+def run_clients(concurrency, work):
+    # work(conn, rng, tally) is called by every client thread on a connection of its own
+    tally = {'latencies': [], 'ok': 0, 'insufficient': 0, 'errors': 0, 'stock_in': 0, 'stock_out': 0}
+    lock = threading.Lock()
+
+    def client(number):
+        conn = models.connect_to_db()
+        try:
+            own = {key: [] if key == 'latencies' else 0 for key in tally}
+            work(conn, random.Random(number), own)
+        finally:
+            conn.close()
+        with lock:
+            for key, value in own.items():
+                tally[key] += value
+
+    clients = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+    started = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return tally, time.perf_counter() - started
+
+
+def move(conn, product, user_id, quantity, transaction_type, tally):
+    product_id, product_name = product
+    started = time.perf_counter()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(INSERT_MOVEMENT, (product_id, product_name, quantity, user_id, transaction_type))
+        conn.commit()
+        tally['ok'] += 1
+        tally['stock_in' if transaction_type == 'stock in' else 'stock_out'] += quantity
+    except psycopg2.Error as e:
+        conn.rollback()
+        if 'Insufficient stock' in (e.diag.message_primary or ''):
+            tally['insufficient'] += 1
+        else:
+            tally['errors'] += 1
+    tally['latencies'].append(time.perf_counter() - started)
+
+
+def oversell(conn, product, user_id, concurrency, units):
+    set_stock(conn, product[0], units)
+    attempts = iter(range(units * 2))
+    lock = threading.Lock()
+
+    def work(client_conn, rng, tally):
+        while True:
+            with lock:
+                if next(attempts, None) is None:
+                    return
+            move(client_conn, product, user_id, 1, 'stock out', tally)
+
+    tally, seconds = run_clients(concurrency, work)
+    balance, _ = stock(conn, product[0])
+    return {
+        'concurrency': concurrency,
+        'succeeded': tally['ok'],
+        'rejected': tally['insufficient'],
+        'errors': tally['errors'],
+        'final_balance': balance,
+        'oversold': max(0, tally['ok'] - units) + max(0, -balance),
+        'stock_outs_per_second': tally['ok'] / seconds
+    }
+
+
+def throughput(conn, product, user_id, concurrency, args, hot):
+    set_stock(conn, product[0], args.stock)
+    stop = threading.Event()
+    folder = None
+    if hot:
+        def fold_loop():
+            fold_conn = models.connect_to_db()
+            try:
+                with fold_conn.cursor() as cursor:
+                    while not stop.wait(args.fold_interval):
+                        fold_credits(cursor)
+                        fold_conn.commit()
+            finally:
+                fold_conn.close()
+
+        folder = threading.Thread(target=fold_loop)
+        folder.start()
+
+    deadline = time.perf_counter() + args.seconds
+
+    def work(client_conn, rng, tally):
+        while time.perf_counter() < deadline:
+            transaction_type = 'stock in' if rng.random() < args.stock_in_ratio else 'stock out'
+            move(client_conn, product, user_id, rng.randint(1, 5), transaction_type, tally)
+
+    tally, seconds = run_clients(concurrency, work)
+    stop.set()
+    if folder:
+        folder.join()
+    balance, credits = stock(conn, product[0])
+    expected = args.stock + tally['stock_in'] - tally['stock_out']
+    return {
+        'concurrency': concurrency,
+        **latency_summary(tally['latencies'], tally['errors'], seconds),
+        'insufficient': tally['insufficient'],
+        'final_balance': balance,
+        'unfolded_credits': credits,
+        'consistent': balance + credits == expected and balance >= 0
+    }
+
+
+def run(mode, args):
+    results = {'mode': mode}
+    with scratch_schema(f"bench_hot_sku_{mode}"):
+        create_schema(trigger_mode=mode)
+        conn = models.connect_to_db()
+        try:
+            catalog, user_id = seed(conn, 1)
+            product = catalog[0]
+            results['oversell'] = [oversell(conn, product, user_id, concurrency, args.oversell_stock)
+                                   for concurrency in args.concurrency]
+            results['normal'] = [throughput(conn, product, user_id, concurrency, args, hot=False)
+                                 for concurrency in args.concurrency]
+            with conn.cursor() as cursor:
+                add_hot_product(cursor, product[0], args.shards)
+            conn.commit()
+            results['hot'] = [throughput(conn, product, user_id, concurrency, args, hot=True)
+                              for concurrency in args.concurrency]
+        finally:
+            conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Oversell check and throughput of concurrent movements of one product')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--oversell-stock', type=int, default=500, help='units the oversell run starts with')
+    parser.add_argument('--stock', type=int, default=10000, help='units the throughput runs start with')
+    parser.add_argument('--seconds', type=float, default=10, help='length of each throughput run')
+    parser.add_argument('--stock-in-ratio', type=float, default=0.5)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--fold-interval', type=float, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    runs = [run(mode, args) for mode in models.INVENTORY_TRIGGER_MODES]
+    write_results({'benchmark': 'hot_sku', 'parameters': vars(args), 'runs': runs}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# Encoding throughput of inventory rows (Decimal unit_price, datetime updated_at) by each JSON provider:
+# Flask's default provider on a dict per row as /get-all-records used to build them, and the providers of
+# json_provider.py on dicts, on the cursor's tuples as one array (encode_array) and one object per row as
+# for NDJSON (encode_rows). Every encoder's output is checked to decode to the same records. Needs no
+# database.
+#
+#   python -m benchmarks.json_encoding --rows 10000 100000 --output json_encoding.json
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app import INVENTORY_COLUMNS
+from benchmarks.common import write_results
+from benchmarks.data import WORDS
+from json_provider import OrjsonProvider, StdlibProvider, orjson
+
+
+def inventory_rows(count, seed):
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    return [
+        (product_id, ' '.join(rng.choices(WORDS, k=3)), rng.choice(('box', 'carton', 'pallet')),
+         rng.choice(WORDS), Decimal(rng.randint(100, 100000)) / 100, rng.randint(0, 5000), rng.randint(0, 100),
+         f"supplier {rng.randint(1, 50)}", started + timedelta(seconds=rng.randint(0, 365 * 86400)))
+        for product_id in range(1, count + 1)
+    ]
+
+
+def encoders():
+    # name -> function of the rows returning the JSON array
+    flask_default = DefaultJSONProvider(Flask(__name__))
+    providers = {'stdlib': StdlibProvider(Flask(__name__))}
+    if orjson is not None:
+        providers['orjson'] = OrjsonProvider(Flask(__name__))
+
+    functions = {
+        'flask-default-dicts': lambda rows: flask_default.dumps(
+            [dict(zip(INVENTORY_COLUMNS, row)) for row in rows], separators=(',', ':'))
+    }
+    for name, provider in providers.items():
+        functions[f'{name}-dicts'] = lambda rows, provider=provider: provider.dumps(
+            [dict(zip(INVENTORY_COLUMNS, row)) for row in rows], separators=(',', ':'))
+        functions[f'{name}-rows'] = lambda rows, provider=provider: provider.encode_array(INVENTORY_COLUMNS, rows)
+        functions[f'{name}-ndjson'] = lambda rows, provider=provider: (
+            '[' + ','.join(provider.encode_rows(INVENTORY_COLUMNS, rows)) + ']')
+    return functions
+
+
+def run(count, args):
+    rows = inventory_rows(count, args.seed)
+    results = {'rows': count, 'encoders': []}
+    expected = None
+    for name, encode in encoders().items():
+        encoded = encode(rows)
+        if expected is None:
+            expected = json.loads(encoded)
+        elif json.loads(encoded) != expected:
+            raise SystemExit(f"{name} does not encode the same records")
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            encode(rows)
+            timings.append(time.perf_counter() - started)
+        seconds = min(timings)
+        results['encoders'].append({
+            'mode': name,
+            'seconds': seconds,
+            'rows_per_second': count / seconds,
+            'megabytes_per_second': len(encoded.encode()) / seconds / 1e6
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON encoding throughput of inventory rows')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per encoder, the fastest is reported')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    runs = [run(count, args) for count in args.rows]
+    write_results({'benchmark': 'json_encoding', 'orjson': orjson is not None, 'parameters': vars(args),
+                   'runs': runs}, args.output)
+
+
+if __name__ == '__main__':
+    main()
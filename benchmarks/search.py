@@ -0,0 +1,108 @@
+# Checks that /get-item name searches stay index-backed as the catalog grows. For every catalog size
+# it loads synthetic products into a scratch schema, verifies with EXPLAIN that the query never
+# sequentially scans inventory and times exact, typo and prefix searches.
+#
+#   python -m benchmarks.search --sizes 10000 100000 1000000
+import argparse
+import json
+import random
+import time
+
+import models
+from benchmarks.common import create_schema, scratch_schema, write_results
+from benchmarks.data import WORDS
+from config import Config
+from product_search import THRESHOLD_SQL, search_statement
+
+
+def load_catalog(conn, size):
+    with conn.cursor() as cursor:
+        # names are built in SQL so a million-row catalog loads without a Python loop
+        cursor.execute("""
+            INSERT INTO products(product_name, packaging, supplier)
+            SELECT (%(words)s::text[])[1 + (i * 7) %% cardinality(%(words)s::text[])] || ' ' ||
+                   (%(words)s::text[])[1 + (i * 13) %% cardinality(%(words)s::text[])] || ' ' || i,
+                   'box', 'bench'
+            FROM generate_series(1, %(size)s) AS i
+        """, {'words': WORDS, 'size': size})
+        cursor.execute("""
+            INSERT INTO inventory(product_id, product_name, packaging, category, unit_price, quantity_available,
+                                  minimum_balance, supplier)
+            SELECT product_id, product_name, packaging, 'bench', 1.00, 100, 10, supplier FROM products
+        """)
+        cursor.execute("ANALYZE products; ANALYZE inventory")
+    conn.commit()
+
+
+def typo(word, rng):
+    position = rng.randrange(len(word))
+    return word[:position] + word[position + 1:]
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def measure(conn, term, mode, repeat):
+    sql, params = search_statement(term, mode=mode)
+    with conn.cursor() as cursor:
+        cursor.execute(THRESHOLD_SQL, (Config.SEARCH_SIMILARITY_THRESHOLD,))
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scans = sorted({node['Node Type'] for node in plan_nodes(plan[0]['Plan']) if 'Scan' in node['Node Type']})
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append(time.perf_counter() - started)
+    conn.rollback()
+    timings.sort()
+    return {
+        'term': term,
+        'mode': mode,
+        'scans': scans,
+        'index_backed': 'Seq Scan' not in scans,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'max_ms': timings[-1] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search latency and plans by catalog size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    runs = []
+    for size in args.sizes:
+        with scratch_schema('bench_search'):
+            create_schema()
+            conn = models.connect_to_db()
+            try:
+                load_catalog(conn, size)
+                word = rng.choice(WORDS)
+                runs.append({
+                    'catalog_size': size,
+                    'queries': [
+                        measure(conn, word, 'fuzzy', args.repeat),
+                        measure(conn, typo(word, rng), 'fuzzy', args.repeat),
+                        measure(conn, word[:4], 'prefix', args.repeat)
+                    ]
+                })
+            finally:
+                conn.close()
+
+    write_results({'benchmark': 'search', 'parameters': vars(args), 'runs': runs}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# Runs every benchmark with the same settings and saves their JSON results in one directory per commit,
+# e.g. benchmark-results/1c41fd3/endpoints.json. Compare two runs with benchmarks.compare.
+#
+#   python -m benchmarks.suite --quick
+#   python -m benchmarks.compare benchmark-results/1c41fd3 benchmark-results/795b14a
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks.common import git_commit
+
+# arguments of every benchmark, full and --quick
+BENCHMARKS = {
+    'endpoints': (['--products', '1000', '100000'], ['--products', '1000', '--requests', '200', '--concurrency', '1', '8']),
+    'trigger_modes': ([], ['--transactions', '20000']),
+    'search': ([], ['--sizes', '10000', '100000']),
+    'async_concurrency': ([], ['--requests', '500', '--concurrency', '1', '32']),
+    'hot_sku': ([], ['--concurrency', '1', '8', '--seconds', '2']),
+    'json_encoding': ([], ['--rows', '1000', '10000']),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all benchmarks and save the results by commit')
+    parser.add_argument('--output-dir', help='defaults to benchmark-results/<commit>')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help='smaller data and fewer requests')
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.join('benchmark-results', (git_commit() or 'unknown')[:7])
+    os.makedirs(output_dir, exist_ok=True)
+    failed = []
+    for name in args.only:
+        full, quick = BENCHMARKS[name]
+        path = os.path.join(output_dir, f"{name}.json")
+        print(f"Running {name} -> {path}", file=sys.stderr)
+        command = [sys.executable, '-m', f'benchmarks.{name}', *(quick if args.quick else full), '--output', path]
+        if subprocess.run(command, stdout=subprocess.DEVNULL).returncode != 0:
+            failed.append(name)
+    if failed:
+        sys.exit(f"Failed: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
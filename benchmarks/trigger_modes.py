@@ -0,0 +1,89 @@
+# Compares the row-level and statement-level inventory triggers by loading the same transactions
+# through each, and through no trigger at all to get the cost of each trigger per inserted
+# transaction. Needs the database from capstone.env; all work happens in scratch schemas.
+#
+#   python -m benchmarks.trigger_modes --products 1000 --transactions 100000 --batch 1000
+import argparse
+import random
+
+from psycopg2.extras import execute_values
+
+import models
+from benchmarks.common import create_schema, scratch_schema, timer, write_results
+
+
+def seed(conn, products):
+    with conn.cursor() as cursor:
+        execute_values(cursor, "INSERT INTO products(product_name, packaging, supplier) VALUES %s",
+                       [(f"product {i}", 'box', 'bench') for i in range(products)], page_size=1000)
+        cursor.execute("""
+            INSERT INTO inventory(product_id, product_name, packaging, category, unit_price, quantity_available,
+                                  minimum_balance, supplier)
+            SELECT product_id, product_name, packaging, 'bench', 1.00, 1000000, 0, supplier FROM products
+        """)
+        cursor.execute("INSERT INTO users(user_name, account_name, password, role) VALUES('bench', 'bench', '-', 'admin') "
+                       "RETURNING user_id")
+        user_id = cursor.fetchone()[0]
+        cursor.execute("SELECT product_id, product_name FROM products")
+        catalog = cursor.fetchall()
+    conn.commit()
+    return catalog, user_id
+
+
+def run(mode, products, transactions, batch, seed_value):
+    results = {'mode': mode}
+    with scratch_schema(f"bench_trigger_{mode}"):
+        create_schema(trigger_mode='row' if mode == 'none' else mode)
+        conn = models.connect_to_db()
+        try:
+            if mode == 'none':
+                with conn.cursor() as cursor:
+                    cursor.execute("DROP TRIGGER update_inventory_trigger ON transactions")
+                conn.commit()
+            catalog, user_id = seed(conn, products)
+            rng = random.Random(seed_value)
+            rows = []
+            for _ in range(transactions):
+                product_id, product_name = rng.choice(catalog)
+                rows.append((product_id, product_name, rng.randint(1, 5), 'bench', user_id,
+                             rng.choice(('stock in', 'stock out'))))
+
+            with conn.cursor() as cursor, timer(results, 'seconds'):
+                for start in range(0, len(rows), batch):
+                    execute_values(cursor, """
+                        INSERT INTO transactions(product_id, product_name, quantity, transaction_party, entered_by,
+                                                 transaction_type)
+                        VALUES %s
+                    """, rows[start:start + batch], page_size=batch)
+                    conn.commit()
+        finally:
+            conn.close()
+    results['transactions_per_second'] = transactions / results['seconds']
+    results['microseconds_per_transaction'] = results['seconds'] / transactions * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the row and statement inventory triggers')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=1000, help='rows per multi-row INSERT')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    runs = [run(mode, args.products, args.transactions, args.batch, args.seed)
+            for mode in ('none',) + models.INVENTORY_TRIGGER_MODES]
+    baseline = runs[0]['microseconds_per_transaction']
+    for result in runs[1:]:
+        result['trigger_microseconds_per_transaction'] = result['microseconds_per_transaction'] - baseline
+    results = {
+        'benchmark': 'trigger_modes',
+        'parameters': vars(args),
+        'runs': runs
+    }
+    write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
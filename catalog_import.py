@@ -0,0 +1,225 @@
+# Bulk catalog import: streams a CSV or NDJSON file into a staging table with COPY, validates and
+# resolves it with set-based SQL and merges it into products and inventory in one transaction.
+#
+#   python -m catalog_import catalog.csv
+#   python -m catalog_import catalog.ndjson --format ndjson
+import argparse
+import csv
+import io
+import json
+import sys
+
+from psycopg2 import sql
+
+CATALOG_COLUMNS = ['product_name', 'packaging', 'supplier', 'category', 'unit_price', 'quantity', 'minimum_balance']
+REQUIRED_COLUMNS = ['product_name', 'packaging', 'supplier']
+MAX_REPORTED_REJECTIONS = 1000
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+class _ChunkReader:
+    # file-like read() over an iterator of str chunks, for copy_expert
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _ndjson_as_csv(lines, rows_per_chunk=1000):
+    # one CSV line per NDJSON line; lines that are not JSON objects keep their error for the report
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    pending = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("expected a JSON object")
+            writer.writerow([_csv_value(item.get(column)) for column in CATALOG_COLUMNS] + [None])
+        except ValueError as e:
+            writer.writerow([None] * len(CATALOG_COLUMNS) + [f"invalid JSON: {e}"])
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+            pending = 0
+    if pending:
+        yield out.getvalue()
+
+
+def _csv_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+
+def _read_csv_header(stream):
+    line = stream.readline()
+    if isinstance(line, bytes):
+        line = line.decode('utf-8-sig')
+    columns = [column.strip() for column in next(csv.reader([line]), [])]
+    unknown = [column for column in columns if column not in CATALOG_COLUMNS]
+    if unknown:
+        raise CatalogImportError(f"unknown columns: {', '.join(unknown)}")
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise CatalogImportError(f"missing the following required columns: {', '.join(missing)}")
+    return columns
+
+
+def import_catalog(conn, stream, file_format='csv'):
+    # Loads the stream and merges it into products and inventory. Rows with a unit_price also get an
+    # inventory row; an existing inventory row keeps its quantity and gets the new category, price
+    # and minimum balance. Returns a report dict. Nothing is written if the import fails.
+    if file_format == 'csv':
+        columns = _read_csv_header(stream)
+        source = stream
+    elif file_format == 'ndjson':
+        columns = CATALOG_COLUMNS + ['error']
+        source = _ChunkReader(_ndjson_as_csv(stream))
+    else:
+        raise CatalogImportError("format must be 'csv' or 'ndjson'")
+
+    cursor = conn.cursor()
+    try:
+        # a temporary table is private to the import and, like an unlogged table, skips the WAL
+        cursor.execute("""
+        CREATE TEMPORARY TABLE catalog_staging(
+            line_no BIGSERIAL,
+            product_name TEXT,
+            packaging TEXT,
+            supplier TEXT,
+            category TEXT,
+            unit_price TEXT,
+            quantity TEXT,
+            minimum_balance TEXT,
+            error TEXT
+        ) ON COMMIT DROP
+        """)
+        copy = sql.SQL("COPY catalog_staging ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.SQL(', ').join(sql.Identifier(column) for column in columns))
+        cursor.copy_expert(copy.as_string(conn), source)
+        rows = cursor.rowcount
+
+        cursor.execute("""
+        UPDATE catalog_staging SET error = CASE
+            WHEN coalesce(btrim(product_name), '') = '' THEN 'product_name is required'
+            WHEN coalesce(btrim(packaging), '') = '' THEN 'packaging is required'
+            WHEN coalesce(btrim(supplier), '') = '' THEN 'supplier is required'
+            WHEN length(product_name) > 100 OR length(packaging) > 100 OR length(supplier) > 100
+                 OR length(category) > 100 THEN 'text fields are limited to 100 characters'
+            WHEN unit_price !~ '^\\s*\\d{1,8}(\\.\\d{1,2})?\\s*$' THEN 'unit_price must be a non-negative number with at most two decimals'
+            WHEN quantity !~ '^\\s*\\d{1,9}\\s*$' THEN 'quantity must be a non-negative integer'
+            WHEN minimum_balance !~ '^\\s*\\d{1,9}\\s*$' THEN 'minimum_balance must be a non-negative integer'
+            WHEN quantity IS NOT NULL AND unit_price IS NULL THEN 'quantity needs a unit_price'
+        END
+        WHERE error IS NULL;
+
+        -- the last line for a product wins
+        UPDATE catalog_staging s SET error = 'superseded by line ' || later.line_no
+        FROM (
+            SELECT product_name, packaging, supplier, max(line_no) AS line_no
+            FROM catalog_staging WHERE error IS NULL
+            GROUP BY product_name, packaging, supplier
+            HAVING count(*) > 1
+        ) later
+        WHERE s.error IS NULL AND s.product_name = later.product_name AND s.packaging = later.packaging
+          AND s.supplier = later.supplier AND s.line_no < later.line_no;
+        """)
+
+        cursor.execute("""
+        INSERT INTO products(product_name, packaging, supplier)
+        SELECT product_name, packaging, supplier FROM catalog_staging WHERE error IS NULL
+        ON CONFLICT (product_name, packaging, supplier) DO NOTHING
+        """)
+        products_created = cursor.rowcount
+
+        # product ids are resolved for all lines in one join on the unique product key
+        cursor.execute("""
+        WITH merged AS (
+            INSERT INTO inventory(product_id, product_name, packaging, category, unit_price, quantity_available,
+                                  minimum_balance, supplier)
+            SELECT p.product_id, s.product_name, s.packaging, s.category, s.unit_price::DECIMAL(10, 2),
+                   coalesce(s.quantity::INT, 0), s.minimum_balance::INT, s.supplier
+            FROM catalog_staging s
+            JOIN products p ON p.product_name = s.product_name AND p.packaging = s.packaging AND p.supplier = s.supplier
+            WHERE s.error IS NULL AND s.unit_price IS NOT NULL
+            ON CONFLICT (product_id) DO UPDATE
+            SET category = EXCLUDED.category, unit_price = EXCLUDED.unit_price,
+                minimum_balance = EXCLUDED.minimum_balance, updated_at = NOW()
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+        """)
+        inventory_inserted, inventory_updated = cursor.fetchone()
+
+        cursor.execute("SELECT count(*) FROM catalog_staging WHERE error IS NOT NULL")
+        rejected_count = cursor.fetchone()[0]
+        cursor.execute("""
+        SELECT line_no, error FROM catalog_staging WHERE error IS NOT NULL ORDER BY line_no LIMIT %s
+        """, (MAX_REPORTED_REJECTIONS,))
+        rejected = [{"row": line_no, "error": error} for line_no, error in cursor.fetchall()]
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return {
+        "rows": rows,
+        "products_created": products_created,
+        "inventory_inserted": inventory_inserted,
+        "inventory_updated": inventory_updated,
+        "rejected_count": rejected_count,
+        "rejected": rejected
+    }
+
+
+def main():
+    import models
+
+    parser = argparse.ArgumentParser(description='Import a product catalog into products and inventory')
+    parser.add_argument('path', help="CSV or NDJSON file, '-' for stdin")
+    parser.add_argument('--format', choices=['csv', 'ndjson'],
+                        help='defaults to ndjson for .ndjson/.jsonl files and csv otherwise')
+    args = parser.parse_args()
+
+    file_format = args.format or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    conn = models.connect_to_db()
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        stream = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8', newline='')
+        with stream:
+            report = import_catalog(conn, stream, file_format)
+    except CatalogImportError as e:
+        sys.exit(str(e))
+    finally:
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
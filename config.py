@@ -13,9 +13,81 @@ class Config:
         'database': os.getenv('DB_DATABASE'),
         'user': os.getenv('DB_USERNAME'),
         'password': os.getenv('PASSWORD'),
-        'port': os.getenv('PORT')
+        'port': os.getenv('PORT'),
+        # connection pool settings, see models.get_pool()
+        'pool_min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+        'pool_max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        'pool_max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300))
     }
+    # 'row' (FOR EACH ROW) or 'statement' (transition table) inventory trigger, see models.update_inventory_trigger()
+    INVENTORY_TRIGGER_MODE = os.getenv('INVENTORY_TRIGGER_MODE', 'row')
+    # rows fetched per round trip by the server-side cursor of /get-all-records?stream=...
+    RECORDS_STREAM_ITERSIZE = int(os.getenv('RECORDS_STREAM_ITERSIZE', 2000))
+    # pg_trgm word similarity (0-1) a name needs to match a /get-item search despite typos
+    SEARCH_SIMILARITY_THRESHOLD = float(os.getenv('SEARCH_SIMILARITY_THRESHOLD', 0.5))
+    # process-local inventory cache, kept coherent through LISTEN/NOTIFY on INVENTORY_CACHE_CHANNEL
+    INVENTORY_CACHE_ENABLED = os.getenv('INVENTORY_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    INVENTORY_CACHE_MAX_SIZE = int(os.getenv('INVENTORY_CACHE_MAX_SIZE', 10000))
+    INVENTORY_CACHE_CHANNEL = os.getenv('INVENTORY_CACHE_CHANNEL', 'inventory_changed')
+    # channel notified when an item crosses its minimum_balance, see models.low_stock_notify_trigger()
+    LOW_STOCK_CHANNEL = os.getenv('LOW_STOCK_CHANNEL', 'inventory_low_stock')
+    # monthly transactions partitions created ahead of time, see ledger_partitions.py
+    TRANSACTIONS_PARTITION_MONTHS_AHEAD = int(os.getenv('TRANSACTIONS_PARTITION_MONTHS_AHEAD', 3))
+    # demand forecasting job, see forecasting.py: 'moving_average' over FORECAST_WINDOW_DAYS or 'exponential'
+    # smoothing over FORECAST_HISTORY_DAYS; the reorder point covers FORECAST_LEAD_TIME_DAYS of demand plus
+    # FORECAST_SERVICE_Z standard deviations
+    FORECAST_METHOD = os.getenv('FORECAST_METHOD', 'moving_average')
+    FORECAST_WINDOW_DAYS = int(os.getenv('FORECAST_WINDOW_DAYS', 28))
+    FORECAST_HISTORY_DAYS = int(os.getenv('FORECAST_HISTORY_DAYS', 730))
+    FORECAST_SMOOTHING_ALPHA = float(os.getenv('FORECAST_SMOOTHING_ALPHA', 0.1))
+    FORECAST_LEAD_TIME_DAYS = float(os.getenv('FORECAST_LEAD_TIME_DAYS', 7))
+    FORECAST_SERVICE_Z = float(os.getenv('FORECAST_SERVICE_Z', 1.65))
+    # werkzeug hash method and cost for passwords, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Hashes
+    # stored with other parameters are replaced at the next log-in. Hashing runs in PASSWORD_HASH_WORKERS
+    # processes (0 hashes on the request thread) with at most PASSWORD_HASH_MAX_PENDING waiting or running
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+    # signed-in users cached per process for USER_CACHE_TTL seconds, evicted through USER_CACHE_CHANNEL, see auth.py
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))
+    USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', 10000))
+    USER_CACHE_CHANNEL = os.getenv('USER_CACHE_CHANNEL', 'users_changed')
+    # comma separated roles allowed to record stock movements and to create, import or delete products; empty
+    # allows every signed-in user
+    STOCK_WRITE_ROLES = [role.strip().lower() for role in os.getenv('STOCK_WRITE_ROLES', '').split(',') if role.strip()]
+    PRODUCT_ADMIN_ROLES = [role.strip().lower() for role in os.getenv('PRODUCT_ADMIN_ROLES', '').split(',') if role.strip()]
+    # apply pending schema migrations when the app is imported, see migrations.py
+    MIGRATE_ON_STARTUP = os.getenv('MIGRATE_ON_STARTUP', 'false').lower() in ('1', 'true', 'yes')
+    # log level of the app, and the share of records below ERROR that the request path loggers keep
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.1))
+    # distinct statement fingerprints labelled in /metrics, later ones are counted as 'other'
+    METRICS_MAX_STATEMENTS = int(os.getenv('METRICS_MAX_STATEMENTS', 500))
+    # statements taking at least SLOW_QUERY_MS are logged and kept for /admin/slow-queries, a
+    # SLOW_QUERY_EXPLAIN_RATE share of them with their plan; unset disables it, see slow_queries.py
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS')) if os.getenv('SLOW_QUERY_MS') else None
+    SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+    SLOW_QUERY_LOG_SIZE = int(os.getenv('SLOW_QUERY_LOG_SIZE', 100))
+    SLOW_QUERY_EXPLAIN_QUEUE = int(os.getenv('SLOW_QUERY_EXPLAIN_QUEUE', 10))
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 10000))
+    # comma separated roles allowed to read the admin endpoints
+    ADMIN_ROLES = [role.strip().lower() for role in os.getenv('ADMIN_ROLES', 'admin').split(',') if role.strip()]
+    # credit shards of a product marked hot, and seconds between folds of `python -m hot_products fold --every`
+    HOT_PRODUCT_SHARDS = int(os.getenv('HOT_PRODUCT_SHARDS', 8))
+    HOT_PRODUCT_FOLD_SECONDS = float(os.getenv('HOT_PRODUCT_FOLD_SECONDS', 10))
+    # /update-stock movements written by one writer thread per process, a batch and a commit every
+    # GROUP_COMMIT_INTERVAL_MS or GROUP_COMMIT_MAX_ITEMS movements, see stock_group_commit.py
+    GROUP_COMMIT_ENABLED = os.getenv('GROUP_COMMIT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    GROUP_COMMIT_INTERVAL_MS = float(os.getenv('GROUP_COMMIT_INTERVAL_MS', 5))
+    GROUP_COMMIT_MAX_ITEMS = int(os.getenv('GROUP_COMMIT_MAX_ITEMS', 200))
+    GROUP_COMMIT_MAX_PENDING = int(os.getenv('GROUP_COMMIT_MAX_PENDING', 2000))
+    GROUP_COMMIT_RESULT_TIMEOUT = float(os.getenv('GROUP_COMMIT_RESULT_TIMEOUT', 30))
+    # 'auto' (orjson when installed), 'orjson' or 'stdlib' JSON encoding of responses, see json_provider.py
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
+    # largest number of movements accepted by /update-stock/batch in one request
+    STOCK_BATCH_MAX_ITEMS = int(os.getenv('STOCK_BATCH_MAX_ITEMS', 10000))
 
 
-Debug = Config
-print(Debug.DB_PARAMETERS)
\ No newline at end of file
+Debug = Config
\ No newline at end of file
@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class ConnectionPool:
+    # Bounded pool of psycopg2 connections shared by all request threads of one process.
+    # Connections are checked before being handed out and discarded when broken. The pool
+    # remembers the pid it was created in so a forked worker never reuses its parent's sockets.
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, max_idle=300.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"invalid pool size min={min_size} max={max_size}")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = []  # (connection, time it was returned)
+        self._in_use = set()
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            'acquired': 0,
+            'acquire_failures': 0,
+            'timeouts': 0,
+            'discarded': 0,
+            'opened': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # The connections belong to the parent process. Closing them here would send a
+            # terminate message on a socket the parent still uses, so they are only dropped.
+            self._reset_state()
+
+    @property
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def prefill(self):
+        for _ in range(self.min_size):
+            conn = self._open()
+            if conn is None:
+                break
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+
+    def _open(self):
+        conn = self._connect()
+        if conn is not None:
+            with self._lock:
+                self._stats['opened'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if idle_for < 1.0:
+            # Recently returned and left idle cleanly; skip the round trip.
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._lock:
+            self._check_fork()
+            if self._closed:
+                raise PoolError("connection pool is closed")
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    conn, returned_at = self._idle.pop()
+                    idle_for = now - returned_at
+                    if self.max_idle and idle_for > self.max_idle and self._size >= self.min_size:
+                        self._discard(conn)
+                        continue
+                    self._in_use.add(conn)
+                    self._lock.release()
+                    try:
+                        healthy = self._is_healthy(conn, idle_for)
+                    finally:
+                        self._lock.acquire()
+                    if healthy:
+                        self._record_acquire(started)
+                        return conn
+                    self._in_use.discard(conn)
+                    self._discard(conn)
+                    now = time.monotonic()
+
+                if self._size < self.max_size:
+                    self._opening += 1
+                    self._lock.release()
+                    conn = None
+                    try:
+                        conn = self._connect()
+                    finally:
+                        self._lock.acquire()
+                        self._opening -= 1
+                    if conn is None:
+                        self._stats['acquire_failures'] += 1
+                        self._available.notify()
+                        raise PoolError("unable to open a database connection")
+                    self._stats['opened'] += 1
+                    self._in_use.add(conn)
+                    self._record_acquire(started)
+                    return conn
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['acquire_failures'] += 1
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"no database connection available after {timeout}s")
+                self._waiting += 1
+                try:
+                    self._available.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                self._check_fork()
+
+    def _record_acquire(self, started):
+        waited = time.monotonic() - started
+        self._stats['acquired'] += 1
+        self._stats['wait_time_total'] += waited
+        if waited > self._stats['wait_time_max']:
+            self._stats['wait_time_max'] = waited
+
+    def putconn(self, conn, discard=False):
+        with self._lock:
+            if self._pid != os.getpid() or conn not in self._in_use:
+                # Connection from before a fork or already returned.
+                return
+        # The rollback is a round trip to the server, so it is done without holding the lock. The
+        # connection stays in use until then and no other thread can be handed it.
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._lock:
+            if self._pid != os.getpid() or conn not in self._in_use:
+                return
+            self._in_use.discard(conn)
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def closeall(self):
+        with self._lock:
+            self._check_fork()
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._available.notify_all()
+
+    def stats(self):
+        with self._lock:
+            self._check_fork()
+            stats = dict(self._stats)
+            stats.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+            })
+            acquired = stats['acquired']
+            stats['wait_time_avg'] = stats['wait_time_total'] / acquired if acquired else 0.0
+            return stats
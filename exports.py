@@ -0,0 +1,209 @@
+# CSV exports of the inventory and the transactions ledger through COPY ... TO STDOUT. The rows go
+# from Postgres to the HTTP response (or a file) in chunks and are never held in Python memory.
+#
+#   python -m exports transactions --start 2024-01-01 --end 2024-02-01 --gzip -o january.csv.gz
+#   python -m exports inventory --product-id 1,2,3
+import argparse
+import queue
+import sys
+import threading
+import zlib
+from datetime import datetime
+
+import psycopg2
+
+EXPORT_TABLES = {
+    'inventory': """
+        SELECT product_id, product_name, packaging, category, unit_price, quantity_available, minimum_balance,
+               supplier, updated_at
+        FROM inventory""",
+    'transactions': """
+        SELECT transaction_id, product_id, product_name, quantity, transaction_party, entered_by, transaction_date,
+               transaction_type
+        FROM transactions""",
+}
+ORDER_BY = {'inventory': 'product_id', 'transactions': 'transaction_date, transaction_id'}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _parse_timestamp(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"{name} must be an ISO date or timestamp")
+
+
+def _parse_product_ids(value):
+    try:
+        return [int(product_id) for product_id in value.split(',') if product_id.strip()]
+    except ValueError:
+        raise ExportError("product_id must be a comma separated list of integers")
+
+
+def build_copy_sql(cursor, table, product_ids=None, start=None, end=None, category=None):
+    # COPY takes no bind parameters, so the filters are rendered with mogrify
+    if table not in EXPORT_TABLES:
+        raise ExportError(f"table must be one of: {', '.join(EXPORT_TABLES)}")
+    conditions = []
+    params = []
+    if product_ids:
+        conditions.append("product_id = ANY(%s)")
+        params.append(product_ids)
+    if table == 'transactions':
+        if start is not None:
+            conditions.append("transaction_date >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("transaction_date < %s")
+            params.append(end)
+    elif category is not None:
+        conditions.append("category = %s")
+        params.append(category)
+
+    query = EXPORT_TABLES[table]
+    if conditions:
+        query += f"\n        WHERE {' AND '.join(conditions)}"
+    query += f"\n        ORDER BY {ORDER_BY[table]}"
+    query = cursor.mogrify(query, params).decode()
+    return f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+
+
+def export_filters(args):
+    # filters from request args or CLI options as keyword arguments for build_copy_sql()
+    filters = {}
+    if args.get('product_id'):
+        filters['product_ids'] = _parse_product_ids(args.get('product_id'))
+    if args.get('start'):
+        filters['start'] = _parse_timestamp(args.get('start'), 'start')
+    if args.get('end'):
+        filters['end'] = _parse_timestamp(args.get('end'), 'end')
+    if args.get('category'):
+        filters['category'] = args.get('category')
+    return filters
+
+
+class _ExportCancelled(Exception):
+    pass
+
+
+class _ChunkWriter:
+    # write() target for copy_expert: gzips if asked and hands chunks to the response queue, blocking
+    # while it is full so a slow client slows the COPY down instead of growing memory
+    def __init__(self, chunks, cancelled, compress=False, chunk_size=64 * 1024):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self._buffer = []
+        self._buffered = 0
+        self._chunk_size = chunk_size
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self._compressor:
+            data = self._compressor.compress(data)
+        if data:
+            self._buffer.append(data)
+            self._buffered += len(data)
+            if self._buffered >= self._chunk_size:
+                self._send()
+
+    def _send(self):
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        while True:
+            if self._cancelled.is_set():
+                raise _ExportCancelled()
+            try:
+                self._chunks.put(data, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        if self._compressor:
+            self._buffer.append(self._compressor.flush())
+        self._send()
+
+
+_DONE = object()
+
+
+def stream_copy(conn, copy_sql, compress=False, max_chunks=16):
+    # Generator of response chunks. copy_expert blocks until the COPY is finished, so it runs on a
+    # helper thread feeding a bounded queue; closing the generator early stops the COPY.
+    chunks = queue.Queue(maxsize=max_chunks)
+    cancelled = threading.Event()
+    writer = _ChunkWriter(chunks, cancelled, compress)
+
+    def run():
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(copy_sql, writer)
+            writer.close()
+            result = _DONE
+        except _ExportCancelled:
+            return
+        except Exception as e:
+            result = e
+        while not cancelled.is_set():
+            try:
+                chunks.put(result, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    thread = threading.Thread(target=run, name='copy-export', daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, Exception):
+                # raised so that an HTTP response is aborted rather than ended as if complete
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export inventory or transactions as CSV')
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--product-id', dest='product_id', help='comma separated product ids')
+    parser.add_argument('--start', help='transactions on or after this date/timestamp')
+    parser.add_argument('--end', help='transactions before this date/timestamp')
+    parser.add_argument('--category', help='inventory category')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('-o', '--output', help='output file, stdout by default')
+    args = parser.parse_args()
+
+    import models
+    conn = models.connect_to_db()
+
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        with conn.cursor() as cursor:
+            copy_sql = build_copy_sql(cursor, args.table, **export_filters(vars(args)))
+        output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for chunk in stream_copy(conn, copy_sql, compress=args.gzip):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+    except (ExportError, psycopg2.Error) as e:
+        sys.exit(str(e))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
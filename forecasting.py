@@ -0,0 +1,179 @@
+# Demand forecasting for the whole catalog. Daily stock out quantities are read from the movement
+# rollups with one COPY, and demand, days of cover and a reorder point are computed for every product
+# at once with NumPy, then written to inventory_forecasts with one more COPY and an upsert.
+#
+#   python -m forecasting run
+#   python -m forecasting run --method exponential --apply
+#
+# NumPy is only needed by the job: pip install numpy
+import argparse
+import io
+import json
+import sys
+from datetime import date, timedelta
+
+from config import Config
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FORECAST_METHODS = ('moving_average', 'exponential')
+
+
+class ForecastError(ValueError):
+    pass
+
+
+def _copy_rows(cursor, query, params, columns):
+    # result of query as a float array with one row per result row, read through COPY
+    buffer = io.StringIO()
+    cursor.copy_expert(f"COPY ({cursor.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT csv)", buffer)
+    if not buffer.tell():
+        return np.empty((0, columns))
+    buffer.seek(0)
+    return np.loadtxt(buffer, delimiter=',', dtype=np.float64, ndmin=2)
+
+
+def compute_forecast(product_ids, quantities, movements, method='moving_average', window_days=28, alpha=0.1,
+                     lead_time_days=7, service_z=1.65):
+    # product_ids: ids of the inventory, quantities: their stock. movements: rows of
+    # (product_id, age in days with 0 for yesterday, quantity out), one per product and day with
+    # stock out, days without any are zero. Returns arrays of daily demand, its standard deviation
+    # over the window, days of cover (inf without demand) and the reorder point.
+    count = len(product_ids)
+    movement_ids, ages, moved = movements[:, 0], movements[:, 1].astype(np.intp), movements[:, 2]
+
+    # position of each movement's product through a table indexed by product id (ids are serial, so
+    # it stays small), dropping products that are no longer in the inventory
+    movement_ids = movement_ids.astype(np.intp)
+    size = int(max(product_ids.max() if count else 0, movement_ids.max() if len(movement_ids) else 0)) + 1
+    positions = np.full(size, -1, dtype=np.intp)
+    positions[product_ids.astype(np.intp)] = np.arange(count)
+    index = positions[movement_ids]
+    known = index >= 0
+    index, ages, moved = index[known], ages[known], moved[known]
+
+    recent = ages < window_days
+    mean = np.bincount(index[recent], weights=moved[recent], minlength=count) / window_days
+    mean_square = np.bincount(index[recent], weights=moved[recent] ** 2, minlength=count) / window_days
+    stddev = np.sqrt(np.maximum(mean_square - mean ** 2, 0))
+
+    if method == 'exponential':
+        # simple exponential smoothing starting from zero demand, written as the weighted sum it expands to
+        decay = alpha * (1 - alpha) ** np.arange(ages.max() + 1 if len(ages) else 0)
+        demand = np.bincount(index, weights=decay[ages] * moved, minlength=count)
+    elif method == 'moving_average':
+        demand = mean
+    else:
+        raise ForecastError(f"method must be one of: {', '.join(FORECAST_METHODS)}")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(demand > 0, quantities / demand, np.inf)
+    reorder_point = np.ceil(demand * lead_time_days + service_z * stddev * np.sqrt(lead_time_days))
+    return demand, stddev, days_of_cover, reorder_point
+
+
+def run_forecast(conn, method=None, apply=False):
+    # Forecasts every inventory item and stores the results in inventory_forecasts. With apply the
+    # reorder points also become the items' minimum_balance. Commits and returns a report dict.
+    if np is None:
+        raise ForecastError("the forecasting job needs numpy, install it with: pip install numpy")
+    method = method or Config.FORECAST_METHOD
+    if method not in FORECAST_METHODS:
+        raise ForecastError(f"method must be one of: {', '.join(FORECAST_METHODS)}")
+    window_days = Config.FORECAST_WINDOW_DAYS
+    # the moving average only looks at its window, smoothing at the whole history
+    history_days = window_days if method == 'moving_average' else max(Config.FORECAST_HISTORY_DAYS, window_days)
+    end = date.today()
+
+    cursor = conn.cursor()
+    try:
+        inventory = _copy_rows(cursor, "SELECT product_id, quantity_available FROM inventory ORDER BY product_id",
+                               (), 2)
+        movements = _copy_rows(cursor, """
+            SELECT product_id, %s - day - 1, quantity_total
+            FROM transaction_daily_rollups
+            WHERE transaction_type = 'stock out' AND day >= %s AND day < %s
+        """, (end, end - timedelta(days=history_days), end), 3)
+
+        demand, stddev, days_of_cover, reorder_point = compute_forecast(
+            inventory[:, 0], inventory[:, 1], movements, method, window_days, Config.FORECAST_SMOOTHING_ALPHA,
+            Config.FORECAST_LEAD_TIME_DAYS, Config.FORECAST_SERVICE_Z)
+
+        cursor.execute("""
+        CREATE TEMPORARY TABLE forecast_staging(
+            product_id INT,
+            daily_demand DOUBLE PRECISION,
+            demand_stddev DOUBLE PRECISION,
+            days_of_cover DOUBLE PRECISION,
+            reorder_point INT
+        ) ON COMMIT DROP
+        """)
+        rows = io.StringIO()
+        np.savetxt(rows, np.column_stack([inventory[:, 0], demand, stddev, days_of_cover, reorder_point]),
+                   fmt=['%d', '%.6f', '%.6f', '%.2f', '%d'], delimiter=',')
+        rows.seek(0)
+        cursor.copy_expert("COPY forecast_staging FROM STDIN WITH (FORMAT csv)", rows)
+
+        cursor.execute("""
+        INSERT INTO inventory_forecasts(product_id, method, daily_demand, demand_stddev, days_of_cover, reorder_point,
+                                        computed_at)
+        SELECT product_id, %s, daily_demand, demand_stddev, NULLIF(days_of_cover, 'Infinity'), reorder_point, NOW()
+        FROM forecast_staging
+        ON CONFLICT (product_id) DO UPDATE
+        SET method = EXCLUDED.method, daily_demand = EXCLUDED.daily_demand, demand_stddev = EXCLUDED.demand_stddev,
+            days_of_cover = EXCLUDED.days_of_cover, reorder_point = EXCLUDED.reorder_point,
+            computed_at = EXCLUDED.computed_at
+        """, (method,))
+        forecasts = cursor.rowcount
+
+        minimum_balance_updated = 0
+        if apply:
+            cursor.execute("""
+            UPDATE inventory i SET minimum_balance = s.reorder_point, updated_at = NOW()
+            FROM forecast_staging s
+            WHERE i.product_id = s.product_id AND i.minimum_balance IS DISTINCT FROM s.reorder_point
+            """)
+            minimum_balance_updated = cursor.rowcount
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return {
+        "method": method,
+        "forecasts": forecasts,
+        "movements": len(movements),
+        "minimum_balance_updated": minimum_balance_updated
+    }
+
+
+def main():
+    import models
+
+    parser = argparse.ArgumentParser(description='Forecast demand and reorder points for the whole inventory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='compute and store the forecasts')
+    run.add_argument('--method', choices=FORECAST_METHODS, help=f'default {Config.FORECAST_METHOD}')
+    run.add_argument('--apply', action='store_true', help='set minimum_balance to the suggested reorder points')
+    args = parser.parse_args()
+
+    conn = models.connect_to_db()
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        report = run_forecast(conn, args.method, args.apply)
+    except ForecastError as e:
+        sys.exit(str(e))
+    finally:
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
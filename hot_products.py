@@ -0,0 +1,101 @@
+# Hot products: fast-moving products whose stock ins are spread over credit shards instead of
+# queueing on their inventory row (see models.create_hot_product_credits). Their inventory row
+# understates the stock by the credits not folded yet, so run `fold` every few seconds while any
+# product is hot; a stock out that finds too little stock folds its product's credits itself.
+#
+#   python -m hot_products add 42 --shards 16
+#   python -m hot_products list
+#   python -m hot_products fold --every 10
+#   python -m hot_products remove 42
+import argparse
+import sys
+import time
+
+from config import Config
+
+
+def add_hot_product(cursor, product_id, shards=None):
+    # marks a product hot, or changes its shard count; returns False if the product does not exist
+    cursor.execute("""
+        INSERT INTO hot_products(product_id, shards)
+        SELECT product_id, %s FROM products WHERE product_id = %s
+        ON CONFLICT (product_id) DO UPDATE SET shards = EXCLUDED.shards
+        RETURNING product_id
+    """, (shards or Config.HOT_PRODUCT_SHARDS, product_id))
+    return cursor.fetchone() is not None
+
+
+def remove_hot_product(cursor, product_id):
+    # Stock ins of the product update its inventory row again. The row lock taken first holds off
+    # its stock movements until the credits it had are folded and the product is no longer hot.
+    cursor.execute("SELECT 1 FROM inventory WHERE product_id = %s FOR UPDATE", (product_id,))
+    cursor.execute("DELETE FROM hot_products WHERE product_id = %s RETURNING product_id", (product_id,))
+    removed = cursor.fetchone() is not None
+    cursor.execute("SELECT f_fold_stock_credits(%s)", (product_id,))
+    return removed
+
+
+def list_hot_products(cursor):
+    # (product_id, product_name, shards, quantity_available, unfolded credits)
+    cursor.execute("""
+        SELECT h.product_id, p.product_name, h.shards, i.quantity_available,
+               COALESCE((SELECT SUM(s.quantity) FROM inventory_credit_shards s WHERE s.product_id = h.product_id), 0)
+        FROM hot_products h
+        JOIN products p ON p.product_id = h.product_id
+        LEFT JOIN inventory i ON i.product_id = h.product_id
+        ORDER BY h.product_id
+    """)
+    return cursor.fetchall()
+
+
+def fold_credits(cursor, product_id=None):
+    # moves the unfolded credits into inventory and returns the number of products folded
+    cursor.execute("SELECT f_fold_stock_credits(%s)", (product_id,))
+    return cursor.fetchone()[0]
+
+
+def main():
+    import models
+
+    parser = argparse.ArgumentParser(description='Manage hot products and fold their stock in credits')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='spread the stock ins of a product over credit shards')
+    add.add_argument('product_id', type=int)
+    add.add_argument('--shards', type=int, help=f'default {Config.HOT_PRODUCT_SHARDS}')
+    remove = commands.add_parser('remove', help='fold the credits of a product and stop sharding it')
+    remove.add_argument('product_id', type=int)
+    commands.add_parser('list', help='show the hot products and their unfolded credits')
+    fold = commands.add_parser('fold', help='fold the credits of every hot product into inventory')
+    fold.add_argument('--every', type=float, nargs='?', const=Config.HOT_PRODUCT_FOLD_SECONDS,
+                      help=f'keep folding every this many seconds (default {Config.HOT_PRODUCT_FOLD_SECONDS})')
+    args = parser.parse_args()
+
+    conn = models.connect_to_db()
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        with conn.cursor() as cursor:
+            if args.command == 'add':
+                if not add_hot_product(cursor, args.product_id, args.shards):
+                    sys.exit(f"Product ID: {args.product_id} does not exist")
+                print(f"Product ID: {args.product_id} is hot")
+            elif args.command == 'remove':
+                removed = remove_hot_product(cursor, args.product_id)
+                print(f"Product ID: {args.product_id} is {'no longer' if removed else 'not'} hot")
+            elif args.command == 'list':
+                for product_id, product_name, shards, quantity, credits in list_hot_products(cursor):
+                    print(f"{product_id}\t{product_name}\tshards={shards}\tquantity={quantity}\tunfolded={credits}")
+            else:
+                while True:
+                    print(f"Folded the credits of {fold_credits(cursor)} products")
+                    conn.commit()
+                    if args.every is None:
+                        break
+                    time.sleep(args.every)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
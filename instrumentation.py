@@ -0,0 +1,252 @@
+# Request, query and connection pool metrics in the Prometheus text format, served by /metrics, and
+# the sampled loggers used on the request paths instead of print().
+#
+# Every worker process keeps its own metrics, so scrape each worker (or sum them in Prometheus).
+# Query timings come from InstrumentedConnection, the connection_factory of models.connect_to_db():
+# its cursors time every execute() and COPY, labelled by the statement's fingerprint, i.e. its text
+# with literals and parameters replaced by ? and value lists collapsed, so that one statement is one
+# series whatever its arguments.
+import bisect
+import logging
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import g, request
+from psycopg2 import extensions, sql
+
+import slow_queries
+from config import Config
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [count per bucket and +Inf, sum]
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Gauge:
+    # read when scraped: collect() returns {label values: value}
+    def __init__(self, name, documentation, labelnames, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.collect = collect
+        _metrics.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in sorted(self.collect().items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+def render_metrics():
+    return '\n'.join(line for metric in _metrics for line in metric.render()) + '\n'
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to handle a request, until its headers are sent.',
+                             ('method', 'endpoint', 'status'))
+QUERY_DURATION = Histogram('db_query_duration_seconds', 'Time to execute a statement, by statement fingerprint.',
+                           ('statement',))
+QUERY_ERRORS = Counter('db_query_errors_total', 'Statements that raised, by statement fingerprint and error.',
+                       ('statement', 'error'))
+POOL_ACQUIRE_DURATION = Histogram('db_pool_acquire_duration_seconds', 'Time to borrow a pooled connection.',
+                                  ('pool',))
+POOL_ACQUIRE_ERRORS = Counter('db_pool_acquire_errors_total', 'Failures to borrow a pooled connection.',
+                              ('pool', 'error'))
+
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\$\d+|\b\d+(?:\.\d+)?\b")
+_VALUE_LIST = re.compile(r"\((?:\s*(?:\?|NULL|TRUE|FALSE|DEFAULT)(?:::[\w\[\]]+)?\s*,?)+\)", re.I)
+_REPEATED_LISTS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACE = re.compile(r"\s+")
+_fingerprints = set()
+_fingerprints_lock = threading.Lock()
+
+
+@lru_cache(maxsize=2048)
+def _normalize(query):
+    query = _COMMENTS.sub(' ', query)
+    query = _LITERALS.sub('?', query)
+    query = _VALUE_LIST.sub('(...)', query)
+    query = _REPEATED_LISTS.sub('(...)', query)
+    return _SPACE.sub(' ', query).strip()[:200]
+
+
+def fingerprint(query):
+    # The statement label of a query. Past METRICS_MAX_STATEMENTS distinct fingerprints new ones are
+    # counted as 'other', so ad hoc SQL cannot grow the metrics without bound.
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    statement = _normalize(query)
+    if statement not in _fingerprints:
+        with _fingerprints_lock:
+            if len(_fingerprints) >= Config.METRICS_MAX_STATEMENTS:
+                return 'other'
+            _fingerprints.add(statement)
+    return statement
+
+
+def record_query(query, seconds, error=None):
+    statement = fingerprint(query)
+    QUERY_DURATION.observe(seconds, statement)
+    if error is not None:
+        QUERY_ERRORS.inc(statement, type(error).__name__)
+    return statement
+
+
+class _TimedCursor:
+    def _timed(self, method, query, *args, params=None):
+        text = query.as_string(self) if isinstance(query, sql.Composable) else query
+        started = time.perf_counter()
+        error = None
+        try:
+            return method(query, *args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            statement = record_query(text, seconds, error)
+            if Config.SLOW_QUERY_MS is not None and seconds * 1000 >= Config.SLOW_QUERY_MS:
+                slow_queries.capture(self, statement, text, params, seconds, error)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars, params=vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, query, file, size=8192):
+        return self._timed(super().copy_expert, query, file, size)
+
+
+@lru_cache(maxsize=None)
+def _timed_cursor_class(factory):
+    if issubclass(factory, _TimedCursor):
+        return factory
+    return type(f"Timed{factory.__name__}", (_TimedCursor, factory), {})
+
+
+class InstrumentedConnection(extensions.connection):
+    # hands out cursors of the requested cursor_factory that time their statements
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = _timed_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def record_request(method, endpoint, status, seconds):
+    REQUEST_DURATION.observe(seconds, method, endpoint, str(status))
+
+
+def instrument_app(app):
+    # times every Flask request by its URL rule, so /export/<table> is one endpoint
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            record_request(request.method, endpoint, response.status_code, time.perf_counter() - started)
+        return response
+
+
+class SampleFilter(logging.Filter):
+    # passes every error and a LOG_SAMPLE_RATE share of the other records
+    def filter(self, record):
+        return record.levelno >= logging.ERROR or random.random() < Config.LOG_SAMPLE_RATE
+
+
+def sampled_logger(name):
+    # the logger of a module on a request path
+    logger = logging.getLogger(name)
+    if not any(isinstance(existing, SampleFilter) for existing in logger.filters):
+        logger.addFilter(SampleFilter())
+    return logger
+
+
+def configure_logging():
+    # does nothing when the server has already configured logging
+    logging.basicConfig(level=Config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
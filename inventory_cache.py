@@ -0,0 +1,189 @@
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+from psycopg2 import sql
+
+log = logging.getLogger(__name__)
+
+# payload sent instead of a product id list when it would not fit in one notification
+FLUSH_ALL = '*'
+
+
+class InventoryCache:
+    # Process-local LRU cache of inventory rows keyed by product_id, with an index from lower-cased
+    # product name to product ids. Rows are only served while the listener is connected; every
+    # change to inventory is announced with NOTIFY and evicts the affected ids.
+    #
+    # Reads that fill the cache pass the generation they started at, so a row read before an
+    # invalidation arrived is never stored after it.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()
+        self._names = {}
+        self._complete_names = set()
+        self._complete = False
+        self.generation = 0
+        self.listening = False
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _remove(self, product_id):
+        row = self._rows.pop(product_id, None)
+        if row is None:
+            return None
+        name = row['product_name'].lower()
+        ids = self._names.get(name)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del self._names[name]
+        self._complete_names.discard(name)
+        return row
+
+    def _store(self, row):
+        product_id = row['product_id']
+        self._remove(product_id)
+        self._rows[product_id] = row
+        self._names.setdefault(row['product_name'].lower(), set()).add(product_id)
+        while len(self._rows) > self.max_size:
+            oldest = next(iter(self._rows))
+            self._remove(oldest)
+            self._complete = False
+            self._stats['evictions'] += 1
+
+    def get(self, product_id):
+        with self._lock:
+            row = self._rows.get(product_id) if self.listening else None
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            self._rows.move_to_end(product_id)
+            self._stats['hits'] += 1
+            return row
+
+    def find_by_name(self, name):
+        # rows whose name equals name (case-insensitive), or None unless all of them are cached
+        name = name.lower()
+        with self._lock:
+            if not self.listening or name not in self._complete_names:
+                self._stats['misses'] += 1
+                return None
+            ids = sorted(self._names.get(name, ()))
+            for product_id in ids:
+                self._rows.move_to_end(product_id)
+            self._stats['hits'] += 1
+            return [self._rows[product_id] for product_id in ids]
+
+    def all_rows(self):
+        # the whole inventory, or None unless it was loaded completely and nothing changed since
+        with self._lock:
+            if not self.listening or not self._complete:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return sorted(self._rows.values(), key=lambda row: row['product_id'])
+
+    def put(self, rows, generation, name=None, complete=False):
+        # name marks rows as every row with that name, complete as the whole inventory
+        with self._lock:
+            if generation != self.generation or not self.listening:
+                return
+            if complete and len(rows) > self.max_size:
+                complete = False
+            for row in rows:
+                self._store(row)
+            if name is not None:
+                self._complete_names.add(name.lower())
+            if complete:
+                self._complete = True
+
+    def invalidate(self, product_ids=None):
+        # None drops everything, e.g. after the listener lost its connection
+        with self._lock:
+            self.generation += 1
+            self._complete = False
+            self._stats['invalidations'] += 1
+            if product_ids is None:
+                self._rows.clear()
+                self._names.clear()
+                self._complete_names.clear()
+                return
+            for product_id in product_ids:
+                if self._remove(product_id) is None:
+                    # an id we never saw may be a new row for a name we consider complete
+                    self._complete_names.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'size': len(self._rows), 'max_size': self.max_size, 'listening': self.listening})
+            return stats
+
+
+def parse_payload(payload):
+    if payload == FLUSH_ALL:
+        return None
+    return {int(product_id) for product_id in payload.split(',') if product_id}
+
+
+class InventoryCacheListener(threading.Thread):
+    # Keeps one autocommit connection LISTENing on the channel and evicts the ids of every
+    # notification. While disconnected the cache is emptied and bypassed. Also used for the user
+    # cache of auth.py, which takes the same id payloads.
+
+    def __init__(self, cache, connect, channel, retry_interval=1.0, name='inventory-cache-listener'):
+        super().__init__(name=name, daemon=True)
+        self.cache = cache
+        self.connect = connect
+        self.channel = channel
+        self.retry_interval = retry_interval
+        self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            conn = self.connect()
+            if conn is None:
+                time.sleep(self.retry_interval)
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                # changes made while we were not listening are unknown
+                self.cache.invalidate(None)
+                self.cache.listening = True
+                self._listen(conn)
+            except (psycopg2.Error, OSError) as e:
+                log.warning("%s disconnected: %s", self.name, e)
+            finally:
+                self.cache.listening = False
+                self.cache.invalidate(None)
+                try:
+                    conn.close()
+                except psycopg2.Error:
+                    pass
+            time.sleep(self.retry_interval)
+
+    def _listen(self, conn):
+        while True:
+            if select.select([conn], [], [], 5.0) == ([], [], []):
+                continue
+            conn.poll()
+            product_ids = set()
+            flush = False
+            while conn.notifies:
+                ids = parse_payload(conn.notifies.pop(0).payload)
+                if ids is None:
+                    flush = True
+                else:
+                    product_ids.update(ids)
+            if flush:
+                self.cache.invalidate(None)
+            elif product_ids:
+                self.cache.invalidate(product_ids)
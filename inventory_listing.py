@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+SORT_KEYS = ('product_id', 'updated_at')
+MAX_PAGE_SIZE = 500
+DEFAULT_PAGE_SIZE = 50
+
+LISTING_COLUMNS = """product_id, product_name, packaging, category, unit_price, quantity_available, minimum_balance,
+       supplier, updated_at"""
+
+
+class ListingError(ValueError):
+    pass
+
+
+def encode_cursor(sort, order, row):
+    # the token carries the sort key of the last row returned; clients treat it as opaque
+    value = row[sort]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({"s": sort, "o": order, "v": value, "id": row['product_id']}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort, order):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['s'] != sort or payload['o'] != order:
+            raise ListingError("cursor does not match the requested sort order")
+        value = payload['v']
+        if sort == 'updated_at':
+            value = datetime.fromisoformat(value)
+        return value, int(payload['id'])
+    except ListingError:
+        raise
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise ListingError("invalid cursor")
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ListingError(f"{name} must be an integer")
+
+
+def build_listing_query(args):
+    # Builds the keyset query for one page of inventory. Returns (sql, params, sort, order, limit).
+    # Every filter is an equality or range on an indexed column and the page boundary is a row
+    # comparison on (sort key, product_id), so a page is an index range scan without OFFSET.
+    sort = args.get('sort', 'product_id')
+    order = args.get('order', 'asc')
+    if sort not in SORT_KEYS:
+        raise ListingError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+    if order not in ('asc', 'desc'):
+        raise ListingError("order must be 'asc' or 'desc'")
+
+    limit = _int_arg(args, 'limit') or DEFAULT_PAGE_SIZE
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ListingError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    conditions = []
+    params = []
+    for column in ('category', 'supplier', 'packaging'):
+        if args.get(column) is not None:
+            conditions.append(f"{column} = %s")
+            params.append(args.get(column))
+
+    min_quantity = _int_arg(args, 'min_quantity')
+    max_quantity = _int_arg(args, 'max_quantity')
+    if min_quantity is not None:
+        conditions.append("quantity_available >= %s")
+        params.append(min_quantity)
+    if max_quantity is not None:
+        conditions.append("quantity_available <= %s")
+        params.append(max_quantity)
+    if args.get('low_stock') in ('1', 'true', 'yes'):
+        conditions.append("quantity_available <= minimum_balance")
+
+    comparison = '>' if order == 'asc' else '<'
+    token = args.get('cursor')
+    if token:
+        value, last_id = decode_cursor(token, sort, order)
+        if sort == 'product_id':
+            conditions.append(f"product_id {comparison} %s")
+            params.append(last_id)
+        else:
+            conditions.append(f"(updated_at, product_id) {comparison} (%s, %s)")
+            params.extend([value, last_id])
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_by = "product_id" if sort == 'product_id' else "updated_at, product_id"
+    if order == 'desc':
+        order_by = ', '.join(f"{column.strip()} DESC" for column in order_by.split(','))
+
+    # one extra row tells whether there is a next page
+    sql = f"SELECT {LISTING_COLUMNS} FROM inventory {where} ORDER BY {order_by} LIMIT %s"
+    params.append(limit + 1)
+    return sql, params, sort, order, limit
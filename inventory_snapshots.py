@@ -0,0 +1,164 @@
+# Point-in-time stock levels. A scheduled checkpoint stores the quantity of every product at a moment
+# in inventory_snapshots; the stock at any time is then the nearest checkpoint (or the live inventory)
+# moved forwards or backwards by the transactions in between, so the cost of a query depends on the
+# checkpoint interval rather than on the length of the ledger.
+#
+#   python -m inventory_snapshots checkpoint
+#   python -m inventory_snapshots prune --keep-days 365
+import argparse
+import sys
+from datetime import datetime
+
+# quantity a transaction adds to its product's stock
+MOVED_QUANTITY = "CASE transaction_type WHEN 'stock in' THEN quantity WHEN 'stock out' THEN -quantity ELSE 0 END"
+
+# net quantity of each product moved by the transactions in a (start, end] window
+NET_MOVEMENT_SQL = """
+    SELECT product_id, SUM({moved}) AS net
+    FROM transactions
+    WHERE transaction_date > %(start)s AND transaction_date <= %(end)s {product_filter}
+    GROUP BY product_id
+"""
+
+# stock in credits of hot products not folded into inventory yet (models.create_hot_product_credits)
+UNFOLDED_CREDITS_SQL = "SELECT product_id, SUM(quantity) AS quantity FROM inventory_credit_shards GROUP BY product_id"
+
+
+def _net_movement(product_id):
+    return NET_MOVEMENT_SQL.format(moved=MOVED_QUANTITY,
+                                   product_filter="AND product_id = %(product_id)s" if product_id is not None else "")
+
+
+def create_checkpoint(cursor, lag_minutes=10):
+    # Records the stock of every product as it was lag_minutes ago: live inventory minus everything
+    # dated after that moment. The lag keeps transactions that were still open out of the picture.
+    # Returns the checkpoint time, or None if it already existed.
+    cursor.execute("SELECT date_trunc('minute', LOCALTIMESTAMP - %s * INTERVAL '1 minute')", (lag_minutes,))
+    snapshot_at = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO inventory_snapshot_runs(snapshot_at) VALUES(%s)
+        ON CONFLICT (snapshot_at) DO NOTHING
+        RETURNING snapshot_at
+    """, (snapshot_at,))
+    if not cursor.fetchone():
+        return None
+
+    params = {'start': snapshot_at, 'end': datetime.max}
+    cursor.execute(f"""
+        WITH later AS ({_net_movement(None)}), credits AS ({UNFOLDED_CREDITS_SQL})
+        INSERT INTO inventory_snapshots(snapshot_at, product_id, quantity)
+        SELECT %(start)s, i.product_id, i.quantity_available + COALESCE(credits.quantity, 0) - COALESCE(later.net, 0)
+        FROM inventory i
+        JOIN products p ON p.product_id = i.product_id AND p.added_at <= %(start)s
+        LEFT JOIN later ON later.product_id = i.product_id
+        LEFT JOIN credits ON credits.product_id = i.product_id
+    """, params)
+    cursor.execute("UPDATE inventory_snapshot_runs SET products = %s WHERE snapshot_at = %s",
+                   (cursor.rowcount, snapshot_at))
+    return snapshot_at
+
+
+def prune_checkpoints(cursor, keep_days):
+    # drops checkpoints older than keep_days but always keeps the most recent one
+    cursor.execute("""
+        DELETE FROM inventory_snapshot_runs
+        WHERE snapshot_at < LOCALTIMESTAMP - %s * INTERVAL '1 day'
+          AND snapshot_at < (SELECT max(snapshot_at) FROM inventory_snapshot_runs)
+        RETURNING snapshot_at
+    """, (keep_days,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def stock_as_of(cursor, as_of, product_id=None):
+    # Returns (base, rows): base is the checkpoint time the answer was computed from (None for the live
+    # inventory) and rows are (product_id, product_name, quantity) as of as_of.
+    cursor.execute("""
+        SELECT (SELECT max(snapshot_at) FROM inventory_snapshot_runs WHERE snapshot_at <= %(as_of)s),
+               (SELECT min(snapshot_at) FROM inventory_snapshot_runs WHERE snapshot_at > %(as_of)s),
+               LOCALTIMESTAMP
+    """, {'as_of': as_of})
+    before, after, now = cursor.fetchone()
+
+    # the closest starting point in time has the fewest transactions to replay
+    candidates = [(as_of - before, 'forward', before)] if before else []
+    if after:
+        candidates.append((after - as_of, 'backward', after))
+    candidates.append((abs(now - as_of), 'live', now))
+    _, direction, base = min(candidates, key=lambda candidate: candidate[0])
+
+    params = {'product_id': product_id}
+    product_filter = "WHERE b.product_id = %(product_id)s" if product_id is not None else ""
+    if direction in ('forward', 'backward'):
+        if direction == 'forward':
+            params.update({'snapshot_at': base, 'start': base, 'end': as_of})
+            sign = '+'
+        else:
+            params.update({'snapshot_at': base, 'start': as_of, 'end': base})
+            sign = '-'
+        params['as_of'] = as_of
+        # Products without a row in the checkpoint (added, or given an inventory row, after it) get
+        # the checkpoint's quantity from the live inventory less everything moved since, so that
+        # replaying the window from the checkpoint ends at their quantity as of as_of. That movement
+        # is summed in the select list, so only for the products the NOT EXISTS keeps. Products
+        # added after as_of did not exist yet.
+        base_rows = f"""SELECT s.product_id, s.quantity FROM inventory_snapshots s
+                        JOIN products p ON p.product_id = s.product_id AND p.added_at <= %(as_of)s
+                        WHERE s.snapshot_at = %(snapshot_at)s
+                        UNION ALL
+                        SELECT i.product_id, i.quantity_available + COALESCE(c.quantity, 0)
+                               - (SELECT COALESCE(SUM({MOVED_QUANTITY}), 0) FROM transactions t
+                                  WHERE t.product_id = i.product_id AND t.transaction_date > %(snapshot_at)s)
+                        FROM inventory i
+                        JOIN products p ON p.product_id = i.product_id AND p.added_at <= %(as_of)s
+                        LEFT JOIN ({UNFOLDED_CREDITS_SQL}) c ON c.product_id = i.product_id
+                        WHERE NOT EXISTS(SELECT 1 FROM inventory_snapshots s
+                                         WHERE s.snapshot_at = %(snapshot_at)s AND s.product_id = i.product_id)"""
+    else:
+        params.update({'start': as_of, 'end': datetime.max, 'as_of': as_of})
+        # products added later did not exist yet
+        base_rows = f"""SELECT i.product_id, i.quantity_available + COALESCE(c.quantity, 0) AS quantity FROM inventory i
+                        JOIN products p ON p.product_id = i.product_id AND p.added_at <= %(as_of)s
+                        LEFT JOIN ({UNFOLDED_CREDITS_SQL}) c ON c.product_id = i.product_id"""
+        sign = '-'
+
+    cursor.execute(f"""
+        WITH base AS ({base_rows}), moved AS ({_net_movement(product_id)})
+        SELECT b.product_id, p.product_name, b.quantity {sign} COALESCE(m.net, 0) AS quantity
+        FROM base b
+        JOIN products p ON p.product_id = b.product_id
+        LEFT JOIN moved m ON m.product_id = b.product_id
+        {product_filter}
+        ORDER BY b.product_id
+    """, params)
+    return (None if direction == 'live' else base), cursor.fetchall()
+
+
+def main():
+    import models
+
+    parser = argparse.ArgumentParser(description='Maintain inventory checkpoints for point-in-time queries')
+    commands = parser.add_subparsers(dest='command', required=True)
+    checkpoint = commands.add_parser('checkpoint', help='record the stock of every product')
+    checkpoint.add_argument('--lag-minutes', type=int, default=10,
+                            help='checkpoint the stock as of this many minutes ago')
+    prune = commands.add_parser('prune', help='drop old checkpoints')
+    prune.add_argument('--keep-days', type=int, required=True)
+    args = parser.parse_args()
+
+    conn = models.connect_to_db()
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        with conn.cursor() as cursor:
+            if args.command == 'checkpoint':
+                snapshot_at = create_checkpoint(cursor, args.lag_minutes)
+                print(f"Checkpoint created at {snapshot_at}" if snapshot_at else "Checkpoint already exists")
+            else:
+                print(f"Dropped {len(prune_checkpoints(cursor, args.keep_days))} checkpoints")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
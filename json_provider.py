@@ -0,0 +1,134 @@
+# JSON encoding of the app's responses. JSON_PROVIDER picks the provider: 'orjson' encodes with orjson
+# (pip install orjson), 'stdlib' with the json module, 'auto' (default) uses orjson when it is installed.
+# Both write what Flask's default provider writes: keys sorted, dates and datetimes as HTTP dates,
+# Decimals as strings, except that orjson leaves non-ASCII characters unescaped.
+#
+# encode_rows() and encode_array() turn cursor tuples into JSON objects for /get-all-records. The stdlib
+# provider writes each row from per-column key prefixes and value encoders instead of building a dict
+# per row; with orjson, dicts encoded in one call are faster. benchmarks/json_encoding.py measures both.
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_PROVIDERS = ('auto', 'orjson', 'stdlib')
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(value):
+    # werkzeug.http.http_date without going through email.utils; naive datetimes are taken as UTC
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        clock = f"{value.hour:02d}:{value.minute:02d}:{value.second:02d}"
+    else:
+        clock = "00:00:00"
+    return (f"{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} "
+            f"{clock} GMT")
+
+
+def _default(o):
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, Decimal):
+        return str(o)
+    # UUIDs, dataclasses and Markup as Flask encodes them
+    return DefaultJSONProvider.default(o)
+
+
+def _quoted(function):
+    return lambda value: f'"{function(value)}"'
+
+
+class StdlibProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+
+    _VALUE_ENCODERS = {
+        type(None): lambda value: 'null',
+        bool: lambda value: 'true' if value else 'false',
+        int: int.__repr__,
+        str: encode_basestring_ascii,
+        Decimal: _quoted(str),
+        datetime: _quoted(http_date),
+        date: _quoted(http_date),
+    }
+
+    def encode_rows(self, columns, rows):
+        # one JSON object per row of column values, keys sorted like dumps() sorts them
+        encoders = self._VALUE_ENCODERS
+        fallback = self.dumps
+        order = sorted(range(len(columns)), key=lambda position: columns[position])
+        keys = [(position, ('{' if n == 0 else ',') + encode_basestring_ascii(columns[position]) + ':')
+                for n, position in enumerate(order)]
+        encoded = []
+        for row in rows:
+            parts = []
+            for position, key in keys:
+                value = row[position]
+                encoder = encoders.get(type(value))
+                parts.append(key + (encoder(value) if encoder else fallback(value)))
+            parts.append('}')
+            encoded.append(''.join(parts))
+        return encoded
+
+    def encode_array(self, columns, rows):
+        # the rows as one JSON array of objects
+        return '[' + ','.join(self.encode_rows(columns, rows)) + ']'
+
+
+class OrjsonProvider(StdlibProvider):
+    OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def _encode(self, obj, indent=None):
+        option = self.OPTIONS | orjson.OPT_INDENT_2 if indent else self.OPTIONS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        # arguments only the json module understands, and values orjson refuses (e.g. integers over
+        # 64 bits), go to the stdlib encoder
+        if set(kwargs) - {'indent', 'separators'} or kwargs.get('indent') not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._encode(obj, kwargs.get('indent')).decode()
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            body = self._encode(obj, indent) + b'\n'
+        except orjson.JSONEncodeError:
+            return super().response(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+    def encode_rows(self, columns, rows):
+        try:
+            return [self._encode(dict(zip(columns, row))).decode() for row in rows]
+        except orjson.JSONEncodeError:
+            return super().encode_rows(columns, rows)
+
+    def encode_array(self, columns, rows):
+        # one orjson call for all the rows
+        try:
+            return self._encode([dict(zip(columns, row)) for row in rows]).decode()
+        except orjson.JSONEncodeError:
+            return super().encode_array(columns, rows)
+
+
+def provider_class(name):
+    if name not in JSON_PROVIDERS:
+        raise ValueError(f"JSON_PROVIDER must be one of: {', '.join(JSON_PROVIDERS)}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("JSON_PROVIDER is 'orjson' but orjson is not installed")
+    if name == 'stdlib' or orjson is None:
+        return StdlibProvider
+    return OrjsonProvider
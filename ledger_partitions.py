@@ -0,0 +1,149 @@
+# Monthly range partitions of the transactions ledger.
+#
+#   python -m ledger_partitions create --months-ahead 3
+#   python -m ledger_partitions detach --before 2023-01-01 --archive-schema archive
+#   python -m ledger_partitions list
+import argparse
+import re
+import sys
+from datetime import date, datetime
+
+from psycopg2 import sql
+
+DEFAULT_PARTITION = 'transactions_default'
+PARTITION_NAME = re.compile(r'transactions_(\d{4})_(\d{2})')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"transactions_{month.year:04d}_{month.month:02d}"
+
+
+def list_partitions(cursor):
+    # (name, lower bound, upper bound) of every monthly partition, oldest first
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'transactions'::regclass
+        ORDER BY c.relname
+    """)
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = PARTITION_NAME.fullmatch(name)
+        if not match or 'DEFAULT' in bound:
+            continue
+        start = date(int(match.group(1)), int(match.group(2)), 1)
+        partitions.append((name, start, add_months(start, 1)))
+    return partitions
+
+
+def create_partition(cursor, month):
+    # Creates the partition for one month. Rows for that month that went to the default partition
+    # are moved into it without running the inventory triggers again.
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+    cursor.execute("SELECT to_regclass(format('%%I.%%I', current_schema(), %s)) IS NOT NULL", (name,))
+    if cursor.fetchone()[0]:
+        return False
+
+    cursor.execute(sql.SQL("SELECT EXISTS(SELECT 1 FROM {} WHERE transaction_date >= %s AND transaction_date < %s)")
+                   .format(sql.Identifier(DEFAULT_PARTITION)), (start, end))
+    misplaced = cursor.fetchone()[0]
+    if misplaced:
+        cursor.execute(sql.SQL("""
+            CREATE TEMPORARY TABLE misplaced_transactions ON COMMIT DROP AS
+            WITH moved AS (
+                DELETE FROM {} WHERE transaction_date >= %s AND transaction_date < %s RETURNING *
+            )
+            SELECT * FROM moved
+        """).format(sql.Identifier(DEFAULT_PARTITION)), (start, end))
+
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF transactions FOR VALUES FROM (%s) TO (%s)")
+                   .format(sql.Identifier(name)), (start, end))
+
+    if misplaced:
+        # inserted into the partition itself, so only its copies of the row triggers could fire
+        partition = sql.Identifier(name)
+        cursor.execute(sql.SQL("ALTER TABLE {} DISABLE TRIGGER USER").format(partition))
+        cursor.execute(sql.SQL("INSERT INTO {} SELECT * FROM misplaced_transactions").format(partition))
+        cursor.execute(sql.SQL("ALTER TABLE {} ENABLE TRIGGER USER").format(partition))
+        cursor.execute("DROP TABLE misplaced_transactions")
+    return True
+
+
+def ensure_partitions(cursor, months_ahead=3, since=None):
+    # creates the missing monthly partitions from since (default: this month) to months_ahead ahead
+    today = month_start(datetime.now())
+    month = month_start(since) if since else today
+    last = add_months(today, months_ahead)
+    created = []
+    while month <= last:
+        if create_partition(cursor, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def detach_partitions(cursor, before, archive_schema=None, drop=False):
+    # Detaches the monthly partitions that end on or before `before`. They become plain tables,
+    # moved to archive_schema if given, or are dropped. Stock levels are not touched.
+    detached = []
+    for name, _, end in list_partitions(cursor):
+        if end > before:
+            continue
+        cursor.execute(sql.SQL("ALTER TABLE transactions DETACH PARTITION {}").format(sql.Identifier(name)))
+        if drop:
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        elif archive_schema:
+            cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(archive_schema)))
+            cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(sql.Identifier(name),
+                                                                         sql.Identifier(archive_schema)))
+        detached.append(name)
+    return detached
+
+
+def main():
+    import models
+
+    parser = argparse.ArgumentParser(description='Manage the monthly partitions of the transactions ledger')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='create partitions ahead of time')
+    create.add_argument('--months-ahead', type=int, default=3)
+    detach = commands.add_parser('detach', help='detach partitions older than a date')
+    detach.add_argument('--before', required=True, type=date.fromisoformat,
+                        help='detach partitions that end on or before this date')
+    target = detach.add_mutually_exclusive_group()
+    target.add_argument('--archive-schema', help='move the detached partitions to this schema')
+    target.add_argument('--drop', action='store_true', help='drop the detached partitions')
+    commands.add_parser('list', help='list the monthly partitions')
+    args = parser.parse_args()
+
+    conn = models.connect_to_db()
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        with conn.cursor() as cursor:
+            if args.command == 'create':
+                print('\n'.join(ensure_partitions(cursor, args.months_ahead)) or 'No partitions created')
+            elif args.command == 'detach':
+                print('\n'.join(detach_partitions(cursor, args.before, args.archive_schema, args.drop))
+                      or 'No partitions detached')
+            else:
+                for name, start, end in list_partitions(cursor):
+                    print(f"{name}\t{start}\t{end}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
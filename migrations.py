@@ -0,0 +1,181 @@
+# Versioned schema migrations. Every migration is a function of a cursor from models.py, applied once
+# and in order on a single connection, each in its own transaction together with its schema_version
+# row. Workers run migrate() at startup (MIGRATE_ON_STARTUP): when the schema is current that is one
+# query; otherwise the first worker takes an advisory lock and applies what is missing while the
+# others wait on the lock, then find nothing left to do.
+#
+# The first migrations are the tables and triggers models.py used to create on every run. They check
+# for what already exists, so a database set up that way is simply brought under version control.
+# New schema changes are appended to MIGRATIONS with the next version; released ones never change.
+#
+#   python -m migrations migrate
+#   python -m migrations status
+#   python -m migrations trigger-mode statement
+import argparse
+import sys
+
+import psycopg2
+
+import models
+from instrumentation import configure_logging
+
+MIGRATIONS = [
+    (1, 'products table', models.create_products_table),
+    (2, 'users table', models.create_user_table),
+    # before the transactions table, which it would otherwise find unpartitioned
+    (3, 'partition transactions table', models.partition_transactions_table),
+    (4, 'transactions table', models.create_transactions_table),
+    (5, 'inventory table', models.create_inventory_table),
+    (6, 'inventory snapshots', models.create_inventory_snapshots_table),
+    (7, 'inventory trigger', models.update_inventory_trigger),
+    (8, 'inventory change notifications', models.inventory_change_notify_trigger),
+    (9, 'low stock notifications', models.low_stock_notify_trigger),
+    (10, 'user change notifications', models.user_change_notify_trigger),
+    (11, 'unique constraints', models.add_unique_constraints),
+    (12, 'movement rollups', models.create_movement_rollups),
+    (13, 'forecasts table', models.create_forecasts_table),
+    (14, 'race-free stock out and hot product credits', models.create_hot_product_credits),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# pg_advisory_lock(MIGRATION_LOCK, hashtext(current_schema())): one migrator per schema
+MIGRATION_LOCK = 7310
+
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version(
+version INT PRIMARY KEY,
+name VARCHAR(100) NOT NULL,
+applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL)
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+# The version of this schema, NULL before the first migration, in one statement: the table may not
+# exist yet, so it is only read, through query_to_xml, once to_regclass has found it. Only this schema's
+# table counts, not one further down the search_path (the benchmarks' scratch schemas keep public on it).
+CURRENT_VERSION_SQL = """
+SELECT CASE WHEN to_regclass(format('%I.schema_version', current_schema())) IS NOT NULL THEN
+    substring(query_to_xml(format('SELECT max(version) AS version FROM %I.schema_version', current_schema()),
+                           false, true, '')::text FROM '<version>([0-9]+)</version>')::int
+END
+"""
+
+
+def current_version(cursor):
+    # None before the first migration
+    cursor.execute(CURRENT_VERSION_SQL)
+    return cursor.fetchone()[0]
+
+
+def migrate(conn=None, target=None):
+    # Applies the migrations after the current version up to target (default all) and returns the
+    # versions applied. A database already at or past target is left alone, so older workers of a
+    # rolling deploy keep starting against a newer schema. A conn passed in must be idle.
+    target = LATEST_VERSION if target is None else target
+    own_connection = conn is None
+    if own_connection:
+        conn = models.connect_to_db()
+        if not conn:
+            raise MigrationError("Unable to connect to database")
+    applied = []
+    cursor = conn.cursor()
+    try:
+        # outside a transaction, so that a current schema costs one round trip
+        conn.autocommit = True
+        version = current_version(cursor)
+        conn.autocommit = False
+        if version is not None and version >= target:
+            return applied
+
+        cursor.execute("SELECT pg_advisory_lock(%s, hashtext(current_schema()))", (MIGRATION_LOCK,))
+        try:
+            cursor.execute(SCHEMA_VERSION_SQL)
+            conn.commit()
+            # whoever held the lock before may have applied some or all of them
+            version = current_version(cursor) or 0
+            for number, name, migration in MIGRATIONS:
+                if number <= version or number > target:
+                    continue
+                try:
+                    migration(cursor)
+                    cursor.execute("INSERT INTO schema_version(version, name) VALUES(%s, %s)", (number, name))
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    raise MigrationError(f"Migration {number} ({name}) failed: {e}") from e
+                models.schema_log.info("Applied migration %s: %s", number, name)
+                applied.append(number)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s, hashtext(current_schema()))", (MIGRATION_LOCK,))
+            conn.commit()
+    finally:
+        cursor.close()
+        if own_connection:
+            conn.close()
+    return applied
+
+
+def status(conn):
+    cursor = conn.cursor()
+    try:
+        version = current_version(cursor)
+        applied = {}
+        if version is not None:
+            cursor.execute("SELECT version, applied_at FROM schema_version")
+            applied = dict(cursor.fetchall())
+        return [{'version': number, 'name': name, 'applied_at': applied.get(number)}
+                for number, name, _ in MIGRATIONS]
+    finally:
+        cursor.close()
+
+
+def set_inventory_trigger_mode(conn, mode):
+    # switches between the row and statement inventory triggers of migration 7
+    cursor = conn.cursor()
+    try:
+        models.update_inventory_trigger(cursor, mode)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Versioned schema migrations')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='apply the pending migrations')
+    migrate_parser.add_argument('--target', type=int, help='stop after this version')
+    subparsers.add_parser('status', help='list the migrations and when they were applied')
+    mode_parser = subparsers.add_parser('trigger-mode', help='switch the inventory trigger')
+    mode_parser.add_argument('mode', choices=models.INVENTORY_TRIGGER_MODES)
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == 'migrate':
+        applied = migrate(target=args.target)
+        print(f"Applied {len(applied)} migrations" if applied else "Schema is up to date")
+        return
+
+    conn = models.connect_to_db()
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        if args.command == 'status':
+            for migration in status(conn):
+                applied_at = str(migration['applied_at'] or 'pending')
+                print(f"{migration['version']:>4}  {applied_at:<26}  {migration['name']}")
+        else:
+            set_inventory_trigger_mode(conn, args.mode)
+            print(f"Inventory trigger switched to {args.mode} mode")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
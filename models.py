@@ -1,12 +1,28 @@
 
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
 from config import Config
+from db_pool import ConnectionPool, PoolError
+from instrumentation import (POOL_ACQUIRE_DURATION, POOL_ACQUIRE_ERRORS, Gauge, InstrumentedConnection,
+                             sampled_logger)
+from inventory_cache import InventoryCache, InventoryCacheListener
+from ledger_partitions import ensure_partitions
+from movement_rollups import rebuild_rollups
 from psycopg2 import OperationalError
+from user_cache import UserCache
 from flask import Flask, request, jsonify
 from psycopg2.extras import RealDictCursor
 from werkzeug.security import generate_password_hash, check_password_hash
 
 app = Flask(__name__)
+log = sampled_logger(__name__)
+# schema changes are logged in full, not sampled like the request path
+schema_log = logging.getLogger(f'{__name__}.schema')
 
 
 def connect_to_db():
@@ -16,241 +32,958 @@ def connect_to_db():
             database=Config.DB_PARAMETERS['database'],
             user=Config.DB_PARAMETERS['user'],
             password=Config.DB_PARAMETERS['password'],
-            port=Config.DB_PARAMETERS['port']
+            port=Config.DB_PARAMETERS['port'],
+            connection_factory=InstrumentedConnection
         )
-        if not conn:
-            print('Unable to connect to database')
-        print('Connected to database successfully')
+        log.debug("Connected to database")
         return conn
     except OperationalError as e:
-        print(f"Unable to connect to Database: {e}")
-
-
-def create_products_table():
-    with app.app_context():
-        conn = connect_to_db()
-        if not conn:
-            return f"failed to connect to database", 400
-        cursor = conn.cursor()
-        try:
-            print('executing command')
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS products(
-            product_id SERIAL PRIMARY KEY, 
-            product_name VARCHAR(100) NOT NULL,
-            packaging VARCHAR(100),
-            supplier VARCHAR(100),
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
-            )
-            """)
-            conn.commit()
-
-        except OperationalError as e:
-            print(f"Error: Unable to complete task due to: {e}"), 400
-        finally:
-            cursor.close()
-            conn.close()
-
-
-def create_transactions_table():
-    with app.app_context():
-        conn = connect_to_db()
-        if not conn:
-            return f"error: Unable to connect to database", 400
-        cursor = conn.cursor()
-
+        log.error("Unable to connect to database: %s", e)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # The pool is created lazily so that a server which forks its workers after importing the
+    # app never shares sockets between processes.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(
+                    connect_to_db,
+                    min_size=Config.DB_PARAMETERS['pool_min_size'],
+                    max_size=Config.DB_PARAMETERS['pool_max_size'],
+                    timeout=Config.DB_PARAMETERS['pool_timeout'],
+                    max_idle=Config.DB_PARAMETERS['pool_max_idle']
+                )
+                # opens DB_POOL_MIN_SIZE connections before the first request needs one
+                pool.prefill()
+                _pool = pool
+    return _pool
+
+
+def close_pool():
+    # closes the pooled connections; the next db_connection() starts a new pool
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.closeall()
+
+
+@contextmanager
+def db_connection():
+    # Borrow a connection from the pool for the duration of a request. Yields None when no
+    # connection could be acquired, the same way connect_to_db() reports a failed connect.
+    pool = get_pool()
+    started = time.perf_counter()
+    try:
+        conn = pool.getconn()
+    except PoolError as e:
+        POOL_ACQUIRE_ERRORS.inc('sync', type(e).__name__)
+        log.warning("Unable to acquire database connection: %s", e)
+        yield None
+        return
+    POOL_ACQUIRE_DURATION.observe(time.perf_counter() - started, 'sync')
+
+    broken = False
+    try:
+        yield conn
+    except psycopg2.InterfaceError:
+        broken = True
+        raise
+    except Exception:
         try:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS 
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+_inventory_cache = None
+
+
+def _pool_connections():
+    # the sync pool's connections by state for /metrics, without creating the pool
+    pool = _pool
+    if pool is None:
+        return {}
+    stats = pool.stats()
+    return {('sync', state): stats[state] for state in ('in_use', 'idle', 'waiting')}
+
+
+Gauge('db_pool_connections', 'Pooled connections in use and idle, and requests waiting for one.', ('pool', 'state'),
+      _pool_connections)
+
+
+def get_inventory_cache():
+    # Returns this process's inventory cache, or None when Config.INVENTORY_CACHE_ENABLED is off.
+    # Like the pool, it is created lazily and again after a fork, each time with its own listener.
+    global _inventory_cache
+    if not Config.INVENTORY_CACHE_ENABLED:
+        return None
+    with _pool_lock:
+        if _inventory_cache is None or _inventory_cache[1].pid != os.getpid():
+            cache = InventoryCache(Config.INVENTORY_CACHE_MAX_SIZE)
+            listener = InventoryCacheListener(cache, connect_to_db, Config.INVENTORY_CACHE_CHANNEL)
+            listener.start()
+            _inventory_cache = (cache, listener)
+    return _inventory_cache[0]
+
+
+_user_cache = None
+
+
+def get_user_cache():
+    # This process's cache of signed-in users for auth.py, kept coherent through
+    # Config.USER_CACHE_CHANNEL like the inventory cache
+    global _user_cache
+    with _pool_lock:
+        if _user_cache is None or _user_cache[1].pid != os.getpid():
+            cache = UserCache(Config.USER_CACHE_TTL, Config.USER_CACHE_MAX_SIZE)
+            listener = InventoryCacheListener(cache, connect_to_db, Config.USER_CACHE_CHANNEL,
+                                              name='user-cache-listener')
+            listener.start()
+            _user_cache = (cache, listener)
+    return _user_cache[0]
+
+
+def create_products_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS products(
+    product_id SERIAL PRIMARY KEY, 
+    product_name VARCHAR(100) NOT NULL,
+    packaging VARCHAR(100),
+    supplier VARCHAR(100),
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+    )
+    """)
+
+    # trigram index behind the fuzzy name search of /get-item
+    cursor.execute("""
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_products_product_name_trgm ON products USING gin (product_name gin_trgm_ops);
+    """)
+
+
+# The ledger is range partitioned by month on transaction_date, see ledger_partitions.py. The
+# partition key has to be part of the primary key.
+TRANSACTIONS_TABLE_SQL = """
+                CREATE TABLE IF NOT EXISTS
                     transactions (
-                    transaction_id SERIAL PRIMARY KEY,
+                    transaction_id SERIAL,
                     product_id INT,
                     product_name VARCHAR(100),
                     quantity INT,
                     transaction_party VARCHAR(100),
                     entered_by INT,
-                    transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    transaction_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
                     transaction_type VARCHAR(20),
-                    
+
+                    PRIMARY KEY (transaction_id, transaction_date),
+
                     --Foreign key constraints
                     CONSTRAINT fk_product FOREIGN KEY (product_id) REFERENCES products (product_id) ON DELETE CASCADE,
                     CONSTRAINT fk_entered_by FOREIGN KEY (entered_by) REFERENCES users (user_id) ON DELETE SET NULL,
-                    
+
                     -- Check constraint for transaction_type
                     CONSTRAINT chk_transaction_type CHECK (transaction_type IN ('stock in', 'stock out'))
-                );
-            """)
-            conn.commit()
-
-        except OperationalError as e:
-            return f"Unable to complete task due to error:{e}", 400
-
-        finally:
-            cursor.close()
-            conn.close()
-
-
-def create_user_table():
-    with app.app_context():
-        conn = connect_to_db()
-        if not conn:
-            return f"error: Unable to connect to database", 400
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS 
-            users(user_id SERIAL PRIMARY KEY,
-            user_name VARCHAR(20) NOT NULL,
-            account_name VARCHAR(50) NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            role VARCHAR(255) NOT NULL,
-            email VARCHAR(100),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+                ) PARTITION BY RANGE (transaction_date);
+
+                CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions DEFAULT;
+                CREATE INDEX IF NOT EXISTS idx_transactions_product_date ON transactions (product_id, transaction_date);
+"""
+
+
+def create_transactions_table(cursor):
+    cursor.execute(TRANSACTIONS_TABLE_SQL)
+    ensure_partitions(cursor, Config.TRANSACTIONS_PARTITION_MONTHS_AHEAD)
+
+
+def partition_transactions_table(cursor):
+    # One-time migration of a transactions table created before the ledger was partitioned. The rows
+    # are copied into the partitioned table before its triggers exist, so stock is not applied again,
+    # and the old table's triggers are recreated on the new one in the same transaction.
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(format('%I.transactions', current_schema()))")
+    table = cursor.fetchone()
+    if table is None or table[0] == 'p':
+        return
+
+    cursor.execute("LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE")
+    cursor.execute("""
+    SELECT pg_get_triggerdef(oid) FROM pg_trigger
+    WHERE tgrelid = 'transactions'::regclass AND NOT tgisinternal
+    """)
+    trigger_definitions = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT min(transaction_date), max(transaction_id) FROM transactions")
+    oldest, last_id = cursor.fetchone()
+
+    cursor.execute("""
+    ALTER TABLE transactions RENAME TO transactions_unpartitioned;
+    ALTER INDEX transactions_pkey RENAME TO transactions_unpartitioned_pkey;
+    """)
+    cursor.execute(TRANSACTIONS_TABLE_SQL)
+    ensure_partitions(cursor, Config.TRANSACTIONS_PARTITION_MONTHS_AHEAD, since=oldest)
+    cursor.execute("""
+    INSERT INTO transactions(transaction_id, product_id, product_name, quantity, transaction_party, entered_by,
+                             transaction_date, transaction_type)
+    SELECT transaction_id, product_id, product_name, quantity, transaction_party, entered_by,
+           COALESCE(transaction_date, '-infinity'), transaction_type
+    FROM transactions_unpartitioned
+    """)
+    if last_id is not None:
+        cursor.execute("SELECT setval(pg_get_serial_sequence('transactions', 'transaction_id'), %s)", (last_id,))
+    for definition in trigger_definitions:
+        cursor.execute(definition)
+    cursor.execute("DROP TABLE transactions_unpartitioned")
+    schema_log.info('Transactions table partitioned successfully')
+
+
+def create_user_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS 
+    users(user_id SERIAL PRIMARY KEY,
+    user_name VARCHAR(20) NOT NULL,
+    account_name VARCHAR(50) NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    role VARCHAR(255) NOT NULL,
+    email VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    """)
+
+    # Check if the trigger exists
+    cursor.execute("""
+           SELECT EXISTS (
+               SELECT 1
+               FROM pg_trigger
+               WHERE tgname = 'trigger_update_updated_at' AND tgrelid = 'users'::regclass
+           )
+       """)
+
+    trigger_exists = cursor.fetchone()[0]
+
+    if not trigger_exists:
+
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION update_updated_at_column()
+            RETURNS TRIGGER AS $$
+            BEGIN
+               NEW.updated_at = CURRENT_TIMESTAMP;  -- Automatically update updated_at
+               RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            -- Create the trigger on the users table
+            CREATE TRIGGER trigger_update_updated_at
+            BEFORE UPDATE ON users
+            FOR EACH ROW
+            EXECUTE FUNCTION update_updated_at_column();
+    
             """)
 
-            # Check if the trigger exists
-            cursor.execute("""
-                   SELECT EXISTS (
-                       SELECT 1
-                       FROM pg_trigger
-                       WHERE tgname = 'trigger_update_updated_at'
-                   )
-               """)
-
-            trigger_exists = cursor.fetchone()[0]
-
-            if not trigger_exists:
-
-                cursor.execute("""
-                    CREATE OR REPLACE FUNCTION update_updated_at_column()
-                    RETURNS TRIGGER AS $$
-                    BEGIN
-                       NEW.updated_at = CURRENT_TIMESTAMP;  -- Automatically update updated_at
-                       RETURN NEW;
-                    END;
-                    $$ LANGUAGE plpgsql;
-                    
-                    -- Create the trigger on the users table
-                    CREATE TRIGGER trigger_update_updated_at
-                    BEFORE UPDATE ON users
-                    FOR EACH ROW
-                    EXECUTE FUNCTION update_updated_at_column();
-            
-                    """)
 
-                conn.commit()
-        except OperationalError as e:
-            return f"Error: Unable to complete task{e}", 400
+def create_inventory_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS inventory(
+    product_id INT PRIMARY KEY, 
+    product_name VARCHAR(100) NOT NULL,
+    packaging VARCHAR(100),
+    category VARCHAR(100),
+    unit_price DECIMAL(10, 2) NOT NULL,
+    quantity_available INT NOT NULL,
+    minimum_balance INT,
+    supplier VARCHAR(100),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    FOREIGN KEY (product_id) REFERENCES products (product_id)
+    ON DELETE CASCADE)""")
+
+    # indexes behind the /inventory pagination and filters and the /get-item name search
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_inventory_updated_at ON inventory (updated_at, product_id);
+    CREATE INDEX IF NOT EXISTS idx_inventory_category ON inventory (category, product_id);
+    CREATE INDEX IF NOT EXISTS idx_inventory_category_updated_at ON inventory (category, updated_at, product_id);
+    CREATE INDEX IF NOT EXISTS idx_inventory_supplier ON inventory (supplier, product_id);
+    CREATE INDEX IF NOT EXISTS idx_inventory_quantity ON inventory (quantity_available, product_id);
+    -- only items at or below their reorder point, so /low-stock reads scale with their number
+    CREATE INDEX IF NOT EXISTS idx_inventory_low_stock ON inventory (product_id)
+    WHERE quantity_available <= minimum_balance;
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_inventory_product_name_trgm ON inventory USING gin (product_name gin_trgm_ops);
+    """)
+
+
+def create_inventory_snapshots_table(cursor):
+    # checkpoints of every product's stock for /inventory/as-of, written by python -m inventory_snapshots
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS inventory_snapshot_runs(
+    snapshot_at TIMESTAMP PRIMARY KEY,
+    products INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL);
+
+    CREATE TABLE IF NOT EXISTS inventory_snapshots(
+    snapshot_at TIMESTAMP NOT NULL REFERENCES inventory_snapshot_runs (snapshot_at) ON DELETE CASCADE,
+    product_id INT NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+    quantity INT NOT NULL,
+    PRIMARY KEY (snapshot_at, product_id));
+
+    CREATE INDEX IF NOT EXISTS idx_inventory_snapshots_product ON inventory_snapshots (product_id, snapshot_at);
+    """)
+
+
+def create_forecasts_table(cursor):
+    # latest demand forecast of every inventory item, written by python -m forecasting run
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS inventory_forecasts(
+    product_id INT PRIMARY KEY REFERENCES products (product_id) ON DELETE CASCADE,
+    method VARCHAR(20) NOT NULL,
+    daily_demand DOUBLE PRECISION NOT NULL,
+    demand_stddev DOUBLE PRECISION NOT NULL,
+    days_of_cover DOUBLE PRECISION,
+    reorder_point INT NOT NULL,
+    computed_at TIMESTAMP NOT NULL);
+
+    CREATE INDEX IF NOT EXISTS idx_inventory_forecasts_days_of_cover ON inventory_forecasts (days_of_cover, product_id);
+    """)
+
+
+INVENTORY_TRIGGER_MODES = ('row', 'statement')
+
+
+def update_inventory_trigger(cursor, mode=None):
+    # mode 'row' installs the FOR EACH ROW trigger, mode 'statement' the statement-level trigger
+    # that applies a whole INSERT in one set-based UPDATE. Installing one mode removes the other.
+    mode = mode or Config.INVENTORY_TRIGGER_MODE
+    if mode not in INVENTORY_TRIGGER_MODES:
+        raise ValueError(f"Unknown inventory trigger mode: {mode}")
+    trigger_name = 'update_inventory_trigger' if mode == 'row' else 'update_inventory_statement_trigger'
+    other_trigger = 'update_inventory_statement_trigger' if mode == 'row' else 'update_inventory_trigger'
+
+    # Check if trigger exists on this schema's transactions table before creating it
+    cursor.execute("""
+            SELECT EXISTS (
+                SELECT tgname FROM pg_trigger
+                WHERE tgname = %s AND tgrelid = 'transactions'::regclass
+            );
+            """, (trigger_name,))
+    trigger_exists = cursor.fetchone()[0]
+    if not trigger_exists and mode == 'row':
+        cursor.execute("""
+        CREATE OR REPLACE FUNCTION f_update_inventory()
+    RETURNS TRIGGER AS 
+    $$
+    BEGIN
+-- Check if the product and product id are in the products table and they match.
+IF EXISTS(SELECT product_id, product_name 
+          FROM products 
+          WHERE product_id = NEW.product_id 
+            AND product_name = NEW.product_name)
+THEN
+    -- If transaction type is 'stock in', increase the quantity
+    IF NEW.transaction_type = 'stock in' THEN 
+        UPDATE inventory
+        SET quantity_available = quantity_available + NEW.quantity, updated_at = NOW()
+        WHERE product_id = NEW.product_id;
+    
+    -- If transaction type is 'stock out', decrease the quantity
+    ELSIF NEW.transaction_type = 'stock out' THEN
+        -- Check if the subtraction of quantity will result in a negative stock balance
+        IF (SELECT quantity_available 
+            FROM inventory 
+            WHERE product_id = NEW.product_id) - NEW.quantity < 0 THEN
+            RAISE EXCEPTION 'Insufficient stock for product ID: %', NEW.product_id;
+        ELSE
+            UPDATE inventory
+            SET quantity_available = quantity_available - NEW.quantity, updated_at = NOW()
+            WHERE product_id = NEW.product_id;
+        END IF;
+    END IF;
+    
+    -- Return the new row after successful operation
+    RETURN NEW;
+    
+ELSE
+    -- Raise an exception if the product ID or name do not match
+    RAISE EXCEPTION 'Product ID: % or Product Name: % does not exist or mismatch.', NEW.product_id, NEW.product_name;
+END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+     
+        """)
 
-        finally:
-            cursor.close()
-            conn.close()
+    # Create the trigger after the function
+        cursor.execute("""
+                CREATE TRIGGER update_inventory_trigger
+                AFTER INSERT OR UPDATE ON transactions
+                FOR EACH ROW
+                EXECUTE FUNCTION f_update_inventory();
+                """)
+    elif not trigger_exists:
+        cursor.execute("""
+        CREATE OR REPLACE FUNCTION f_update_inventory_statement()
+    RETURNS TRIGGER AS
+    $$
+    DECLARE
+bad RECORD;
+short_product_id INT;
+    BEGIN
+-- Check that every product id and name in the statement are in the products table and match.
+SELECT n.product_id, n.product_name INTO bad
+FROM new_transactions n
+WHERE NOT EXISTS(SELECT 1
+                 FROM products p
+                 WHERE p.product_id = n.product_id
+                   AND p.product_name = n.product_name)
+LIMIT 1;
+IF FOUND THEN
+    RAISE EXCEPTION 'Product ID: % or Product Name: % does not exist or mismatch.', bad.product_id, bad.product_name;
+END IF;
+
+-- Apply the net movement of every product in one UPDATE. Stock balances are checked after
+-- the net change, so a stock in and stock out of the same product in one statement offset.
+WITH delta AS (
+    SELECT product_id,
+           SUM(CASE transaction_type
+                   WHEN 'stock in' THEN quantity
+                   WHEN 'stock out' THEN -quantity
+                   ELSE 0
+               END) AS net
+    FROM new_transactions
+    GROUP BY product_id
+), updated AS (
+    UPDATE inventory i
+    SET quantity_available = i.quantity_available + d.net, updated_at = NOW()
+    FROM delta d
+    WHERE i.product_id = d.product_id
+    RETURNING i.product_id, i.quantity_available
+)
+SELECT product_id INTO short_product_id
+FROM updated
+WHERE quantity_available < 0
+ORDER BY product_id
+LIMIT 1;
+
+IF FOUND THEN
+    RAISE EXCEPTION 'Insufficient stock for product ID: %', short_product_id;
+END IF;
+
+RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+        """)
+
+        cursor.execute("""
+                CREATE TRIGGER update_inventory_statement_trigger
+                AFTER INSERT ON transactions
+                REFERENCING NEW TABLE AS new_transactions
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION f_update_inventory_statement();
+                """)
 
+    cursor.execute(f"DROP TRIGGER IF EXISTS {other_trigger} ON transactions")
 
-def create_inventory_table():
-    with app.app_context():
-        conn = connect_to_db()
-        if not conn:
-            return f"error: Unable to connect to database", 400
-        cursor = conn.cursor()
+    # Once migration 14 has run, the trigger functions are the versions of create_hot_product_credits().
+    if not trigger_exists and _hot_product_credits_exist(cursor):
+        cursor.execute(F_UPDATE_INVENTORY if mode == 'row' else F_UPDATE_INVENTORY_STATEMENT)
+    if not trigger_exists:
+        schema_log.info(f'Update inventory trigger ({mode} mode) created successfully')
 
-        try:
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS inventory(
-            product_id INT PRIMARY KEY, 
-            product_name VARCHAR(100) NOT NULL,
-            packaging VARCHAR(100),
-            category VARCHAR(100),
-            unit_price DECIMAL(10, 2) NOT NULL,
-            quantity_available INT NOT NULL,
-            minimum_balance INT,
-            supplier VARCHAR(100),
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
-            FOREIGN KEY (product_id) REFERENCES products (product_id)
-            ON DELETE CASCADE)""")
-            conn.commit()
-        except OperationalError as e:
-            return f"Error: Could not complete task{e}", 400
-        finally:
-            cursor.close()
-            conn.close()
 
+def _hot_product_credits_exist(cursor):
+    cursor.execute("SELECT to_regclass(format('%I.hot_products', current_schema())) IS NOT NULL")
+    return cursor.fetchone()[0]
 
-def update_inventory_trigger():
-    with app.app_context():
 
-        # connect to the database
-        conn = connect_to_db()
-        cursor = conn.cursor()
-        try:
-            # Check if trigger exists before creating it
-            cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT tgname FROM pg_trigger
-                        WHERE tgname = 'update_inventory_trigger'
-                    );
-                    """)
-            trigger_exists = cursor.fetchone()[0]
-            if not trigger_exists:
-                cursor.execute("""
-                CREATE OR REPLACE FUNCTION f_update_inventory()
+# The trigger functions as create_hot_product_credits() (migration 14) replaces those of migration 7:
+# stock movements go through f_credit_stock and f_debit_stock. A stock out is one conditional UPDATE
+# that only matches while enough stock is left, so concurrent stock outs of the same product cannot
+# both pass a check made before either of them updated the row.
+F_UPDATE_INVENTORY = """
+        CREATE OR REPLACE FUNCTION f_update_inventory()
     RETURNS TRIGGER AS 
     $$
     BEGIN
-        -- Check if the product and product id are in the products table and they match.
-        IF EXISTS(SELECT product_id, product_name 
-                  FROM products 
-                  WHERE product_id = NEW.product_id 
-                    AND product_name = NEW.product_name)
-        THEN
-            -- If transaction type is 'stock in', increase the quantity
-            IF NEW.transaction_type = 'stock in' THEN 
-                UPDATE inventory
-                SET quantity_available = quantity_available + NEW.quantity, updated_at = NOW()
-                WHERE product_id = NEW.product_id;
+-- Check if the product and product id are in the products table and they match.
+IF EXISTS(SELECT product_id, product_name 
+          FROM products 
+          WHERE product_id = NEW.product_id 
+            AND product_name = NEW.product_name)
+THEN
+    -- If transaction type is 'stock in', increase the quantity
+    IF NEW.transaction_type = 'stock in' THEN 
+        PERFORM f_credit_stock(NEW.product_id, NEW.quantity);
     
-            -- If transaction type is 'stock out', decrease the quantity
-            ELSIF NEW.transaction_type = 'stock out' THEN
-                -- Check if the subtraction of quantity will result in a negative stock balance
-                IF (SELECT quantity_available 
-                    FROM inventory 
-                    WHERE product_id = NEW.product_id) - NEW.quantity < 0 THEN
-                    RAISE EXCEPTION 'Insufficient stock for product ID: %', NEW.product_id;
-                ELSE
-                    UPDATE inventory
-                    SET quantity_available = quantity_available - NEW.quantity, updated_at = NOW()
-                    WHERE product_id = NEW.product_id;
-                END IF;
-            END IF;
+    -- If transaction type is 'stock out', decrease the quantity, raising if that would leave it negative
+    ELSIF NEW.transaction_type = 'stock out' THEN
+        PERFORM f_debit_stock(NEW.product_id, NEW.quantity);
+    END IF;
     
-            -- Return the new row after successful operation
-            RETURN NEW;
+    -- Return the new row after successful operation
+    RETURN NEW;
     
-        ELSE
-            -- Raise an exception if the product ID or name do not match
-            RAISE EXCEPTION 'Product ID: % or Product Name: % does not exist or mismatch.', NEW.product_id, NEW.product_name;
-        END IF;
+ELSE
+    -- Raise an exception if the product ID or name do not match
+    RAISE EXCEPTION 'Product ID: % or Product Name: % does not exist or mismatch.', NEW.product_id, NEW.product_name;
+END IF;
     END;
     $$ LANGUAGE plpgsql;
-     
-                """)
+"""
 
-    # Create the trigger after the function
-                cursor.execute("""
-                        CREATE TRIGGER update_inventory_trigger
-                        AFTER INSERT OR UPDATE ON transactions
-                        FOR EACH ROW
-                        EXECUTE FUNCTION f_update_inventory();
-                        """)
-                conn.commit()
-                print('Update inventory created successfully')
-        except OperationalError as e:
-            return f"Error: Unable to complete task:{e}"
-        finally:
-            cursor.close()
-            conn.close()
+F_UPDATE_INVENTORY_STATEMENT = """
+        CREATE OR REPLACE FUNCTION f_update_inventory_statement()
+    RETURNS TRIGGER AS
+    $$
+    DECLARE
+bad RECORD;
+hot RECORD;
+short_product_id INT;
+    BEGIN
+-- Check that every product id and name in the statement are in the products table and match.
+SELECT n.product_id, n.product_name INTO bad
+FROM new_transactions n
+WHERE NOT EXISTS(SELECT 1
+                 FROM products p
+                 WHERE p.product_id = n.product_id
+                   AND p.product_name = n.product_name)
+LIMIT 1;
+IF FOUND THEN
+    RAISE EXCEPTION 'Product ID: % or Product Name: % does not exist or mismatch.', bad.product_id, bad.product_name;
+END IF;
+
+-- Apply the net movement of every product in one UPDATE. Stock balances are checked after
+-- the net change, so a stock in and stock out of the same product in one statement offset.
+-- The balances checked are those the UPDATE wrote, after waiting for concurrent writers.
+WITH delta AS (
+    SELECT product_id,
+           SUM(CASE transaction_type
+                   WHEN 'stock in' THEN quantity
+                   WHEN 'stock out' THEN -quantity
+                   ELSE 0
+               END) AS net
+    FROM new_transactions
+    WHERE product_id NOT IN (SELECT product_id FROM hot_products)
+    GROUP BY product_id
+), updated AS (
+    UPDATE inventory i
+    SET quantity_available = i.quantity_available + d.net, updated_at = NOW()
+    FROM delta d
+    WHERE i.product_id = d.product_id
+    RETURNING i.product_id, i.quantity_available
+)
+SELECT product_id INTO short_product_id
+FROM updated
+WHERE quantity_available < 0
+ORDER BY product_id
+LIMIT 1;
+
+IF FOUND THEN
+    RAISE EXCEPTION 'Insufficient stock for product ID: %', short_product_id;
+END IF;
+
+-- Hot products: the statement's credits go to their shards first, so that its debits can use them.
+FOR hot IN
+    SELECT n.product_id,
+           COALESCE(SUM(n.quantity) FILTER (WHERE n.transaction_type = 'stock in'), 0) AS credit,
+           COALESCE(SUM(n.quantity) FILTER (WHERE n.transaction_type = 'stock out'), 0) AS debit
+    FROM new_transactions n
+    JOIN hot_products h ON h.product_id = n.product_id
+    GROUP BY n.product_id
+    ORDER BY n.product_id
+LOOP
+    IF hot.credit > 0 THEN
+        PERFORM f_credit_stock(hot.product_id, hot.credit);
+    END IF;
+    IF hot.debit > 0 THEN
+        PERFORM f_debit_stock(hot.product_id, hot.debit);
+    END IF;
+END LOOP;
+
+RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def create_hot_product_credits(cursor):
+    # Race-free stock outs and the opt-in hot product mode. Stock outs become a conditional UPDATE
+    # (f_debit_stock). Stock ins of a product listed in hot_products are added to one of its
+    # inventory_credit_shards rows, picked by the session's backend pid, instead of its inventory row,
+    # so that concurrent deliveries do not queue on that row's lock. Credits are folded into inventory
+    # by f_fold_stock_credits, run periodically (python -m hot_products fold) and by a stock out that
+    # finds too little stock. Until then inventory.quantity_available understates a hot product's stock
+    # by its unfolded credits. Replaces both inventory trigger functions, whichever mode is installed.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS hot_products(
+    product_id INT PRIMARY KEY REFERENCES products (product_id) ON DELETE CASCADE,
+    shards INT NOT NULL CHECK (shards > 0));
+
+    CREATE TABLE IF NOT EXISTS inventory_credit_shards(
+    product_id INT NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+    shard INT NOT NULL,
+    quantity BIGINT NOT NULL,
+    PRIMARY KEY (product_id, shard));
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION f_fold_stock_credits(p_product_id INT DEFAULT NULL)
+    RETURNS INT AS
+    $$
+    DECLARE
+folded INT;
+    BEGIN
+-- moves the credits of one product (or of all) into inventory and returns the products folded;
+-- credits of a product without an inventory row are kept until it has one
+WITH credits AS (
+    DELETE FROM inventory_credit_shards s
+    WHERE (p_product_id IS NULL OR s.product_id = p_product_id)
+      AND EXISTS(SELECT 1 FROM inventory i WHERE i.product_id = s.product_id)
+    RETURNING s.product_id, s.quantity
+), totals AS (
+    SELECT product_id, SUM(quantity) AS quantity
+    FROM credits
+    GROUP BY product_id
+)
+UPDATE inventory i
+SET quantity_available = i.quantity_available + t.quantity, updated_at = NOW()
+FROM totals t
+WHERE i.product_id = t.product_id;
+GET DIAGNOSTICS folded = ROW_COUNT;
+RETURN folded;
+    END;
+    $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION f_credit_stock(p_product_id INT, p_quantity INT)
+    RETURNS VOID AS
+    $$
+    DECLARE
+shard_count INT;
+    BEGIN
+SELECT shards INTO shard_count FROM hot_products WHERE product_id = p_product_id;
+IF shard_count IS NULL THEN
+    UPDATE inventory
+    SET quantity_available = quantity_available + p_quantity, updated_at = NOW()
+    WHERE product_id = p_product_id;
+ELSE
+    INSERT INTO inventory_credit_shards AS s(product_id, shard, quantity)
+    VALUES (p_product_id, pg_backend_pid() % shard_count, p_quantity)
+    ON CONFLICT (product_id, shard) DO UPDATE
+    SET quantity = s.quantity + EXCLUDED.quantity;
+END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION f_debit_stock(p_product_id INT, p_quantity INT)
+    RETURNS VOID AS
+    $$
+    BEGIN
+-- A concurrent stock out of the same product makes this wait for its row lock and then re-checks
+-- the condition against the balance it left, so the two can never oversell.
+UPDATE inventory
+SET quantity_available = quantity_available - p_quantity, updated_at = NOW()
+WHERE product_id = p_product_id AND quantity_available >= p_quantity;
+IF FOUND THEN
+    RETURN;
+END IF;
+
+-- a hot product may have the stock in credits not folded yet
+IF EXISTS(SELECT 1 FROM inventory_credit_shards WHERE product_id = p_product_id)
+   AND f_fold_stock_credits(p_product_id) > 0 THEN
+    UPDATE inventory
+    SET quantity_available = quantity_available - p_quantity, updated_at = NOW()
+    WHERE product_id = p_product_id AND quantity_available >= p_quantity;
+    IF FOUND THEN
+        RETURN;
+    END IF;
+END IF;
+
+-- as before, a product without an inventory row is not checked
+IF EXISTS(SELECT 1 FROM inventory WHERE product_id = p_product_id) THEN
+    RAISE EXCEPTION 'Insufficient stock for product ID: %', p_product_id;
+END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    cursor.execute(F_UPDATE_INVENTORY)
+    cursor.execute(F_UPDATE_INVENTORY_STATEMENT)
+    schema_log.info('Hot product credits created successfully')
+
+
+def inventory_change_notify_trigger(cursor):
+    # NOTIFY Config.INVENTORY_CACHE_CHANNEL with the product ids of every statement that changes
+    # inventory (stock updates from f_update_inventory, added and deleted products), so that the
+    # inventory caches of all workers can evict them.
+    cursor.execute("""
+            SELECT EXISTS (
+                SELECT tgname FROM pg_trigger
+                WHERE tgname = 'notify_inventory_insert' AND tgrelid = 'inventory'::regclass
+            );
+            """)
+    trigger_exists = cursor.fetchone()[0]
+    if not trigger_exists:
+        cursor.execute("""
+        CREATE OR REPLACE FUNCTION f_notify_inventory_change()
+    RETURNS TRIGGER AS
+    $$
+    DECLARE
+payload TEXT;
+    BEGIN
+SELECT string_agg(DISTINCT product_id::text, ',') INTO payload FROM changed_rows;
+IF payload IS NOT NULL THEN
+    -- notification payloads are limited to 8000 bytes, past that listeners drop everything
+    IF length(payload) > 7900 THEN
+        payload := '*';
+    END IF;
+    PERFORM pg_notify(TG_ARGV[0], payload);
+END IF;
+RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+        """)
+
+        # transition tables need one trigger per event
+        for event, transition in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            cursor.execute(f"""
+                    CREATE TRIGGER notify_inventory_{event}
+                    AFTER {event.upper()} ON inventory
+                    REFERENCING {transition} TABLE AS changed_rows
+                    FOR EACH STATEMENT
+                    EXECUTE FUNCTION f_notify_inventory_change(%s);
+                    """, (Config.INVENTORY_CACHE_CHANNEL,))
+        schema_log.info('Inventory change notification triggers created successfully')
+
+
+def low_stock_notify_trigger(cursor):
+    # NOTIFY Config.LOW_STOCK_CHANNEL with a JSON payload whenever an item falls to or below its
+    # minimum_balance, or rises back above it. Items added already low count as crossing.
+    cursor.execute("""
+            SELECT EXISTS (
+                SELECT tgname FROM pg_trigger
+                WHERE tgname = 'low_stock_update' AND tgrelid = 'inventory'::regclass
+            );
+            """)
+    trigger_exists = cursor.fetchone()[0]
+    if not trigger_exists:
+        cursor.execute("""
+        CREATE OR REPLACE FUNCTION f_notify_low_stock()
+    RETURNS TRIGGER AS
+    $$
+    DECLARE
+crossing RECORD;
+    BEGIN
+IF TG_OP = 'INSERT' THEN
+    FOR crossing IN
+        SELECT n.product_id, n.quantity_available, n.minimum_balance, TRUE AS low_stock
+        FROM new_rows n
+        WHERE n.quantity_available <= n.minimum_balance
+    LOOP
+        PERFORM pg_notify(TG_ARGV[0], row_to_json(crossing)::text);
+    END LOOP;
+ELSE
+    FOR crossing IN
+        SELECT n.product_id, n.quantity_available, n.minimum_balance,
+               n.quantity_available <= n.minimum_balance AS low_stock
+        FROM new_rows n
+        JOIN old_rows o ON o.product_id = n.product_id
+        WHERE (n.quantity_available <= n.minimum_balance) IS DISTINCT FROM
+              (o.quantity_available <= o.minimum_balance)
+    LOOP
+        PERFORM pg_notify(TG_ARGV[0], row_to_json(crossing)::text);
+    END LOOP;
+END IF;
+RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+        """)
+
+        cursor.execute("""
+                CREATE TRIGGER low_stock_insert
+                AFTER INSERT ON inventory
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION f_notify_low_stock(%s);
+
+                CREATE TRIGGER low_stock_update
+                AFTER UPDATE ON inventory
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION f_notify_low_stock(%s);
+                """, (Config.LOW_STOCK_CHANNEL, Config.LOW_STOCK_CHANNEL))
+        schema_log.info('Low stock notification triggers created successfully')
+
+
+def user_change_notify_trigger(cursor):
+    # NOTIFY Config.USER_CACHE_CHANNEL with the ids of updated (trigger_update_updated_at bumps
+    # updated_at on every change) and deleted users, so that auth.py's user caches evict them.
+    cursor.execute("""
+            SELECT EXISTS (
+                SELECT tgname FROM pg_trigger
+                WHERE tgname = 'notify_user_update' AND tgrelid = 'users'::regclass
+            );
+            """)
+    trigger_exists = cursor.fetchone()[0]
+    if not trigger_exists:
+        cursor.execute("""
+        CREATE OR REPLACE FUNCTION f_notify_user_change()
+    RETURNS TRIGGER AS
+    $$
+    DECLARE
+payload TEXT;
+    BEGIN
+SELECT string_agg(DISTINCT user_id::text, ',') INTO payload FROM changed_rows;
+IF payload IS NOT NULL THEN
+    IF length(payload) > 7900 THEN
+        payload := '*';
+    END IF;
+    PERFORM pg_notify(TG_ARGV[0], payload);
+END IF;
+RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+        """)
+
+        for event, transition in (('update', 'OLD'), ('delete', 'OLD')):
+            cursor.execute(f"""
+                    CREATE TRIGGER notify_user_{event}
+                    AFTER {event.upper()} ON users
+                    REFERENCING {transition} TABLE AS changed_rows
+                    FOR EACH STATEMENT
+                    EXECUTE FUNCTION f_notify_user_change(%s);
+                    """, (Config.USER_CACHE_CHANNEL,))
+        schema_log.info('User change notification triggers created successfully')
+
+
+def create_movement_rollups(cursor):
+    # Daily totals per product and transaction type for /reports/movement, kept up to date by a
+    # statement trigger on transactions. The first run backfills them from the existing ledger.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transaction_daily_rollups(
+    product_id INT NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    transaction_type VARCHAR(20) NOT NULL,
+    transaction_count BIGINT NOT NULL,
+    quantity_total BIGINT NOT NULL,
+    PRIMARY KEY (product_id, day, transaction_type));
+
+    CREATE INDEX IF NOT EXISTS idx_transaction_daily_rollups_day ON transaction_daily_rollups (day, product_id);
+    """)
+    cursor.execute("""
+            SELECT EXISTS (
+                SELECT tgname FROM pg_trigger
+                WHERE tgname = 'rollup_transactions' AND tgrelid = 'transactions'::regclass
+            );
+            """)
+    trigger_exists = cursor.fetchone()[0]
+    if not trigger_exists:
+        cursor.execute("""
+        CREATE OR REPLACE FUNCTION f_rollup_transactions()
+    RETURNS TRIGGER AS
+    $$
+    BEGIN
+-- one upsert per product, day and type of the statement, in key order so that concurrent
+-- batches lock the rollup rows in the same order
+INSERT INTO transaction_daily_rollups AS r(product_id, day, transaction_type, transaction_count,
+                                            quantity_total)
+SELECT product_id, transaction_date::date, transaction_type, count(*), sum(quantity)
+FROM new_rows
+WHERE product_id IS NOT NULL AND transaction_type IS NOT NULL
+GROUP BY 1, 2, 3
+ORDER BY 1, 2, 3
+ON CONFLICT (product_id, day, transaction_type) DO UPDATE
+SET transaction_count = r.transaction_count + EXCLUDED.transaction_count,
+    quantity_total = r.quantity_total + EXCLUDED.quantity_total;
+RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+        """)
+        # no inserts between the backfill and the trigger taking over
+        cursor.execute("LOCK TABLE transactions IN SHARE MODE")
+        cursor.execute("""
+                CREATE TRIGGER rollup_transactions
+                AFTER INSERT ON transactions
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION f_rollup_transactions();
+                """)
+        rebuild_rollups(cursor)
+        schema_log.info('Movement rollups created successfully')
+
+
+def add_unique_constraints(cursor):
+    # Unique indexes behind the INSERT ... ON CONFLICT of /create-product and /register-user.
+    # Existing duplicates are merged first, all in one transaction: references move to the oldest
+    # row of each group, inventory of a duplicate product is added to the kept product's inventory.
+    cursor.execute("""
+            SELECT count(*) FROM pg_indexes
+            WHERE indexname IN ('uq_products_name_packaging_supplier', 'uq_users_name_account')
+              AND schemaname = current_schema();
+            """)
+    if cursor.fetchone()[0] == 2:
+        return
+
+    cursor.execute("""
+    -- repointing transactions must not run the inventory triggers again
+    ALTER TABLE transactions DISABLE TRIGGER USER;
+
+    CREATE TEMPORARY TABLE product_duplicates ON COMMIT DROP AS
+    SELECT product_id, keep_id FROM (
+        SELECT product_id,
+               min(product_id) OVER (PARTITION BY product_name, packaging, supplier) AS keep_id
+        FROM products
+    ) grouped
+    WHERE product_id <> keep_id;
+
+    UPDATE transactions t SET product_id = d.keep_id
+    FROM product_duplicates d WHERE t.product_id = d.product_id;
+
+    -- a kept product without inventory takes over its first duplicate's inventory row
+    UPDATE inventory i SET product_id = d.keep_id
+    FROM product_duplicates d
+    WHERE i.product_id = d.product_id
+      AND NOT EXISTS(SELECT 1 FROM inventory k WHERE k.product_id = d.keep_id)
+      AND d.product_id = (SELECT min(d2.product_id)
+                          FROM product_duplicates d2 JOIN inventory i2 ON i2.product_id = d2.product_id
+                          WHERE d2.keep_id = d.keep_id);
+
+    -- the stock of the remaining duplicate rows is added to it
+    UPDATE inventory i
+    SET quantity_available = i.quantity_available + moved.quantity, updated_at = NOW()
+    FROM (
+        SELECT d.keep_id, sum(dup.quantity_available) AS quantity
+        FROM product_duplicates d JOIN inventory dup ON dup.product_id = d.product_id
+        GROUP BY d.keep_id
+    ) moved
+    WHERE i.product_id = moved.keep_id;
+
+    -- deleting the duplicates cascades to their inventory rows
+    DELETE FROM products p USING product_duplicates d WHERE p.product_id = d.product_id;
+
+    CREATE TEMPORARY TABLE user_duplicates ON COMMIT DROP AS
+    SELECT user_id, keep_id FROM (
+        SELECT user_id, min(user_id) OVER (PARTITION BY user_name, account_name) AS keep_id
+        FROM users
+    ) grouped
+    WHERE user_id <> keep_id;
+
+    UPDATE transactions t SET entered_by = d.keep_id
+    FROM user_duplicates d WHERE t.entered_by = d.user_id;
+
+    DELETE FROM users u USING user_duplicates d WHERE u.user_id = d.user_id;
+
+    ALTER TABLE transactions ENABLE TRIGGER USER;
+
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_products_name_packaging_supplier
+    ON products (product_name, packaging, supplier);
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_users_name_account ON users (user_name, account_name);
+    """)
+    schema_log.info('Unique constraints created successfully')
 
 
 def log_in():
@@ -271,7 +1004,6 @@ def log_in():
             cursor.execute("SELECT user_name, password from users where user_name = %s", (user_name,))
 
             db_results = cursor.fetchone()
-            print(db_results)
 
             cursor.close()
 
@@ -403,7 +1135,6 @@ def get_all_records():
             cursor.execute("SELECT * FROM inventory")
 
             data = cursor.fetchall()
-            print(data)
             if not data:
                 return jsonify({"message": "No data available"}), 204
 
@@ -422,12 +1153,11 @@ def get_all_records():
                     "updated_at": row['updated_at']
                 }
                 records.append(record)
-                print(records)
 
             return jsonify(records), 200
 
         except Exception as e:
-            print(f"Error:{e}")
+            log.error("Unable to read inventory records: %s", e)
             return jsonify({"error": str(e)}), 500
 
         finally:
@@ -465,12 +1195,6 @@ def delete_item():
 
 
 if __name__ == "__main__":
-    create_products_table()
-    create_user_table()
-    create_transactions_table()
-    create_inventory_table()
-    update_inventory_trigger()
-
-
-
-
+    # the schema is versioned by migrations.py, see python -m migrations
+    from migrations import migrate
+    migrate()
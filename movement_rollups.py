@@ -0,0 +1,120 @@
+# Daily stock movement totals per product and transaction type. The trigger installed by
+# models.create_movement_rollups() adds every inserted transaction to transaction_daily_rollups in
+# the same transaction, so reports read a few rows per product and day instead of the ledger.
+#
+#   python -m movement_rollups rebuild
+#   python -m movement_rollups rebuild --start 2024-01-01 --end 2024-02-01
+import argparse
+import sys
+from datetime import date, timedelta
+
+GRANULARITIES = ('day', 'week')
+DEFAULT_REPORT_DAYS = 30
+
+ROLLUP_SELECT = """
+    SELECT product_id, transaction_date::date, transaction_type, count(*), sum(quantity)
+    FROM transactions
+    WHERE product_id IS NOT NULL AND transaction_type IS NOT NULL {conditions}
+    GROUP BY 1, 2, 3
+"""
+
+
+class ReportError(ValueError):
+    pass
+
+
+def _day_range(start, end, column):
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append(f"{column} >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{column} < %s")
+        params.append(end)
+    return conditions, params
+
+
+def rebuild_rollups(cursor, start=None, end=None):
+    # Recomputes the rollups of the days in [start, end) (all days by default) from the ledger.
+    # The lock waits for open transactions that already added to the rollups and holds off new ones,
+    # so nothing is counted twice or missed. Returns the number of rollup rows written.
+    cursor.execute("LOCK TABLE transaction_daily_rollups IN EXCLUSIVE MODE")
+    conditions, params = _day_range(start, end, 'day')
+    cursor.execute("DELETE FROM transaction_daily_rollups" + (f" WHERE {' AND '.join(conditions)}" if conditions else ""),
+                   params)
+
+    conditions, params = _day_range(start, end, 'transaction_date')
+    cursor.execute(f"""
+        INSERT INTO transaction_daily_rollups(product_id, day, transaction_type, transaction_count, quantity_total)
+        {ROLLUP_SELECT.format(conditions=''.join(f'AND {condition} ' for condition in conditions))}
+    """, params)
+    return cursor.rowcount
+
+
+def _parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ReportError(f"{name} must be an ISO date")
+
+
+def build_movement_report(args):
+    # Movement report query from request args: start (inclusive) and end (exclusive) dates, default
+    # the last 30 days; granularity=day|week; product_id=1,2,3. Returns (sql, params).
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ReportError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    end = _parse_date(args['end'], 'end') if args.get('end') else date.today() + timedelta(days=1)
+    start = _parse_date(args['start'], 'start') if args.get('start') else end - timedelta(days=DEFAULT_REPORT_DAYS)
+    if start >= end:
+        raise ReportError("start must be before end")
+
+    conditions = ["day >= %s", "day < %s"]
+    params = [start, end]
+    if args.get('product_id'):
+        try:
+            product_ids = [int(product_id) for product_id in args['product_id'].split(',') if product_id.strip()]
+        except ValueError:
+            raise ReportError("product_id must be a comma separated list of integers")
+        conditions.append("product_id = ANY(%s)")
+        params.append(product_ids)
+
+    period = "day" if granularity == 'day' else "date_trunc('week', day)::date"
+    query = f"""
+        SELECT {period}::text AS period, product_id,
+               COALESCE(sum(transaction_count) FILTER (WHERE transaction_type = 'stock in'), 0)::bigint AS stock_in_count,
+               COALESCE(sum(quantity_total) FILTER (WHERE transaction_type = 'stock in'), 0)::bigint AS stock_in_quantity,
+               COALESCE(sum(transaction_count) FILTER (WHERE transaction_type = 'stock out'), 0)::bigint AS stock_out_count,
+               COALESCE(sum(quantity_total) FILTER (WHERE transaction_type = 'stock out'), 0)::bigint AS stock_out_quantity
+        FROM transaction_daily_rollups
+        WHERE {' AND '.join(conditions)}
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """
+    return query, params
+
+
+def main():
+    import models
+
+    parser = argparse.ArgumentParser(description='Maintain the daily stock movement rollups')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild', help='recompute the rollups from the transactions ledger')
+    rebuild.add_argument('--start', type=date.fromisoformat, help='first day to rebuild')
+    rebuild.add_argument('--end', type=date.fromisoformat, help='day after the last day to rebuild')
+    args = parser.parse_args()
+
+    conn = models.connect_to_db()
+    if not conn:
+        sys.exit("Unable to connect to database")
+    try:
+        with conn.cursor() as cursor:
+            print(f"Wrote {rebuild_rollups(cursor, args.start, args.end)} rollup rows")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Password hashing off the request threads. Hashes are computed by a small process pool, so a burst of
+# log-ins uses at most PASSWORD_HASH_WORKERS cores and never holds a request worker's GIL. At most
+# PASSWORD_HASH_MAX_PENDING hashes may be queued or running per process; past that HashingBusy is
+# raised at once and the caller answers 503 instead of queueing.
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import Config
+
+
+class HashingBusy(Exception):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _worker_context():
+    # Workers must not be forked from the app, whose threads may hold locks and sockets. They are
+    # forked from a clean fork server instead, or spawned where there is none (Windows).
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _get_executor():
+    # created lazily and again after a fork, like the connection pool
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor[0] != os.getpid():
+            executor = ProcessPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS, mp_context=_worker_context())
+            _executor = (os.getpid(), executor, threading.BoundedSemaphore(Config.PASSWORD_HASH_MAX_PENDING))
+        return _executor[1], _executor[2]
+
+
+def _reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor[1] is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # what the method and cost look like in a stored hash, e.g. 'pbkdf2:sha256' -> 'pbkdf2:sha256:600000'
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method)
+
+
+def _verify(stored, password, method):
+    if not check_password_hash(stored, password):
+        return False, None
+    if stored.split('$', 1)[0] != _method_prefix(method):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+def _run(function, *args):
+    if Config.PASSWORD_HASH_WORKERS <= 0:
+        return function(*args)
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy("too many password hashes in progress")
+    try:
+        future = executor.submit(function, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _reset_executor(executor)
+        raise
+    # the slot is held until the worker is done, even if the caller stopped waiting
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=Config.PASSWORD_HASH_TIMEOUT)
+    except FutureTimeout:
+        raise HashingBusy(f"password hash not done after {Config.PASSWORD_HASH_TIMEOUT}s")
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        raise
+
+
+def hash_password(password):
+    # hash with Config.PASSWORD_HASH_METHOD; raises HashingBusy when the pool is saturated
+    return _run(_hash, password, Config.PASSWORD_HASH_METHOD)
+
+
+def verify_password(stored, password):
+    # Returns (matches, new_hash). new_hash is set when the password matches but was stored with
+    # another method or cost than Config.PASSWORD_HASH_METHOD, and should replace the stored hash.
+    return _run(_verify, stored, password, Config.PASSWORD_HASH_METHOD)
@@ -0,0 +1,70 @@
+SEARCH_MODES = ('fuzzy', 'prefix', 'exact')
+SEARCH_SOURCES = ('inventory', 'products')
+MAX_SEARCH_LIMIT = 100
+DEFAULT_SEARCH_LIMIT = 20
+THRESHOLD_SQL = "SET LOCAL pg_trgm.word_similarity_threshold = %s"
+
+
+class SearchError(ValueError):
+    pass
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def check_limit(limit):
+    if not 0 < limit <= MAX_SEARCH_LIMIT:
+        raise SearchError(f"limit must be between 1 and {MAX_SEARCH_LIMIT}")
+
+
+def search_statement(term, mode='fuzzy', limit=DEFAULT_SEARCH_LIMIT, source='inventory', columns='product_id, product_name'):
+    # Returns (sql, params) for a ranked name search. Both modes are served by the pg_trgm GIN
+    # index on product_name:
+    #   fuzzy  - names containing the term, or a word close to it (typos), ranked by word similarity
+    #   prefix - names starting with the term, ranked by similarity
+    #   exact  - names equal to the term ignoring case
+    if mode not in SEARCH_MODES:
+        raise SearchError(f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    if source not in SEARCH_SOURCES:
+        raise SearchError(f"source must be one of: {', '.join(SEARCH_SOURCES)}")
+    check_limit(limit)
+
+    if mode == 'fuzzy':
+        sql = f"""
+            SELECT {columns}
+            FROM {source}
+            WHERE product_name ILIKE %s OR %s <%% product_name
+            ORDER BY word_similarity(%s, product_name) DESC, product_id
+            LIMIT %s
+        """
+        return sql, [f"%{_escape_like(term)}%", term, term, limit]
+
+    if mode == 'exact':
+        sql = f"""
+            SELECT {columns}
+            FROM {source}
+            WHERE product_name ILIKE %s
+            ORDER BY product_id
+            LIMIT %s
+        """
+        return sql, [_escape_like(term), limit]
+
+    sql = f"""
+            SELECT {columns}
+            FROM {source}
+            WHERE product_name ILIKE %s
+            ORDER BY similarity(product_name, %s) DESC, product_id
+            LIMIT %s
+        """
+    return sql, [f"{_escape_like(term)}%", term, limit]
+
+
+def build_search_query(term, mode='fuzzy', limit=DEFAULT_SEARCH_LIMIT, source='inventory', threshold=None):
+    # search_statement() preceded by the typo threshold, which applies to this transaction only
+    # and is sent in the same round trip as the query
+    sql, params = search_statement(term, mode, limit, source)
+    if threshold is not None and mode == 'fuzzy':
+        sql = THRESHOLD_SQL + ";" + sql
+        params = [threshold] + params
+    return sql, params
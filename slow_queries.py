@@ -0,0 +1,185 @@
+# Opt-in slow statement log (SLOW_QUERY_MS). Every statement of the app's connections that takes at
+# least SLOW_QUERY_MS is logged with its parameters redacted and kept in a ring buffer of the last
+# SLOW_QUERY_LOG_SIZE, read by /admin/slow-queries. A SLOW_QUERY_EXPLAIN_RATE share of them is explained
+# again by a background thread on its own connection: reads with EXPLAIN (ANALYZE, BUFFERS) in a read-only
+# transaction that is rolled back, writes with a plain EXPLAIN so that they are never run twice. String
+# literals are removed from the stored plans.
+#
+# A leading SET LOCAL sent in the same round trip (the pg_trgm similarity threshold of a fuzzy /get-item)
+# is applied again before the statement is explained. Other session settings of the request are not,
+# which can make the plan differ from the one that was slow.
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import psycopg2
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+_STRING_LITERALS = re.compile(r"'(?:[^']|'')*'")
+# statements EXPLAIN accepts; only the first two are explained with ANALYZE
+_READS = ('SELECT', 'WITH')
+_EXPLAINABLE = _READS + ('INSERT', 'UPDATE', 'DELETE', 'VALUES', 'TABLE')
+# SET LOCAL statements sent ahead of the query in the same execute(), e.g. by product_search
+_SET_LOCAL = re.compile(r"^\s*(?:SET\s+LOCAL\s+[^;']*;\s*)+", re.I)
+_SET_LOCAL_BYTES = re.compile(_SET_LOCAL.pattern.encode(), re.I)
+_WRITE_WORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+(KEY\s+)?SHARE|"
+                          r"NEXTVAL|SETVAL|PG_ADVISORY\w*)\b", re.I)
+
+
+def _placeholder(value):
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes, list, tuple)):
+        return f"<{type(value).__name__} len={len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact(params):
+    # the shape of the parameters without their values
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _placeholder(value) for key, value in params.items()}
+    return [_placeholder(value) for value in params]
+
+
+def _redact_plan(value):
+    if isinstance(value, str):
+        return _STRING_LITERALS.sub("'?'", value)
+    if isinstance(value, list):
+        return [_redact_plan(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _redact_plan(item) for key, item in value.items()}
+    return value
+
+
+class SlowQueryLog:
+    def __init__(self, max_entries):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max_entries)
+        self._next_id = 1
+
+    def add(self, entry):
+        with self._lock:
+            entry['id'] = self._next_id
+            self._next_id += 1
+            self._entries.append(entry)
+        return entry
+
+    def update(self, entry, **changes):
+        with self._lock:
+            entry.update(changes)
+
+    def entries(self, limit=None):
+        # newest first, as copies
+        with self._lock:
+            entries = [dict(entry) for entry in reversed(self._entries)]
+        return entries[:limit] if limit else entries
+
+
+slow_query_log = SlowQueryLog(Config.SLOW_QUERY_LOG_SIZE)
+
+_local = threading.local()
+_explainer = None
+_explainer_lock = threading.Lock()
+
+
+class _Explainer(threading.Thread):
+    # explains queued statements one at a time on a connection of its own
+    def __init__(self):
+        super().__init__(name='slow-query-explainer', daemon=True)
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=Config.SLOW_QUERY_EXPLAIN_QUEUE)
+        self._conn = None
+
+    def run(self):
+        # statements of this thread are never captured themselves
+        _local.explaining = True
+        while True:
+            entry, settings, query, analyze = self.queue.get()
+            try:
+                plan = self._explain(settings, query, analyze)
+                slow_query_log.update(entry, plan=_redact_plan(plan), plan_status='analyzed' if analyze else 'explained')
+            except psycopg2.Error as e:
+                slow_query_log.update(entry, plan_status=f"failed: {type(e).__name__}")
+                if self._conn is not None and (self._conn.closed or isinstance(e, psycopg2.OperationalError)):
+                    self._conn.close()
+                    self._conn = None
+
+    def _explain(self, settings, query, analyze):
+        import models
+
+        if self._conn is None:
+            self._conn = models.connect_to_db()
+            if self._conn is None:
+                raise psycopg2.OperationalError("Unable to connect to database")
+        options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SET LOCAL statement_timeout = %s", (Config.SLOW_QUERY_EXPLAIN_TIMEOUT_MS,))
+                if settings:
+                    cursor.execute(settings)
+                cursor.execute(b"EXPLAIN (" + options.encode() + b") " + query)
+                plan = cursor.fetchone()[0]
+        finally:
+            self._conn.rollback()
+        return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _get_explainer():
+    global _explainer
+    with _explainer_lock:
+        if _explainer is None or _explainer.pid != os.getpid():
+            _explainer = _Explainer()
+            _explainer.start()
+        return _explainer
+
+
+def capture(cursor, statement, query, params, seconds, error=None):
+    # Called by instrumentation for every statement over the threshold. statement is its fingerprint,
+    # query and params what was executed.
+    if getattr(_local, 'explaining', False):
+        return
+    entry = {
+        'at': datetime.now(timezone.utc).isoformat(),
+        'duration_ms': round(seconds * 1000, 3),
+        'statement': statement,
+        'params': redact(params) if isinstance(params, (dict, list, tuple)) else None,
+        'error': type(error).__name__ if error is not None else None,
+        'plan': None,
+        'plan_status': 'not sampled'
+    }
+    log.warning("Slow query (%.1f ms): %s params=%s", entry['duration_ms'], statement, entry['params'])
+
+    # the statement after any SET LOCAL sent with it, which is applied again before explaining
+    body = _SET_LOCAL.sub('', statement)
+    keyword = body.split(' ', 1)[0].upper()
+    if keyword not in _EXPLAINABLE:
+        entry['plan_status'] = 'not explainable'
+    elif random.random() < Config.SLOW_QUERY_EXPLAIN_RATE:
+        analyze = keyword in _READS and not _WRITE_WORDS.search(body)
+        try:
+            # the statement with its values, handed to the explainer but never stored
+            literal_query = cursor.mogrify(query, params)
+            settings = _SET_LOCAL_BYTES.match(literal_query)
+            if settings:
+                literal_query = literal_query[settings.end():]
+                settings = settings.group()
+            # set first, the explainer may be done with it before put_nowait() returns
+            entry['plan_status'] = 'pending'
+            _get_explainer().queue.put_nowait((entry, settings, literal_query, analyze))
+        except queue.Full:
+            entry['plan_status'] = 'dropped'
+        except (psycopg2.Error, TypeError, ValueError) as e:
+            entry['plan_status'] = f"failed: {type(e).__name__}"
+    slow_query_log.add(entry)
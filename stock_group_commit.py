@@ -0,0 +1,100 @@
+# Group commit for /update-stock (GROUP_COMMIT_ENABLED). Instead of an insert and a commit per request,
+# validated movements are queued for a writer thread that inserts whatever is waiting as one batch with
+# stock_movements.apply_movements in per-item mode and commits it once. A batch is flushed when it holds
+# GROUP_COMMIT_MAX_ITEMS movements or GROUP_COMMIT_INTERVAL_MS after its first one arrived. Every caller
+# gets the result of its own movement, an error such as insufficient stock included, once the batch
+# is committed. At most GROUP_COMMIT_MAX_PENDING movements may wait per process; past that QueueFull
+# is raised at once and the caller answers 503 instead of queueing.
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import Config
+from instrumentation import Gauge, Histogram, sampled_logger
+from stock_movements import apply_movements
+
+log = sampled_logger(__name__)
+
+BATCH_SIZE = Histogram('stock_group_commit_batch_size', 'Movements written by one group commit.', (),
+                       buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+FLUSH_DURATION = Histogram('stock_group_commit_flush_seconds', 'Time to insert and commit one group of movements.')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class GroupCommitWriter(threading.Thread):
+    def __init__(self):
+        super().__init__(name='stock-group-commit', daemon=True)
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=Config.GROUP_COMMIT_MAX_PENDING)
+
+    def submit(self, movement):
+        # Returns a Future of the movement's apply_movements result, {"status": "ok", "transaction_id": ...}
+        # or {"status": "error", "error": ...}. Raises QueueFull when too many movements are waiting.
+        future = Future()
+        try:
+            self.queue.put_nowait((movement, future))
+        except queue.Full:
+            raise QueueFull(f"{Config.GROUP_COMMIT_MAX_PENDING} stock movements already waiting")
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + Config.GROUP_COMMIT_INTERVAL_MS / 1000
+            while len(batch) < Config.GROUP_COMMIT_MAX_ITEMS:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        import models
+
+        # movements whose caller cancelled are not written; the others can no longer be cancelled
+        batch = [(movement, future) for movement, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            with models.db_connection() as conn:
+                if not conn:
+                    results = [{"status": "error", "error": "Unable to connect to database"}] * len(batch)
+                else:
+                    results, _ = apply_movements(conn, [movement for movement, _ in batch], atomic=False)
+        except Exception as e:
+            log.error("Group commit of %s movements failed: %s", len(batch), e)
+            results = [{"status": "error", "error": str(e)}] * len(batch)
+        FLUSH_DURATION.observe(time.perf_counter() - started)
+        BATCH_SIZE.observe(len(batch))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    # created lazily and again after a fork, like the connection pool
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = GroupCommitWriter()
+            _writer.start()
+        return _writer
+
+
+def _pending_movements():
+    writer = _writer
+    if writer is None or writer.pid != os.getpid():
+        return {}
+    return {(): writer.queue.qsize()}
+
+
+Gauge('stock_group_commit_pending', 'Stock movements waiting for the group commit writer.', (), _pending_movements)
@@ -0,0 +1,173 @@
+import json
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+TRANSACTION_TYPES = ('stock in', 'stock out')
+REQUIRED_FIELDS = ['product_id', 'product_name', 'quantity', 'transaction_party', 'user_id', 'transaction_type']
+
+INSERT_TRANSACTIONS = """
+    INSERT INTO transactions(product_id, product_name, quantity, transaction_party, entered_by, transaction_type)
+    VALUES %s
+    RETURNING transaction_id
+"""
+
+
+class MovementError(Exception):
+    pass
+
+
+def parse_ndjson(lines):
+    # yields one movement per non-empty line; a line that is not valid JSON becomes an error entry
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield MovementError(f"invalid JSON: {e}")
+
+
+def validate_movement(item):
+    # Returns the row tuple for the insert, or raises MovementError. Mirrors the checks in
+    # app.update_stock plus the transaction_type check constraint, so that one bad row cannot
+    # fail a whole multi-row insert.
+    if isinstance(item, MovementError):
+        raise item
+    if not isinstance(item, dict):
+        raise MovementError("movement must be a JSON object")
+
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in item]
+    if missing_fields:
+        raise MovementError(f"missing the following required fields {', '.join(missing_fields)}")
+
+    product_id = item['product_id']
+    product_name = item['product_name']
+    quantity = item['quantity']
+    transaction_party = item['transaction_party']
+    user_id = item['user_id']
+    transaction_type = item['transaction_type']
+
+    if not all([isinstance(product_id, int), isinstance(product_name, str),
+                isinstance(quantity, int), isinstance(transaction_party, str), isinstance(user_id, int),
+                isinstance(transaction_type, str)]):
+        raise MovementError("Check input format and data type")
+
+    if transaction_type not in TRANSACTION_TYPES:
+        raise MovementError(f"transaction_type must be one of: {', '.join(TRANSACTION_TYPES)}")
+
+    return product_id, product_name, quantity, transaction_party, user_id, transaction_type
+
+
+def _check_against_stock(cursor, rows):
+    # Runs the f_update_inventory checks for the whole batch with two queries. The inventory rows
+    # are locked so the running balances computed here hold until the insert commits.
+    product_ids = sorted({row[1][0] for row in rows})
+
+    cursor.execute("SELECT product_id, product_name FROM products WHERE product_id = ANY(%s)", (product_ids,))
+    names = {product_id: product_name for product_id, product_name in cursor.fetchall()}
+
+    # hot products count their stock in credits, which a stock out folds in when it needs them
+    cursor.execute("""
+        SELECT i.product_id,
+               i.quantity_available + COALESCE((SELECT SUM(s.quantity) FROM inventory_credit_shards s
+                                                WHERE s.product_id = i.product_id), 0)
+        FROM inventory i
+        WHERE i.product_id = ANY(%s)
+        ORDER BY i.product_id
+        FOR UPDATE
+    """, (product_ids,))
+    balances = dict(cursor.fetchall())
+
+    accepted, rejected = [], []
+    for index, row in rows:
+        product_id, product_name, quantity, _, _, transaction_type = row
+        if names.get(product_id) != product_name:
+            rejected.append((index, f"Product ID: {product_id} or Product Name: {product_name} does not exist or mismatch."))
+            continue
+        if product_id in balances:
+            if transaction_type == 'stock out':
+                if balances[product_id] - quantity < 0:
+                    rejected.append((index, f"Insufficient stock for product ID: {product_id}"))
+                    continue
+                balances[product_id] -= quantity
+            else:
+                balances[product_id] += quantity
+        accepted.append((index, row))
+    return accepted, rejected
+
+
+def _insert_individually(cursor, rows):
+    # fallback when the multi-row insert failed for a reason the pre-check could not see
+    inserted, rejected = [], []
+    for index, row in rows:
+        cursor.execute("SAVEPOINT movement")
+        try:
+            transaction_id = execute_values(cursor, INSERT_TRANSACTIONS, [row], fetch=True)[0][0]
+            cursor.execute("RELEASE SAVEPOINT movement")
+            inserted.append((index, transaction_id))
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT movement")
+            rejected.append((index, (e.diag.message_primary or str(e)).strip()))
+    return inserted, rejected
+
+
+def apply_movements(conn, items, atomic=True):
+    # Validates and inserts a batch of stock movements in one transaction.
+    # Returns (results, committed) where results holds one entry per input item, in input order.
+    # With atomic=True nothing is written if any item fails; otherwise the valid items are
+    # committed and the failing ones reported.
+    results = []
+    rows = []
+    for index, item in enumerate(items):
+        try:
+            rows.append((index, validate_movement(item)))
+            results.append(None)
+        except MovementError as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+
+    rejected = [(r['index'], r['error']) for r in results if r]
+    if atomic and rejected or not rows:
+        for index, row in rows:
+            results[index] = {"index": index, "status": "skipped"}
+        return results, False
+
+    cursor = conn.cursor()
+    try:
+        accepted, stock_rejected = _check_against_stock(cursor, rows)
+        for index, error in stock_rejected:
+            results[index] = {"index": index, "status": "error", "error": error}
+
+        if atomic and stock_rejected or not accepted:
+            conn.rollback()
+            for index, row in accepted:
+                results[index] = {"index": index, "status": "skipped"}
+            return results, False
+
+        cursor.execute("SAVEPOINT batch")
+        try:
+            ids = execute_values(cursor, INSERT_TRANSACTIONS, [row for _, row in accepted],
+                                 page_size=len(accepted), fetch=True)
+            inserted = [(index, transaction_id) for (index, _), (transaction_id,) in zip(accepted, ids)]
+            cursor.execute("RELEASE SAVEPOINT batch")
+        except psycopg2.Error as e:
+            if atomic:
+                conn.rollback()
+                message = (e.diag.message_primary or str(e)).strip()
+                for index, row in accepted:
+                    results[index] = {"index": index, "status": "error", "error": message}
+                return results, False
+            cursor.execute("ROLLBACK TO SAVEPOINT batch")
+            inserted, late_rejected = _insert_individually(cursor, accepted)
+            for index, error in late_rejected:
+                results[index] = {"index": index, "status": "error", "error": error}
+
+        conn.commit()
+        for index, transaction_id in inserted:
+            results[index] = {"index": index, "status": "ok", "transaction_id": transaction_id}
+        return results, bool(inserted)
+    finally:
+        cursor.close()
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    # Process-local cache of signed-in users keyed by user_id (user names are only unique per
+    # account), holding user_id, user_name and role. Entries expire after ttl seconds and are only served while the listener is connected;
+    # a trigger on users NOTIFYs the ids of every updated or deleted row, which evicts them.
+    #
+    # Like InventoryCache, a row read before an invalidation arrived is never stored after it.
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> (user, expiry)
+        self.generation = 0
+        self.listening = False
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidations': 0}
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id) if self.listening else None
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._users[user_id]
+                self._stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._users.move_to_end(user_id)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def put(self, user, generation):
+        with self._lock:
+            if generation != self.generation or not self.listening:
+                return
+            self._users[user['user_id']] = (user, time.monotonic() + self.ttl)
+            self._users.move_to_end(user['user_id'])
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_ids=None):
+        # None drops everything, e.g. after the listener lost its connection
+        with self._lock:
+            self.generation += 1
+            self._stats['invalidations'] += 1
+            if user_ids is None:
+                self._users.clear()
+                return
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'size': len(self._users), 'max_size': self.max_size, 'ttl': self.ttl,
+                          'listening': self.listening})
+            return stats